@@ -2,8 +2,9 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
+from app.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def create_app(config_class=Config):
     """Application factory"""
@@ -18,15 +19,40 @@ def create_app(config_class=Config):
     # Initialize extensions
     db.init_app(app)
     
+    from app import database
+    database.init_app(app, db)
+    
+    from app import instrumentation
+    instrumentation.init_app(app)
+    
+    from app.jobs import export_jobs
+    export_jobs.init_app(app)
+    
     # Initialize directories
     config_class.init_app(app)
     
     # Register blueprints
+    from app import blobs, facets, fts, taxonomy
     from app.routes import main
     app.register_blueprint(main)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    from app import commands
+    commands.init_app(app)
+    
+    # Schema changes run from `flask init-db`; in-memory databases start empty
+    from app import schema
+    if schema.migrates_on_boot(app):
+        with app.app_context():
+            schema.migrate()
     
     return app
+
+def preload():
+    """
+    Import the modules the app otherwise loads on first use
+
+    A server that forks workers from a preloaded app (see gunicorn.conf.py)
+    calls this first, so the workers share these modules instead of each
+    importing its own copy.
+    """
+    from app import ppt_export, similarity
@@ -0,0 +1,162 @@
+"""
+Content-addressed storage for attachment files
+
+Each distinct file is stored once, at ATTACHMENTS_FOLDER/<aa>/<sha256>,
+and has a StoredFile row counting the attachments that use it. Uploads
+are streamed to a temporary file while being hashed, then moved into
+place in the transaction that references them. Deleting an attachment
+only decrements its count; `collect_garbage` removes unreferenced files
+afterwards.
+
+Moving a file into place and removing an unreferenced one both happen
+while the database write lock is held, so an upload of some content can't
+interleave with the removal of the same content.
+"""
+import hashlib
+import os
+import tempfile
+from sqlalchemy import event
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from app import db
+from app.models import Attachment, StoredFile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TooLarge(Exception):
+    """The upload exceeded ATTACHMENT_MAX_BYTES"""
+
+
+def root():
+    return current_app.config['ATTACHMENTS_FOLDER']
+
+
+def path_for(digest):
+    """Where the content with this SHA-256 is stored"""
+    return os.path.join(root(), digest[:2], digest)
+
+
+class PendingFile:
+    """An upload written to a temporary file, not yet in the store"""
+
+    def __init__(self, temp_path, digest, size):
+        self.temp_path = temp_path
+        self.digest = digest
+        self.size = size
+        self.created = None
+
+    def commit(self):
+        """Move the content to its final path; call once its StoredFile row is written"""
+        path = path_for(self.digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Replacing an existing copy is harmless: the content is identical
+        self.created = None if os.path.exists(path) else path
+        os.replace(self.temp_path, path)
+        return path
+
+    def discard(self):
+        """
+        Remove the upload, including a stored file commit created for it
+
+        Call before rolling back the transaction: until then no other
+        upload can have taken a reference to the stored file.
+        """
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        if self.created is not None:
+            try:
+                os.remove(self.created)
+            except FileNotFoundError:
+                pass
+            self.created = None
+
+
+def receive(stream, max_bytes=None):
+    """
+    Copy a binary stream to a temporary file in chunks, hashing it on the way
+
+    Returns a PendingFile; raises TooLarge once more than max_bytes arrive.
+    """
+    folder = os.path.join(root(), 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise TooLarge()
+                sha256.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return PendingFile(temp_path, sha256.hexdigest(), size)
+
+
+def _adjust(connection, digest, delta, size=None):
+    table = StoredFile.__table__
+    updated = connection.execute(
+        table.update().where(table.c.sha256 == digest).values(ref_count=table.c.ref_count + delta)
+    )
+    if not updated.rowcount and delta > 0:
+        connection.execute(table.insert().values(sha256=digest, size=size, ref_count=delta))
+
+
+def attach(case_study, pending, original_filename):
+    """
+    Add an attachment with uploaded content to the session
+
+    Takes a reference to the stored file and moves the content into place
+    in the current transaction; the caller commits.
+    """
+    _adjust(db.session.connection(), pending.digest, 1, pending.size)
+    path = pending.commit()
+    attachment = Attachment(
+        case_study=case_study,
+        filename=pending.digest,
+        original_filename=original_filename,
+        file_path=path,
+        file_type=os.path.splitext(original_filename)[1].lstrip('.').lower() or None
+    )
+    db.session.add(attachment)
+    return attachment
+
+
+@event.listens_for(Session, 'before_flush')
+def _release_deleted(session, flush_context, instances):
+    """Drop the references of deleted attachments, including those of deleted case studies"""
+    deltas = {}
+    for obj in session.deleted:
+        if isinstance(obj, Attachment):
+            deltas[obj.filename] = deltas.get(obj.filename, 0) - 1
+    if deltas:
+        connection = session.connection()
+        for digest, delta in sorted(deltas.items()):
+            _adjust(connection, digest, delta)
+
+
+def collect_garbage():
+    """
+    Remove stored files no attachment uses any more, and commit
+
+    Returns the number of files removed.
+    """
+    connection = db.session.connection()
+    table = StoredFile.__table__
+    digests = connection.execute(
+        table.delete().where(table.c.ref_count <= 0).returning(table.c.sha256)
+    ).scalars().all()
+    for digest in digests:
+        try:
+            os.remove(path_for(digest))
+        except FileNotFoundError:
+            pass
+    db.session.commit()
+    return len(digests)
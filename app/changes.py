@@ -0,0 +1,44 @@
+from sqlalchemy import event
+from flask_sqlalchemy.session import Session
+from app import db
+from app.models import Attachment, CaseStudy, ChangeCounter, PPTTemplate
+
+# Counter names and the models whose writes bump them
+CASE_STUDIES = 'case_studies'
+TEMPLATES = 'templates'
+_COUNTERS = {CaseStudy: CASE_STUDIES, Attachment: CASE_STUDIES, PPTTemplate: TEMPLATES}
+
+
+def bump(connection, name):
+    """
+    Increment a change counter in the caller's transaction
+
+    Flushes of the models above bump their counter automatically; bulk
+    writes that bypass the ORM must call this themselves.
+    """
+    table = ChangeCounter.__table__
+    updated = connection.execute(
+        table.update().where(table.c.name == name).values(version=table.c.version + 1)
+    )
+    if not updated.rowcount:
+        connection.execute(table.insert().values(name=name, version=1))
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_changed(session, flush_context, instances):
+    names = set()
+    for obj in list(session.new) + list(session.deleted):
+        names.add(_COUNTERS.get(type(obj)))
+    for obj in session.dirty:
+        if type(obj) in _COUNTERS and session.is_modified(obj):
+            names.add(_COUNTERS[type(obj)])
+    names.discard(None)
+    if names:
+        connection = session.connection()
+        for name in sorted(names):
+            bump(connection, name)
+
+
+def version(name):
+    """Current value of a change counter"""
+    return db.session.query(ChangeCounter.version).filter_by(name=name).scalar() or 0
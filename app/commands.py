@@ -0,0 +1,151 @@
+import json
+import os
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db, facets, importer, library_export, schema, taxonomy
+from app.models import CaseStudy, PPTTemplate, TemplateInventory
+from app.search import SearchService
+
+
+def init_app(app):
+    """Register the maintenance commands with the flask CLI"""
+    app.cli.add_command(init_db)
+    app.cli.add_command(rebuild_facets)
+    app.cli.add_command(backfill_taxonomy)
+    app.cli.add_command(import_case_studies)
+    app.cli.add_command(export_case_studies)
+    app.cli.add_command(inspect_templates)
+    app.cli.add_command(build_similarity_index)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create or upgrade the database schema, and build the similarity index if missing"""
+    schema.migrate()
+    tables = len(db.metadata.sorted_tables)
+    search = 'enabled' if current_app.extensions['fts5'] else 'unavailable (SQLite without FTS5)'
+    click.echo(f'Database up to date: {tables} tables, full-text search {search}')
+    _build_similarity_index_if_stale()
+
+
+@click.command('rebuild-facets')
+@with_appcontext
+def rebuild_facets():
+    """Recount the facet and stats counters from the case studies"""
+    counts = facets.rebuild()
+    dimensions = {dimension for dimension, _ in counts}
+    click.echo(f'Rebuilt {len(counts)} counters over {len(dimensions)} dimensions '
+               f'for {counts.get(("total", ""), 0)} case studies')
+
+
+@click.command('backfill-taxonomy')
+@with_appcontext
+def backfill_taxonomy():
+    """Relink every case study to its technologies and tags, then recount facets"""
+    counts = taxonomy.backfill()
+    for kind in taxonomy.KINDS:
+        items = sum(1 for dimension, _ in counts if dimension == kind.dimension)
+        click.echo(f'{items} distinct {kind.attribute}')
+
+
+@click.command('import-case-studies')
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', 'format', type=click.Choice(importer.FORMATS),
+              help='Input format; by default taken from the file extension')
+@click.option('--batch-size', type=click.IntRange(min=1), help='Rows inserted per transaction')
+@with_appcontext
+def import_case_studies(file, format, batch_size):
+    """Bulk import case studies from a JSON Lines or CSV file ('-' for stdin)"""
+    format = format or importer.detect_format(file.name)
+    if format is None:
+        raise click.UsageError('Cannot tell the format from the file name, pass --format')
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 500)
+    report = importer.import_stream(file, format, batch_size)
+    for error in report.errors:
+        click.echo(f"line {error['line']}: {'; '.join(error['errors'])}", err=True)
+    click.echo(f'Imported {report.imported} case studies, {report.failed} failed')
+    if report.imported:
+        _build_similarity_index_if_stale(report.imported)
+    if report.failed:
+        raise click.exceptions.Exit(1)
+
+
+@click.command('export-case-studies')
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--format', 'format', type=click.Choice(library_export.FORMATS), default='ndjson')
+@click.option('--fields', help='Comma-separated subset of the case study fields')
+@click.option('--query', 'query', help='Text search query')
+@click.option('--industry')
+@click.option('--year', type=int)
+@click.option('--technologies', help='Comma-separated technology names')
+@click.option('--tags', help='Comma-separated tag names')
+@click.option('--any-technology', is_flag=True, help='Match any of the technologies instead of all')
+@click.option('--any-tag', is_flag=True, help='Match any of the tags instead of all')
+@click.option('--confidential/--public', default=None, help='Only confidential or only public case studies')
+@click.option('--chunk-size', type=click.IntRange(min=1), help='Rows fetched from the database at a time')
+@with_appcontext
+def export_case_studies(output, format, fields, query, industry, year, technologies, tags,
+                        any_technology, any_tag, confidential, chunk_size):
+    """Stream case studies as NDJSON or CSV to OUTPUT (stdout by default)"""
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in CaseStudy.FIELDS]
+        if unknown:
+            raise click.BadParameter(f"Unknown fields: {', '.join(unknown)}", param_hint='--fields')
+    results, _ = SearchService.build_query(
+        query=query, industry=industry, year=year, technologies=technologies, tags=tags,
+        confidential=confidential,
+        technologies_match='any' if any_technology else 'all',
+        tags_match='any' if any_tag else 'all',
+        sort_by='relevance' if query else 'updated_at'
+    )
+    chunk_size = chunk_size or current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+    for chunk in library_export.iter_export(results, format, fields or None, chunk_size):
+        output.write(chunk)
+
+
+@click.command('inspect-templates')
+@click.option('--all', 'everything', is_flag=True, help='Inspect templates that already have an inventory too')
+@with_appcontext
+def inspect_templates(everything):
+    """Take the placeholder inventory of templates uploaded before inventories existed"""
+    from app.ppt_export import inspect_template
+    for template in PPTTemplate.query.order_by(PPTTemplate.id):
+        if template.inventory is not None and not everything:
+            continue
+        if not os.path.exists(template.file_path):
+            click.echo(f'{template.name}: file {template.file_path} is missing', err=True)
+            continue
+        inventory = inspect_template(template.file_path)
+        if template.inventory is None:
+            template.inventory = TemplateInventory()
+        template.inventory.size = inventory['size']
+        template.inventory.slide_count = inventory['slide_count']
+        template.inventory.data = json.dumps(inventory)
+        db.session.commit()
+        click.echo(f'{template.name}: {inventory["slide_count"]} slides, '
+                   f'{sum(inventory["placeholders"].values())} placeholders')
+        for problem in inventory['errors'] + inventory['warnings']:
+            click.echo(f'  {problem}')
+
+
+def _build_similarity_index_if_stale(changed=0):
+    # Requests don't build the index, so have one ready before they come
+    from app.similarity import SimilarityIndex
+    index = SimilarityIndex.from_config().build_if_stale(changed)
+    if index is not None:
+        click.echo(f'Similarity index built: {index.size} case studies')
+
+
+@click.command('build-similarity-index')
+@with_appcontext
+def build_similarity_index():
+    """Build the TF-IDF index of similar case studies from scratch"""
+    from app.similarity import SimilarityIndex
+    index = SimilarityIndex.from_config().rebuild()
+    if index is None:
+        click.echo('Another process built the index meanwhile')
+        return
+    click.echo(f'Indexed {index.size} case studies with {len(index.terms)} terms ({index.version})')
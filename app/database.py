@@ -0,0 +1,110 @@
+"""
+SQLite engine setup for several worker processes sharing one database file
+
+Every connection gets WAL journaling and the pragmas in SQLITE_PRAGMAS, so
+readers no longer wait for writers. With DATABASE_READ_WRITE_SPLIT, a
+second engine serves reads: sessions use it until they write, and from
+then on (to read their own writes) the primary engine, whose transactions
+start with BEGIN IMMEDIATE. Taking the write lock up front means a writer
+waits for the busy timeout instead of failing with "database is locked"
+when its deferred read transaction can't be upgraded. In-memory databases
+are left alone.
+"""
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,  # ms
+    'cache_size': -64000,  # KiB, i.e. 64 MB per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class RoutingSession(Session):
+    """Session sending reads to the read engine until it first writes"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._writes(mapper, clause):
+            reader = _reader()
+            if reader is not None:
+                return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _writes(self, mapper, clause):
+        if self.info.get('wrote'):
+            return True
+        # Flushes, DML, raw SQL and bare connection() calls (used for Core
+        # writes) go to the primary engine
+        if self._flushing or isinstance(clause, (UpdateBase, TextClause)) or (mapper is None and clause is None):
+            self.info['wrote'] = True
+            return True
+        return False
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+
+def _reader():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('database_reader')
+
+
+def is_file_database(engine):
+    """Whether the engine is a SQLite database on disk"""
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:') \
+        and not engine.url.database.startswith('file::memory:')
+
+
+def _configure(engine, pragmas, begin):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy's begin event, not pysqlite, open transactions
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        connection.exec_driver_sql(begin)
+
+
+def init_app(app, db):
+    """Configure the app's engine, and create the read engine if enabled"""
+    with app.app_context():
+        engine = db.engine
+    if not is_file_database(engine):
+        return
+
+    pragmas = dict(DEFAULT_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {}))
+    split = app.config.get('DATABASE_READ_WRITE_SPLIT', True)
+    # Without a read engine, reads share the primary and must not lock it
+    _configure(engine, pragmas, 'BEGIN IMMEDIATE' if split else 'BEGIN')
+
+    if split:
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        options.update(app.config.get('DATABASE_READER_ENGINE_OPTIONS', {}))
+        reader = create_engine(engine.url, **options)
+        _configure(reader, pragmas, 'BEGIN')
+        app.extensions['database_reader'] = reader
+
+
+def after_fork(app):
+    """Drop the pooled connections a forked worker inherited, without closing them on the parent"""
+    with app.app_context():
+        engines = list(app.extensions['sqlalchemy'].engines.values())
+    if 'database_reader' in app.extensions:
+        engines.append(app.extensions['database_reader'])
+    for engine in engines:
+        engine.dispose(close=False)
@@ -0,0 +1,109 @@
+import glob
+import hashlib
+import os
+import shutil
+import uuid
+from flask import current_app
+
+
+class ExportCache:
+    """
+    Disk cache of rendered decks, keyed by everything that goes into them
+
+    A deck depends on the case study (id and updated_at), the template (id
+    and file hash) and the export date placeholder. Entries are named
+    cs<id>_t<template id>_<digest>.pptx, so all entries of a case study or
+    template can be dropped when it changes, and the folder is kept under
+    a byte budget by evicting least recently used entries.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Cache configured for the current app, or None if disabled"""
+        config = config or current_app.config
+        if not config.get('EXPORT_CACHE_ENABLED', True):
+            return None
+        folder = config.get('EXPORT_CACHE_FOLDER') or os.path.join(config['UPLOAD_FOLDER'], 'export_cache')
+        return cls(folder, config.get('EXPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+    @staticmethod
+    def digest(case_study, template_id, template_sha256, export_date):
+        """Content address of a deck"""
+        updated_at = case_study.updated_at.isoformat() if case_study.updated_at else ''
+        key = '\0'.join([str(case_study.id), updated_at, str(template_id), template_sha256, export_date])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def path(self, case_study_id, template_id, digest):
+        return os.path.join(self.folder, f'cs{case_study_id}_t{template_id}_{digest}.pptx')
+
+    def get(self, case_study_id, template_id, digest):
+        """Path of a cached deck, or None; marks the entry as recently used"""
+        path = self.path(case_study_id, template_id, digest)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, case_study_id, template_id, digest, source):
+        """
+        Store a rendered deck and return its path
+
+        Args:
+            source: Binary file object holding the deck; it is read from
+                the start and rewound afterwards
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(case_study_id, template_id, digest)
+        tmp_path = os.path.join(self.folder, f'.{uuid.uuid4().hex}.tmp')
+        try:
+            source.seek(0)
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(source, f)
+            os.replace(tmp_path, path)
+        finally:
+            source.seek(0)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits its budget"""
+        entries = []
+        for path in glob.glob(os.path.join(self.folder, 'cs*.pptx')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    def invalidate_case_study(self, case_study_id):
+        """Drop every cached deck of a case study"""
+        for path in glob.glob(os.path.join(self.folder, f'cs{case_study_id}_t*.pptx')):
+            self._remove(path)
+
+    def invalidate_template(self, template_id):
+        """Drop every cached deck rendered with a template"""
+        for path in glob.glob(os.path.join(self.folder, f'cs*_t{template_id}_*.pptx')):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
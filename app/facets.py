@@ -0,0 +1,183 @@
+from collections import Counter
+from sqlalchemy import event, func, inspect, select
+from flask_sqlalchemy.session import Session
+from app import changes, db
+from app.models import CaseStudy, FacetCount
+
+# Case study attributes counted here; technology and tag counters are
+# updated by app.taxonomy as it links case studies to their items
+FACET_ATTRIBUTES = ('industry', 'project_year', 'client_name')
+
+# Dimensions with names to complete, as accepted by suggest
+SUGGEST_DIMENSIONS = ('client', 'industry', 'technology', 'tag')
+
+_TOTAL = ('total', '')
+
+# Sorts after every character, so prefix + _HIGHEST bounds the names with that prefix
+_HIGHEST = '\U0010ffff'
+
+
+def facet_values(industry, project_year, client_name=None):
+    """(dimension, value) pairs a case study with these attributes counts towards"""
+    values = [_TOTAL]
+    if industry:
+        values.append(('industry', industry))
+    if project_year is not None:
+        values.append(('year', str(project_year)))
+    if client_name:
+        values.append(('client', client_name))
+    return values
+
+
+def _values_of(case_study):
+    return facet_values(*(getattr(case_study, attr) for attr in FACET_ATTRIBUTES))
+
+
+def apply_deltas(connection, deltas):
+    """
+    Add signed counts to the facet counters
+
+    Runs on the caller's connection, so the counters change in the same
+    transaction as the case studies. Bulk writes that bypass the ORM
+    (query.update/delete, Core inserts) must call this themselves.
+
+    Args:
+        connection: Connection of the current transaction
+        deltas: Mapping of (dimension, value) to a count difference
+    """
+    table = FacetCount.__table__
+    changed = False
+    for (dimension, value), delta in deltas.items():
+        if not delta:
+            continue
+        changed = True
+        key = (table.c.dimension == dimension) & (table.c.value == value)
+        updated = connection.execute(table.update().where(key).values(count=table.c.count + delta))
+        if not updated.rowcount and delta > 0:
+            connection.execute(table.insert().values(dimension=dimension, value=value, count=delta))
+    if changed:
+        connection.execute(table.delete().where(table.c.count <= 0))
+
+
+@event.listens_for(Session, 'before_flush')
+def _count_changes(session, flush_context, instances):
+    """Turn pending case study inserts, updates and deletes into counter deltas"""
+    new = [obj for obj in session.new if isinstance(obj, CaseStudy)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, CaseStudy)]
+    changed = [
+        obj for obj in session.dirty
+        if isinstance(obj, CaseStudy) and obj not in session.deleted
+        and any(inspect(obj).attrs[attr].history.has_changes() for attr in FACET_ATTRIBUTES)
+    ]
+    if not (new or deleted or changed):
+        return
+
+    deltas = Counter()
+    for obj in new:
+        deltas.update(_values_of(obj))
+
+    # Old values come from the database rather than attribute history,
+    # which is empty when an unloaded attribute was simply overwritten
+    old_ids = [obj.id for obj in deleted + changed if obj.id is not None]
+    connection = session.connection()
+    if old_ids:
+        columns = [CaseStudy.__table__.c[attr] for attr in FACET_ATTRIBUTES]
+        for row in connection.execute(select(*columns).where(CaseStudy.__table__.c.id.in_(old_ids))):
+            deltas.subtract(facet_values(*row))
+    for obj in changed:
+        deltas.update(_values_of(obj))
+
+    apply_deltas(connection, deltas)
+
+
+def rebuild():
+    """Recount every facet from the case studies and link tables and commit"""
+    from app import taxonomy
+
+    counts = Counter()
+    rows = db.session.execute(
+        select(*(getattr(CaseStudy, attr) for attr in FACET_ATTRIBUTES)).execution_options(yield_per=1000)
+    )
+    for row in rows:
+        counts.update(facet_values(*row))
+    for kind in taxonomy.KINDS:
+        for name, count in taxonomy.item_counts(kind):
+            counts[(kind.dimension, name)] += count
+
+    db.session.execute(FacetCount.__table__.delete())
+    if counts:
+        db.session.execute(FacetCount.__table__.insert(), [
+            {'dimension': dimension, 'value': value, 'count': count}
+            for (dimension, value), count in counts.items()
+        ])
+    changes.bump(db.session.connection(), changes.CASE_STUDIES)
+    db.session.commit()
+    return counts
+
+
+def _has(dimension):
+    return db.session.query(FacetCount.count).filter_by(dimension=dimension).first() is not None
+
+
+def ensure_counts():
+    """Build the counters of a database that has case studies but none yet, or none per client"""
+    if not (_has('total') and _has('client')) and db.session.query(CaseStudy.id).first() is not None:
+        rebuild()
+
+
+def _counts(dimension):
+    return db.session.query(FacetCount.value, FacetCount.count).filter_by(dimension=dimension).all()
+
+
+def _by_count(rows):
+    return sorted(rows, key=lambda row: (-row[1], row[0].lower()))
+
+
+def industry_counts():
+    """(industry, count) pairs in name order"""
+    return sorted(_counts('industry'))
+
+
+def get_facets():
+    """Facet values and their case study counts, read from the counters"""
+    industries = industry_counts()
+    years = sorted(((int(year), count) for year, count in _counts('year')), reverse=True)
+    return {
+        'industries': [{'name': name, 'count': count} for name, count in industries],
+        'years': [{'year': year, 'count': count} for year, count in years],
+        'technologies': [{'name': name, 'count': count} for name, count in _by_count(_counts('technology'))],
+        'tags': [{'name': name, 'count': count} for name, count in _by_count(_counts('tag'))]
+    }
+
+
+def sql_lower(text):
+    """Lowercase text as SQLite's lower() does, which only folds ASCII letters"""
+    return ''.join(c.lower() if c.isascii() else c for c in text)
+
+
+def suggest(prefix, dimensions=SUGGEST_DIMENSIONS, limit=10):
+    """
+    Names starting with prefix (ignoring case), most used first
+
+    Each dimension is a range scan of the facet_counts index, so the cost
+    depends on the number of names with the prefix, not of case studies.
+
+    Returns up to `limit` (dimension, name, count) tuples.
+    """
+    start = sql_lower(prefix.strip())
+    table = FacetCount.__table__
+    value = func.lower(table.c.value)
+    suggestions = []
+    for dimension in dimensions:
+        query = select(table.c.dimension, table.c.value, table.c.count).where(table.c.dimension == dimension)
+        if start:
+            query = query.where(value >= start, value < start + _HIGHEST)
+        query = query.order_by(table.c.count.desc(), value).limit(limit)
+        suggestions.extend(db.session.execute(query).all())
+    return sorted(suggestions, key=lambda row: (-row[2], row[1].lower(), row[0]))[:limit]
+
+
+def get_total():
+    """Number of case studies"""
+    total = db.session.query(FacetCount.count).filter_by(dimension='total').scalar()
+    return total or 0
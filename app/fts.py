@@ -0,0 +1,159 @@
+import re
+from flask import current_app
+from sqlalchemy import Float, Integer, column, text
+from sqlalchemy.exc import OperationalError
+from app import db
+
+# Name of the FTS5 virtual table mirroring case_studies
+FTS_TABLE = 'case_studies_fts'
+
+# Indexed columns, in index order (the bm25 weights below follow this order)
+FTS_COLUMNS = (
+    'project_name',
+    'client_name',
+    'challenge',
+    'solution',
+    'outcomes',
+    'technologies',
+    'tags',
+)
+
+# Relative column weights for bm25 ranking: a hit in the project or client
+# name is worth more than the same word buried in the long text fields.
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 1.0, 1.0, 3.0, 3.0)
+
+# Prefix lengths with their own index, so that the short prefixes of a word
+# being typed don't have to merge the entries of every term they start
+FTS_PREFIXES = '1 2 3 4'
+
+_PHRASE_OR_WORD = re.compile(r'"([^"]*)"|(\w+)', re.UNICODE)
+
+
+def _column_list(prefix=''):
+    return ', '.join(f'{prefix}{col}' for col in FTS_COLUMNS)
+
+
+def _ddl():
+    """DDL for the virtual table and the triggers keeping it in sync"""
+    cols = _column_list()
+    new_cols = _column_list('new.')
+    old_cols = _column_list('old.')
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                {cols},
+                content='case_studies',
+                content_rowid='id',
+                prefix='{FTS_PREFIXES}',
+                tokenize='unicode61 remove_diacritics 2'
+            )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON case_studies BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON case_studies BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END""",
+        # Only re-index when an indexed column changes, not on every updated_at bump
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {cols} ON case_studies BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END""",
+    ]
+
+
+def fts5_available(connection):
+    """Check whether the connected database supports FTS5"""
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    try:
+        connection.exec_driver_sql('CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)')
+        connection.exec_driver_sql('DROP TABLE temp._fts5_probe')
+    except OperationalError:
+        return False
+    return True
+
+
+def _index_sql(connection):
+    return connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).scalar()
+
+
+def init_fts(engine):
+    """
+    Create the FTS5 index and its sync triggers if the database supports it
+
+    Existing rows are indexed the first time the virtual table is created,
+    and again when FTS_PREFIXES changes.
+    Returns True if full-text search is available.
+    """
+    with engine.begin() as connection:
+        if not fts5_available(connection):
+            return False
+
+        created = _index_sql(connection)
+        # An index created without the current prefix indexes is built again
+        if created is not None and f"prefix='{FTS_PREFIXES}'" not in created:
+            connection.exec_driver_sql(f'DROP TABLE {FTS_TABLE}')
+            created = None
+        exists = created is not None
+
+        for statement in _ddl():
+            connection.exec_driver_sql(statement)
+
+        if not exists:
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    return True
+
+
+def is_enabled():
+    """Whether the current app has a usable FTS5 index, looked up once per process"""
+    enabled = current_app.extensions.get('fts5')
+    if enabled is None:
+        # Not migrated by this process; use the index `flask init-db` created
+        with db.engine.connect() as connection:
+            enabled = connection.dialect.name == 'sqlite' and _index_sql(connection) is not None
+        current_app.extensions['fts5'] = enabled
+    return enabled
+
+
+def build_match_query(query):
+    """
+    Translate a user search string into an FTS5 MATCH expression
+
+    Quoted text becomes a phrase query, every other word becomes a prefix
+    query so partially typed words still match. All terms must match.
+    Returns None if the string contains nothing searchable.
+    """
+    terms = []
+    for match in _PHRASE_OR_WORD.finditer(query):
+        phrase, word = match.groups()
+        if phrase is not None:
+            words = re.findall(r'\w+', phrase, re.UNICODE)
+            if words:
+                terms.append('"{}"'.format(' '.join(words)))
+        elif word:
+            terms.append(f'"{word}"*')
+
+    return ' '.join(terms) if terms else None
+
+
+def ranked_matches(match_query, limit=None):
+    """
+    Subquery of (rowid, rank) for documents matching an FTS5 expression
+
+    With a limit only the `limit` newest matches (highest rowids) are
+    ranked: FTS5 reads them in rowid order and stops there, so a short
+    prefix that matches most of the library costs no more than `limit` rows.
+    """
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    sql = (f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank "
+           f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match_query")
+    params = {'match_query': match_query}
+    if limit is not None:
+        sql += " ORDER BY rowid DESC LIMIT :limit"
+        params['limit'] = limit
+    return text(sql).bindparams(**params).columns(
+        column('rowid', Integer), column('rank', Float)
+    ).subquery('fts_matches')
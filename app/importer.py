@@ -0,0 +1,273 @@
+"""
+Bulk import of case studies from JSON Lines or CSV
+
+Records are read one at a time from a stream, validated, and inserted in
+batches: each batch is one multi-row INSERT, and its taxonomy links, facet
+counters and change counter are written in the same transaction (the FTS
+index follows through its triggers). Invalid records are reported by line
+number and skipped; the rest of the file is still imported.
+"""
+import codecs
+import csv
+import json
+from collections import Counter
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+from app import changes, db, facets, taxonomy
+from app.models import CaseStudy
+
+FORMATS = ('jsonl', 'csv')
+
+# Columns a record may set; anything else in a record is ignored
+IMPORT_FIELDS = (
+    'project_name', 'client_name', 'industry', 'project_year',
+    'challenge', 'solution', 'outcomes', 'technologies', 'team_size',
+    'duration_months', 'tags', 'project_value', 'confidential',
+    'created_at', 'updated_at', 'created_by',
+)
+REQUIRED_FIELDS = ('project_name', 'client_name', 'challenge', 'solution', 'outcomes')
+_INTEGER_FIELDS = ('project_year', 'team_size', 'duration_months')
+# SQLite stores integers as signed 64-bit values
+_INTEGER_MIN, _INTEGER_MAX = -2 ** 63, 2 ** 63 - 1
+_DATETIME_FIELDS = ('created_at', 'updated_at')
+_TRUE = {'1', 'true', 'yes', 'y'}
+_FALSE = {'0', 'false', 'no', 'n', ''}
+
+_EXTENSIONS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv'}
+_MIMETYPES = {
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+    'text/csv': 'csv',
+}
+
+
+def detect_format(filename=None, mimetype=None):
+    """'jsonl' or 'csv' from a file name or content type, or None"""
+    if filename:
+        for extension, format in _EXTENSIONS.items():
+            if filename.lower().endswith(extension):
+                return format
+    return _MIMETYPES.get((mimetype or '').lower())
+
+
+# Reported for lines that aren't valid UTF-8
+NOT_UTF8 = 'not valid UTF-8 text, save the file as UTF-8'
+
+
+def _decode_lines(stream, bad_lines):
+    """
+    Lines of a binary stream as text, without a leading byte order mark
+
+    Lines that aren't valid UTF-8 are decoded with replacement characters
+    and their numbers appended to bad_lines.
+    """
+    for number, line in enumerate(stream, start=1):
+        if number == 1 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.append(number)
+            yield line.decode('utf-8', 'replace')
+
+
+def read_records(stream, format):
+    """
+    Yield (line number, record) for each record of a binary stream
+
+    A record that can't be parsed, or isn't valid UTF-8, is yielded as a
+    string describing the problem, so the caller can report it and carry on.
+    """
+    bad_lines = []
+    lines = _decode_lines(stream, bad_lines)
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        if reader.fieldnames is not None and bad_lines:
+            yield 1, f'header {NOT_UTF8}'
+            return
+        last = 1
+        for record in reader:
+            # The reader pulls lines only as needed, so a new bad line
+            # belongs to this record
+            if bad_lines and bad_lines[-1] > last:
+                yield reader.line_num, NOT_UTF8
+            elif None in record:
+                yield reader.line_num, 'more values than header columns'
+            else:
+                yield reader.line_num, record
+            last = reader.line_num
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if bad_lines and bad_lines[-1] == line_number:
+            yield line_number, NOT_UTF8
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, f'invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, 'expected a JSON object'
+            continue
+        yield line_number, record
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def validate(record):
+    """
+    Column values of a record, or the list of problems with it
+
+    Returns (values, errors); values is None when there are errors. Missing
+    and blank fields become NULL, except confidential (False) and the
+    timestamps (now).
+    """
+    values = {}
+    errors = []
+    table = CaseStudy.__table__
+    for field in IMPORT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if _blank(value):
+            if field in REQUIRED_FIELDS:
+                errors.append(f'{field} is required')
+            values[field] = None
+            continue
+
+        if field in _INTEGER_FIELDS:
+            try:
+                if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                    raise ValueError
+                value = int(value)
+            except (TypeError, ValueError, OverflowError):
+                errors.append(f'{field} must be an integer')
+            else:
+                if not _INTEGER_MIN <= value <= _INTEGER_MAX:
+                    errors.append(f'{field} is out of range')
+        elif field == 'confidential':
+            if isinstance(value, str) and value.lower() in _TRUE | _FALSE:
+                value = value.lower() in _TRUE
+            elif not isinstance(value, bool):
+                errors.append('confidential must be true or false')
+        elif field in _DATETIME_FIELDS:
+            try:
+                value = datetime.fromisoformat(str(value))
+            except ValueError:
+                errors.append(f'{field} must be an ISO 8601 date and time')
+        else:
+            value = str(value)
+            length = getattr(table.c[field].type, 'length', None)
+            if length and len(value) > length:
+                errors.append(f'{field} is longer than {length} characters')
+        values[field] = value
+
+    if errors:
+        return None, errors
+    now = datetime.utcnow()
+    values['confidential'] = values['confidential'] or False
+    values['created_at'] = values['created_at'] or now
+    values['updated_at'] = values['updated_at'] or values['created_at']
+    values['created_by'] = values['created_by'] or 'System'
+    return values, []
+
+
+class ImportReport:
+    """Outcome of an import; at most `max_errors` failures are kept in detail"""
+
+    def __init__(self, max_errors=1000):
+        self.imported = 0
+        self.failed = 0
+        self.not_utf8 = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def fail(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def insert_batch(rows):
+    """
+    Insert validated rows and everything derived from them, then commit
+
+    Returns the new case study ids, in the order of rows.
+    """
+    connection = db.session.connection()
+    table = CaseStudy.__table__
+    ids = connection.execute(
+        table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+    deltas = Counter()
+    for row in rows:
+        deltas.update(facets.facet_values(row['industry'], row['project_year'], row['client_name']))
+    for kind in taxonomy.KINDS:
+        deltas.update(taxonomy.link(connection, kind, {
+            id_: row[kind.attribute] for id_, row in zip(ids, rows)
+        }))
+    facets.apply_deltas(connection, deltas)
+    changes.bump(connection, changes.CASE_STUDIES)
+    db.session.commit()
+    return ids
+
+
+def import_records(records, batch_size=500, report=None):
+    """
+    Validate and insert (line number, record) pairs from `read_records`
+
+    Each batch commits on its own, so an error inserting a batch loses only
+    that batch: its lines are reported as failed and the import continues.
+    """
+    report = report or ImportReport()
+    batch = []
+
+    def flush():
+        try:
+            insert_batch([row for _, row in batch])
+        except (SQLAlchemyError, OverflowError, ValueError) as e:
+            db.session.rollback()
+            message = str(getattr(e, 'orig', None) or e)
+            for line, _ in batch:
+                report.fail(line, [message])
+        else:
+            report.imported += len(batch)
+        batch.clear()
+
+    for line, record in records:
+        if isinstance(record, str):
+            report.not_utf8 += record.endswith(NOT_UTF8)
+            report.fail(line, [record])
+            continue
+        values, errors = validate(record)
+        if errors:
+            report.fail(line, errors)
+            continue
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return report
+
+
+def import_stream(stream, format, batch_size=500, max_errors=1000):
+    """Import a JSON Lines or CSV byte stream; returns an ImportReport"""
+    if format not in FORMATS:
+        raise ValueError(f'Unsupported import format: {format}')
+    return import_records(read_records(stream, format), batch_size, ImportReport(max_errors))
@@ -0,0 +1,243 @@
+"""
+Opt-in request instrumentation
+
+Enabled with INSTRUMENTATION_ENABLED. Records, per process:
+
+- request latency per endpoint
+- SQL statement count and time per request (SQLAlchemy cursor events)
+- time spent in named phases (serialization, export template load,
+  substitution and save), via `timed`
+
+and serves them on /metrics in the Prometheus text format. Each response
+also carries a Server-Timing header with its own figures. With
+PROFILE_SLOW_REQUEST_MS set, request threads are sampled and the stacks
+of any slower request are written to PROFILE_FOLDER as folded stacks,
+the input format of flamegraph.pl and speedscope.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds of the latency buckets, in seconds
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name, help, labelnames, buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(counts), total) for labels, (counts, total) in series]
+        for labels, counts, total in series:
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = f'{label_text},' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _active():
+    """The app's Instrumentation if instrumentation is enabled"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('instrumentation')
+
+
+@contextmanager
+def timed(phase):
+    """
+    Time a block as a named phase
+
+    A no-op unless instrumentation is enabled for the current app, so it is
+    safe in code that also runs outside Flask (e.g. export pool workers).
+    """
+    instrumentation = _active()
+    if instrumentation is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        instrumentation.phases.observe(elapsed, phase)
+        if has_request_context() and hasattr(g, '_instrumentation'):
+            phases = g._instrumentation['phases']
+            phases[phase] = phases.get(phase, 0.0) + elapsed
+
+
+class SlowRequestProfiler:
+    """
+    Samples the stacks of threads serving requests
+
+    One daemon thread takes a sample of every registered request thread each
+    interval; stacks are folded ("outer;inner;leaf count") per request.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start_request(self):
+        with self._lock:
+            self._samples[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+
+    def finish_request(self):
+        with self._lock:
+            return self._samples.pop(threading.get_ident(), Counter())
+
+    def _run(self):
+        sampler = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != sampler:
+                        samples[_fold(frame)] += 1
+
+    @staticmethod
+    def write(samples, folder, name):
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{datetime.utcnow():%Y%m%dT%H%M%S%f}_{name}.folded')
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Instrumentation:
+    """Collects the metrics of one app"""
+
+    def __init__(self):
+        self.requests = Histogram(
+            'http_request_duration_seconds', 'Request latency until the response is returned',
+            ('method', 'endpoint', 'status'))
+        self.statements = Histogram(
+            'db_statements_per_request', 'SQL statements executed per request',
+            ('endpoint',), COUNT_BUCKETS)
+        self.sql_time = Histogram(
+            'db_time_per_request_seconds', 'Time spent executing SQL per request', ('endpoint',))
+        self.phases = Histogram(
+            'app_phase_duration_seconds', 'Time spent in serialization and export phases', ('phase',))
+        self.profiler = None
+
+    def init_app(self, app):
+        app.extensions['instrumentation'] = self
+        if not event.contains(Engine, 'after_cursor_execute', _after_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        threshold = app.config.get('PROFILE_SLOW_REQUEST_MS')
+        if threshold:
+            self.profiler = SlowRequestProfiler(app.config.get('PROFILE_INTERVAL_MS', 5) / 1000)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+
+    def _before_request(self):
+        g._instrumentation = {'start': time.perf_counter(), 'statements': 0, 'sql': 0.0, 'phases': {}}
+        if self.profiler is not None:
+            self.profiler.start_request()
+
+    def _after_request(self, response):
+        data = g.pop('_instrumentation', None)
+        if data is None:
+            return response
+        elapsed = time.perf_counter() - data['start']
+        endpoint = request.endpoint or 'unmatched'
+        self.requests.observe(elapsed, request.method, endpoint, str(response.status_code))
+        self.statements.observe(data['statements'], endpoint)
+        self.sql_time.observe(data['sql'], endpoint)
+
+        timings = [f'db;dur={data["sql"] * 1000:.2f};desc="{data["statements"]} statements"']
+        timings += [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in data['phases'].items()]
+        timings.append(f'total;dur={elapsed * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        if self.profiler is not None:
+            samples = self.profiler.finish_request()
+            if samples and elapsed * 1000 >= current_app.config['PROFILE_SLOW_REQUEST_MS']:
+                folder = current_app.config.get('PROFILE_FOLDER') or \
+                    os.path.join(current_app.config['UPLOAD_FOLDER'], 'profiles')
+                SlowRequestProfiler.write(samples, folder, f'{endpoint}_{elapsed * 1000:.0f}ms')
+        return response
+
+    def render(self):
+        lines = []
+        for histogram in (self.requests, self.statements, self.sql_time, self.phases):
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['_instrumentation_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('_instrumentation_start', None)
+    if start is None or not has_request_context():
+        return
+    data = g.get('_instrumentation')
+    if data is not None:
+        data['statements'] += 1
+        data['sql'] += time.perf_counter() - start
+
+
+def init_app(app):
+    """Enable instrumentation for an app if INSTRUMENTATION_ENABLED is set"""
+    if app.config.get('INSTRUMENTATION_ENABLED', False):
+        Instrumentation().init_app(app)
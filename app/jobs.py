@@ -0,0 +1,359 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import CaseStudy, ExportJob, PPTTemplate
+
+logger = logging.getLogger(__name__)
+
+
+def render_export(template_path, case_studies, output_path, as_zip, persist_compiled, known_locations=None):
+    """
+    Render an export job; runs in a pool process without database access
+
+    Args:
+        template_path: Path to the .pptx template
+        case_studies: Dictionaries with the fields the exporter reads
+        output_path: Where to write the .pptx or .zip
+        as_zip: One deck per case study in a zip instead of a merged deck
+        persist_compiled: Passed on to PPTExporter
+        known_locations: Passed on to PPTExporter
+    """
+    from app.ppt_export import PPTExporter
+    exporter = PPTExporter(template_path, persist_compiled=persist_compiled, known_locations=known_locations)
+    case_studies = [SimpleNamespace(**cs) for cs in case_studies]
+
+    if len(case_studies) == 1 and not as_zip:
+        exporter.export_case_study(case_studies[0], output_path)
+    else:
+        with open(output_path, 'wb') as output:
+            for _ in exporter.iter_export_batch(case_studies, output, as_zip=as_zip):
+                pass
+    return output_path
+
+
+class ExportJobQueue:
+    """
+    Runs PowerPoint exports in a bounded process pool
+
+    The export_jobs table is the queue: submitting inserts a queued row,
+    and every app process claims queued rows while its pool has free
+    slots. Claims carry a lease, which the claiming process renews while
+    it renders; a running job whose lease expired (its process died or was
+    restarted) is queued again, so jobs survive restarts. Each claim
+    renders to its own file and only the current claim may finish the
+    job, so a run that lost its lease can't overwrite the one that took
+    over. Finished artifacts are deleted once EXPORT_JOB_TTL passes.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._leases = {}  # job id: claim, for the jobs this process renders
+        self._heartbeat = None
+        self._completions = queue.SimpleQueue()
+        self._completer = None
+        self._full = False  # dispatch last stopped for want of a slot
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register with an app"""
+        app.extensions['export_jobs'] = self
+
+    @property
+    def max_workers(self):
+        return current_app.config.get('EXPORT_JOB_WORKERS', 2)
+
+    @property
+    def folder(self):
+        return current_app.config.get('EXPORT_JOB_FOLDER') or \
+            os.path.join(current_app.config['UPLOAD_FOLDER'], 'exports')
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers don't inherit the parent's database connections
+                context = multiprocessing.get_context(current_app.config.get('EXPORT_JOB_START_METHOD', 'spawn'))
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            return self._executor
+
+    def _submit(self, fn, *args):
+        """
+        Submit to the pool, replacing it if a worker process died
+
+        A pool whose process died, say killed for running out of memory,
+        fails everything submitted to it from then on.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            return self._get_executor().submit(fn, *args)
+
+    def run(self, fn, *args, timeout=None):
+        """
+        Run a picklable function in the pool and wait for its result
+
+        For CPU-heavy work such as parsing an uploaded template, so it
+        doesn't hold this process's GIL; it shares the pool with exports.
+        The call takes one of the pool's slots until it completes, also when
+        the wait times out, so jobs aren't claimed for a slot that's busy.
+        """
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        app = current_app._get_current_object()
+        future.add_done_callback(lambda f: self._complete(app))
+        return future.result(timeout)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, case_study_ids, template, export_format='pptx'):
+        """Queue an export and start it if a worker is free"""
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            status='queued',
+            export_format=export_format,
+            case_study_ids=json.dumps(case_study_ids),
+            template_id=template.id
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.dispatch()
+        return job
+
+    def dispatch(self):
+        """Claim and start queued jobs while the pool has free slots"""
+        self.cleanup_expired()
+        self._requeue_expired()
+
+        while True:
+            with self._lock:
+                if self._in_flight >= self.max_workers:
+                    # Queued jobs may be waiting for a slot
+                    self._full = True
+                    return
+                self._in_flight += 1
+
+            job = self._claim_next()
+            if job is None:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._full = False
+                return
+
+            try:
+                self._start(job)
+            except Exception as e:
+                with self._lock:
+                    self._in_flight -= 1
+                self._finish(job.id, job.claim, error=str(e))
+
+    def _claim_next(self):
+        """Atomically move one queued job to running"""
+        timeout = current_app.config.get('EXPORT_JOB_TIMEOUT', 600)
+        candidates = db.session.query(ExportJob.id).filter_by(
+            status='queued'
+        ).order_by(ExportJob.created_at).limit(10).all()
+        for job_id, in candidates:
+            now = datetime.utcnow()
+            claimed = ExportJob.query.filter_by(id=job_id, status='queued').update({
+                'status': 'running',
+                'started_at': now,
+                'lease_expires_at': now + timedelta(seconds=timeout),
+                'claim': uuid.uuid4().hex
+            })
+            db.session.commit()
+            if claimed:
+                return db.session.get(ExportJob, job_id)
+        return None
+
+    def _requeue_expired(self):
+        """Queue running jobs again whose process went away"""
+        expired = ExportJob.query.filter(
+            ExportJob.status == 'running',
+            ExportJob.lease_expires_at < datetime.utcnow()
+        )
+        # Look first: an UPDATE takes the write lock even if it matches nothing
+        if expired.with_entities(ExportJob.id).first() is None:
+            return
+        expired.update({'status': 'queued', 'lease_expires_at': None}, synchronize_session=False)
+        db.session.commit()
+
+    def _start(self, job):
+        template = db.session.get(PPTTemplate, job.template_id)
+        if template is None:
+            raise LookupError('Template no longer exists')
+
+        ids = json.loads(job.case_study_ids)
+        by_id = {cs.id: cs for cs in CaseStudy.query.filter(CaseStudy.id.in_(ids))}
+        from app.ppt_export import PPTExporter
+        fields = set(PPTExporter.PLACEHOLDERS.values())
+        snapshots = [{f: getattr(by_id[i], f) for f in fields} for i in ids if i in by_id]
+        if not snapshots:
+            raise LookupError('Case studies no longer exist')
+
+        as_zip = job.export_format == 'zip'
+        if len(snapshots) == 1 and not as_zip:
+            job.download_name = f"{secure_filename(snapshots[0]['project_name']) or 'case_study'}.pptx"
+        else:
+            job.download_name = f'case_studies_{job.id[:8]}.{job.export_format}'
+        os.makedirs(self.folder, exist_ok=True)
+        result_path = os.path.join(self.folder, f'{job.id}-{job.claim[:8]}.{job.export_format}')
+        db.session.commit()
+
+        future = self._submit(
+            render_export, template.file_path, snapshots, result_path, as_zip,
+            current_app.config.get('PPT_PERSIST_COMPILED_TEMPLATES', True),
+            template.inventory.known_locations if template.inventory else None
+        )
+        app = current_app._get_current_object()
+        self._hold(app, job.id, job.claim)
+        future.add_done_callback(
+            lambda f, job_id=job.id, claim=job.claim: self._complete(
+                app, lambda: self._on_done(job_id, claim, result_path, f))
+        )
+
+    def _on_done(self, job_id, claim, result_path, future):
+        """Record the outcome of a job"""
+        error = future.exception()
+        self._finish(job_id, claim, result_path, error=str(error) if error else None)
+
+    def _complete(self, app, fn=None):
+        """
+        Hand a finished pool call to the completion thread
+
+        Called on the pool's result thread, which must not wait for the
+        database: while it does, no other call in this process completes.
+        The completion thread records a job's outcome with fn, frees the
+        call's slot and dispatches queued jobs: always after a job, since
+        other processes may have queued some, and after other calls only
+        if jobs were left waiting for a slot.
+        """
+        with self._lock:
+            self._completions.put((app, fn))
+            if self._completer is None:
+                self._completer = threading.Thread(target=self._run_completions,
+                                                   name='export-job-completions', daemon=True)
+                self._completer.start()
+
+    def _run_completions(self):
+        while True:
+            app, fn = self._completions.get()
+            with app.app_context():
+                if fn is not None:
+                    try:
+                        fn()
+                    except Exception:
+                        logger.exception('Recording an export job result failed')
+                        db.session.rollback()
+                self._release()
+                if fn is not None or self._full:
+                    try:
+                        self.dispatch()
+                    except Exception:
+                        logger.exception('Dispatching export jobs failed')
+                db.session.remove()
+
+    def _finish(self, job_id, claim, result_path=None, error=None):
+        """Record the outcome of a run, unless the job was claimed again meanwhile"""
+        with self._lock:
+            self._leases.pop(job_id, None)
+        values = {
+            'status': 'failed' if error else 'finished',
+            'error': error,
+            'finished_at': datetime.utcnow(),
+            'lease_expires_at': None
+        }
+        if not error:
+            values['result_path'] = result_path
+        current = ExportJob.query.filter_by(id=job_id, claim=claim, status='running').update(values)
+        db.session.commit()
+        if result_path and (error or not current):
+            try:
+                os.remove(result_path)
+            except OSError:
+                pass
+
+    def _hold(self, app, job_id, claim):
+        """Keep renewing the lease of a job this process renders until it finishes"""
+        with self._lock:
+            self._leases[job_id] = claim
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._keep_leases, args=(app,),
+                                                   name='export-job-leases', daemon=True)
+                self._heartbeat.start()
+
+    def _keep_leases(self, app):
+        with app.app_context():
+            interval = current_app.config.get('EXPORT_JOB_TIMEOUT', 600) / 3
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                if not self._leases:
+                    self._heartbeat = None
+                    return
+            with app.app_context():
+                self.renew_leases()
+                db.session.remove()
+
+    def renew_leases(self):
+        """Extend the leases of the jobs this process is rendering"""
+        with self._lock:
+            leases = dict(self._leases)
+        expires = datetime.utcnow() + timedelta(seconds=current_app.config.get('EXPORT_JOB_TIMEOUT', 600))
+        for job_id, claim in leases.items():
+            ExportJob.query.filter_by(id=job_id, claim=claim, status='running').update(
+                {'lease_expires_at': expires})
+        db.session.commit()
+
+    def cleanup_expired(self):
+        """Delete jobs, and their files, that finished more than EXPORT_JOB_TTL ago"""
+        expired = ExportJob.query.filter(
+            ExportJob.status.in_(('finished', 'failed')),
+            ExportJob.finished_at < self._expiry_cutoff()
+        ).all()
+        for job in expired:
+            if job.result_path:
+                try:
+                    os.remove(job.result_path)
+                except OSError:
+                    pass
+            db.session.delete(job)
+        if expired:
+            db.session.commit()
+
+    def has_expired(self, job):
+        """Whether cleanup_expired would delete a job; for reads, which shouldn't write"""
+        return job.status in ('finished', 'failed') and job.finished_at < self._expiry_cutoff()
+
+    def _expiry_cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=current_app.config.get('EXPORT_JOB_TTL', 3600))
+
+
+
+export_jobs = ExportJobQueue()
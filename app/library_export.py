@@ -0,0 +1,80 @@
+"""
+Streaming export of case studies as NDJSON or CSV
+
+Rows are fetched from the database in chunks (`yield_per`) and each chunk
+is serialized and handed out before the next is read, so memory use
+depends on the chunk size rather than the number of case studies. The
+output can be read back with app.importer.
+"""
+import csv
+import io
+import json
+from app.models import CaseStudy
+from app.serializers import rows_to_dicts
+
+FORMATS = ('ndjson', 'csv')
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# CSV has no room for the attachment lists unless they are asked for
+CSV_FIELDS = tuple(f for f in CaseStudy.FIELDS if f != 'attachments')
+
+
+def iter_chunks(query, fields, chunk_size=1000):
+    """
+    Yield lists of case study dictionaries for an ORM query, chunk by chunk
+
+    Args:
+        query: CaseStudy query (filters and ordering are kept)
+        fields: CaseStudy.FIELDS to include, in output order
+        chunk_size: Rows fetched from the cursor at a time
+    """
+    selected = ['id'] + [f for f in fields if f not in ('id', 'attachments')]
+    rows = query.with_entities(*[getattr(CaseStudy, f) for f in selected]).yield_per(chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield rows_to_dicts(chunk, selected, fields)
+            chunk = []
+    if chunk:
+        yield rows_to_dicts(chunk, selected, fields)
+
+
+def iter_ndjson(query, fields=None, chunk_size=1000):
+    """Yield one JSON object per line, as bytes, a chunk at a time"""
+    fields = list(fields or CaseStudy.FIELDS)
+    for chunk in iter_chunks(query, fields, chunk_size):
+        yield ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in chunk).encode()
+
+
+def iter_csv(query, fields=None, chunk_size=1000):
+    """Yield a header row and then the case studies as CSV, as bytes"""
+    fields = list(fields or CSV_FIELDS)
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(fields)
+    for chunk in iter_chunks(query, fields, chunk_size):
+        for item in chunk:
+            if 'attachments' in item:
+                item['attachments'] = json.dumps(item['attachments'])
+            writer.writerow([item[f] for f in fields])
+        yield _drain(text)
+    remainder = _drain(text)
+    if remainder:
+        yield remainder
+
+
+def _drain(text):
+    data = text.getvalue().encode()
+    text.seek(0)
+    text.truncate()
+    return data
+
+
+def iter_export(query, format, fields=None, chunk_size=1000):
+    """Encoded chunks of the case studies selected by query in an export format"""
+    if format == 'csv':
+        return iter_csv(query, fields, chunk_size)
+    if format == 'ndjson':
+        return iter_ndjson(query, fields, chunk_size)
+    raise ValueError(f'Unsupported export format: {format}')
@@ -0,0 +1,82 @@
+"""
+Compact, streamed search results for search-as-you-type
+
+Results go out as NDJSON in a form small enough to render on every
+keystroke. Each row is an array of FIELDS (challenge cut to a snippet),
+and the rows are sent in this order:
+
+    {"fields": [...], "rows": [[...], ...]}                the top `top` hits
+    {"rows": [[...], ...]}                                  the following hits, a chunk per line
+    {"done": true, "count": 120, "truncated": false}
+
+The top hits are read with a LIMIT, so the first line costs no more than
+one short page. The rest are read from the cursor a chunk at a time while
+the response is written. If the client goes away, for example because it
+aborted the request when the user typed the next character, the server
+closes the generator and stops reading.
+"""
+import json
+from sqlalchemy import func
+from app import db
+from app.models import CaseStudy
+
+FIELDS = ('id', 'project_name', 'client_name', 'industry', 'project_year',
+          'confidential', 'technologies', 'challenge')
+SNIPPET_LENGTH = 160
+MIMETYPE = 'application/x-ndjson'
+
+
+def _columns():
+    return [func.substr(CaseStudy.challenge, 1, SNIPPET_LENGTH) if f == 'challenge'
+            else getattr(CaseStudy, f) for f in FIELDS]
+
+
+def _line(obj):
+    return (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+
+
+def head(query, top):
+    """
+    First line of the stream for an ORM query, and whether more rows follow
+
+    Returns (line bytes, row count, more).
+    """
+    rows = query.with_entities(*_columns()).limit(top + 1).all()
+    more = len(rows) > top
+    rows = [list(row) for row in rows[:top]]
+    return _line({'fields': list(FIELDS), 'rows': rows}), len(rows), more
+
+
+def iter_rest(query, top, max_results, chunk_size=50):
+    """
+    Yield the lines of the stream after the first
+
+    Rows top to max_results are read `chunk_size` at a time. The final
+    line reports the total number of rows sent.
+    """
+    count, truncated = top, False
+    rest = query.with_entities(*_columns()).offset(top).limit(max_results - top + 1)
+    result = db.session.execute(rest.statement, execution_options={'yield_per': chunk_size})
+    try:
+        for partition in result.partitions():
+            rows = [list(row) for row in partition]
+            if count + len(rows) > max_results:
+                rows, truncated = rows[:max_results - count], True
+            if rows:
+                count += len(rows)
+                yield _line({'rows': rows})
+            if truncated:
+                break
+        yield _line({'done': True, 'count': count, 'truncated': truncated})
+    finally:
+        # Also runs when the server closes the generator early
+        result.close()
+
+
+def iter_live(first, count, more, query, max_results, chunk_size=50):
+    """All lines of the stream, given the first line as produced by head"""
+    yield first
+    if more and count < max_results:
+        yield from iter_rest(query, count, max_results, chunk_size)
+    else:
+        yield _line({'done': True, 'count': count, 'truncated': more})
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db
 
@@ -36,28 +37,48 @@ class CaseStudy(db.Model):
     # Relationships
     attachments = db.relationship('Attachment', backref='case_study', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """Convert to dictionary"""
-        return {
-            'id': self.id,
-            'project_name': self.project_name,
-            'client_name': self.client_name,
-            'industry': self.industry,
-            'project_year': self.project_year,
-            'challenge': self.challenge,
-            'solution': self.solution,
-            'outcomes': self.outcomes,
-            'technologies': self.technologies,
-            'team_size': self.team_size,
-            'duration_months': self.duration_months,
-            'tags': self.tags,
-            'project_value': self.project_value,
-            'confidential': self.confidential,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'created_by': self.created_by,
-            'attachments': [att.to_dict() for att in self.attachments]
-        }
+    # Indexes for the search filters and sort orders (see SearchService.build_query).
+    # Secondary indexes end in the rowid, so (x, updated_at) also covers
+    # the id tie-breaker of the default sort.
+    __table_args__ = (
+        db.Index('ix_case_studies_updated_at', 'updated_at'),
+        db.Index('ix_case_studies_created_at', 'created_at'),
+        db.Index('ix_case_studies_project_name', 'project_name'),
+        db.Index('ix_case_studies_client_name', 'client_name'),
+        db.Index('ix_case_studies_industry', 'industry'),
+        db.Index('ix_case_studies_project_year', 'project_year'),
+        db.Index('ix_case_studies_industry_lower_updated_at', db.func.lower(industry), 'updated_at'),
+        db.Index('ix_case_studies_project_year_updated_at', 'project_year', 'updated_at'),
+        db.Index('ix_case_studies_confidential_updated_at', 'confidential', 'updated_at'),
+    )
+    
+    # Fields exposed by to_dict, in output order
+    FIELDS = (
+        'id', 'project_name', 'client_name', 'industry', 'project_year',
+        'challenge', 'solution', 'outcomes', 'technologies', 'team_size',
+        'duration_months', 'tags', 'project_value', 'confidential',
+        'created_at', 'updated_at', 'created_by', 'attachments',
+    )
+    
+    def to_dict(self, fields=None):
+        """
+        Convert to dictionary
+        
+        Args:
+            fields: Optional subset of FIELDS to include. Attributes outside
+                the subset are not touched, so deferred columns and the
+                attachments relationship are not loaded for them.
+        """
+        data = {}
+        for field in fields or self.FIELDS:
+            if field == 'attachments':
+                data[field] = [att.to_dict() for att in self.attachments]
+                continue
+            value = getattr(self, field)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[field] = value
+        return data
     
     def __repr__(self):
         return f'<CaseStudy {self.project_name}>'
@@ -68,10 +89,10 @@ class Attachment(db.Model):
     __tablename__ = 'attachments'
     
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # SHA-256 of the content (see app.blobs)
     original_filename = db.Column(db.String(255), nullable=False)
-    file_path = db.Column(db.String(500), nullable=False)
-    file_type = db.Column(db.String(50))
+    file_path = db.Column(db.String(500), nullable=False)  # Shared by attachments with the same content
+    file_type = db.Column(db.String(50))  # File extension
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     case_study_id = db.Column(db.Integer, db.ForeignKey('case_studies.id'), nullable=False)
@@ -89,6 +110,19 @@ class Attachment(db.Model):
         return f'<Attachment {self.original_filename}>'
 
 
+class StoredFile(db.Model):
+    """Attachment content stored once per SHA-256, with the number of attachments using it"""
+    __tablename__ = 'stored_files'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StoredFile {self.sha256} x{self.ref_count}>'
+
+
 class PPTTemplate(db.Model):
     """PowerPoint Template model"""
     __tablename__ = 'ppt_templates'
@@ -101,6 +135,8 @@ class PPTTemplate(db.Model):
     is_default = db.Column(db.Boolean, default=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    inventory = db.relationship('TemplateInventory', uselist=False, lazy=True, cascade='all, delete-orphan')
+    
     def to_dict(self):
         """Convert to dictionary"""
         return {
@@ -114,3 +150,142 @@ class PPTTemplate(db.Model):
     
     def __repr__(self):
         return f'<PPTTemplate {self.name}>'
+
+
+class TemplateInventory(db.Model):
+    """Placeholders and metrics of a template, taken at upload (see ppt_export.inspect_template)"""
+    __tablename__ = 'template_inventories'
+    
+    template_id = db.Column(db.Integer, db.ForeignKey('ppt_templates.id'), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    slide_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON returned by inspect_template
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def known_locations(self):
+        """Placeholder locations for PPTExporter"""
+        return json.loads(self.data).get('compiled')
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        data = json.loads(self.data)
+        data.pop('compiled', None)
+        data['template_id'] = self.template_id
+        data['created_at'] = self.created_at.isoformat() if self.created_at else None
+        return data
+    
+    def __repr__(self):
+        return f'<TemplateInventory {self.template_id}>'
+
+
+class ExportJob(db.Model):
+    """Background PowerPoint export job"""
+    __tablename__ = 'export_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, finished, failed
+    export_format = db.Column(db.String(10), nullable=False, default='pptx')  # pptx or zip
+    case_study_ids = db.Column(db.Text, nullable=False)  # JSON list
+    template_id = db.Column(db.Integer, nullable=False)
+    
+    # Result
+    result_path = db.Column(db.String(500))
+    download_name = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    
+    # A running job whose lease expired is assumed lost and queued again.
+    # Every claim gets a new token; only the run holding it may finish the job.
+    lease_expires_at = db.Column(db.DateTime)
+    claim = db.Column(db.String(32))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'format': self.export_format,
+            'case_study_count': len(json.loads(self.case_study_ids)),
+            'template_id': self.template_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.status}>'
+
+
+# Links between case studies and the normalized values of their
+# comma-separated technologies and tags columns, kept in sync by app.taxonomy
+case_study_technologies = db.Table(
+    'case_study_technologies',
+    db.Column('case_study_id', db.Integer, db.ForeignKey('case_studies.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('technology_id', db.Integer, db.ForeignKey('technologies.id'), primary_key=True),
+    db.Index('ix_case_study_technologies_technology', 'technology_id', 'case_study_id')
+)
+
+case_study_tags = db.Table(
+    'case_study_tags',
+    db.Column('case_study_id', db.Integer, db.ForeignKey('case_studies.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_case_study_tags_tag', 'tag_id', 'case_study_id')
+)
+
+
+class Technology(db.Model):
+    """Distinct technology named in case studies"""
+    __tablename__ = 'technologies'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # As first written
+    key = db.Column(db.String(100), nullable=False, unique=True)  # Case-folded name for matching
+    
+    def __repr__(self):
+        return f'<Technology {self.name}>'
+
+
+class Tag(db.Model):
+    """Distinct tag used on case studies"""
+    __tablename__ = 'tags'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # As first written
+    key = db.Column(db.String(100), nullable=False, unique=True)  # Case-folded name for matching
+    
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+
+
+class FacetCount(db.Model):
+    """Number of case studies per facet value, maintained by app.facets"""
+    __tablename__ = 'facet_counts'
+    
+    # client, industry, year, technology, tag, or total (with an empty value)
+    dimension = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Prefix lookups for autocompletion (see facets.suggest), answered from the index alone
+    __table_args__ = (
+        db.Index('ix_facet_counts_dimension_lower_value', 'dimension', db.func.lower(value), 'count'),
+    )
+    
+    def __repr__(self):
+        return f'<FacetCount {self.dimension}={self.value}: {self.count}>'
+
+
+class ChangeCounter(db.Model):
+    """Version of a group of tables, bumped on every write to them (see app.changes)"""
+    __tablename__ = 'change_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)  # case_studies or templates
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ChangeCounter {self.name}={self.version}>'
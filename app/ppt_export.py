@@ -1,8 +1,484 @@
+import bisect
+import copy
+import hashlib
+import io
+import json
 import os
+import posixpath
 import re
-from pptx import Presentation
-from pptx.util import Pt
+import threading
+import zipfile
+from collections import Counter, OrderedDict
 from datetime import datetime
+from lxml import etree
+from werkzeug.utils import secure_filename
+from app.instrumentation import timed
+
+# DrawingML paragraph, text run and run text elements
+_A_P = '{http://schemas.openxmlformats.org/drawingml/2006/main}p'
+_A_R = '{http://schemas.openxmlformats.org/drawingml/2006/main}r'
+_A_T = '{http://schemas.openxmlformats.org/drawingml/2006/main}t'
+
+# Package-level namespaces and relationship types
+_P_NS = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+_R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_CT_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+_RT_SLIDE = f'{_R_NS}/slide'
+_CT_SLIDE = 'application/vnd.openxmlformats-officedocument.presentationml.slide+xml'
+
+# Slide parts inside the .pptx package
+_SLIDE_PART = re.compile(r'^ppt/slides/slide\d+\.xml$')
+
+# Parts a merged deck rebuilds or leaves out: slides are written once per
+# case study, and notes/comments belong to a single slide so can't be shared
+_MERGE_REBUILT = re.compile(
+    r'^(\[Content_Types\]\.xml|ppt/presentation\.xml|ppt/_rels/presentation\.xml\.rels'
+    r'|ppt/slides/.*|ppt/notesSlides/.*|ppt/comments/.*)$'
+)
+_MERGE_DROPPED_RELS = (f'{_R_NS}/notesSlide', f'{_R_NS}/comments')
+
+# Characters XML 1.0 can't hold; written as _xHHHH_ like python-pptx does
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def escape_xml_invalid(text):
+    """Replace characters XML can't hold with their _xHHHH_ escape"""
+    return _XML_INVALID.sub(lambda match: f'_x{ord(match.group()):04X}_', text)
+
+
+PPTX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+# Anything written like a placeholder, known or not: {{CLIENT}}, {{ Client }}
+_PLACEHOLDER_LIKE = re.compile(r'\{\{[^{}]*\}\}')
+
+# Version of the on-disk compiled template format
+_COMPILED_FORMAT = 2
+
+
+def placeholder_pattern(placeholders):
+    """Single alternation regex matching any of the placeholders"""
+    return re.compile('|'.join(re.escape(p) for p in placeholders))
+
+
+def substitute_paragraph(paragraph, pattern, replacements):
+    """
+    Replace placeholders in one paragraph in a single pass
+    
+    PowerPoint often splits a typed placeholder over several runs (spell
+    check, autocorrect, partial formatting). Matching runs on the joined
+    paragraph text finds those too; the replacement goes into the run
+    where the placeholder starts, keeping its formatting, and the rest of
+    the placeholder is cut from the following runs. Runs whose text does
+    not change are left untouched.
+    
+    Returns True if the paragraph was modified.
+    """
+    text_elements = [run.find(_A_T) for run in paragraph.iter(_A_R)]
+    texts = [(t.text or '') if t is not None else '' for t in text_elements]
+    joined = ''.join(texts)
+    if '{{' not in joined:
+        return False
+    
+    matches = list(pattern.finditer(joined))
+    if not matches:
+        return False
+    
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text)
+    
+    changed = set()
+    # Work backwards so earlier offsets stay valid
+    for match in reversed(matches):
+        start, end = match.span()
+        first = bisect.bisect_right(starts, start) - 1
+        last = bisect.bisect_right(starts, end - 1) - 1
+        
+        head = texts[first][:start - starts[first]]
+        tail = texts[last][end - starts[last]:]
+        if first == last:
+            texts[first] = head + replacements[match.group(0)] + tail
+        else:
+            texts[first] = head + replacements[match.group(0)]
+            texts[last] = tail
+            for index in range(first + 1, last):
+                texts[index] = ''
+        changed.update(range(first, last + 1))
+    
+    for index in changed:
+        text_elements[index].text = texts[index]
+    return True
+
+
+class CompiledTemplate:
+    """
+    A template reduced to what an export actually needs
+
+    Holds every package part that never changes between exports, already
+    zipped, plus the raw XML of the slides containing placeholders and the
+    exact paragraphs within them that do. Exporting copies the zipped base and
+    appends the patched slides.
+    """
+    
+    def __init__(self, sha256, base_zip, slide_parts, locations):
+        self.sha256 = sha256
+        self.base_zip = base_zip          # bytes: zip of the unchanged parts
+        self.slide_parts = slide_parts    # {part name: (ZipInfo, original XML)}
+        self.locations = locations        # {part name: [(paragraph index, [placeholders])]}
+    
+    @classmethod
+    def build(cls, template_bytes, pattern, locations=None):
+        """
+        Compile a template package
+        
+        Args:
+            template_bytes: Contents of the .pptx file
+            pattern: Regex matching the placeholders (see placeholder_pattern)
+            locations: Previously recorded locations to reuse instead of
+                scanning the slides again
+        """
+        source = zipfile.ZipFile(io.BytesIO(template_bytes))
+        
+        if locations is None:
+            locations = {}
+            for info in source.infolist():
+                if _SLIDE_PART.match(info.filename):
+                    found = cls._scan_slide(source.read(info), pattern)
+                    if found:
+                        locations[info.filename] = found
+        
+        base = io.BytesIO()
+        slide_parts = {}
+        with zipfile.ZipFile(base, 'w') as target:
+            for info in source.infolist():
+                if info.filename in locations:
+                    slide_parts[info.filename] = (info, source.read(info))
+                else:
+                    target.writestr(info, source.read(info))
+        
+        sha256 = hashlib.sha256(template_bytes).hexdigest()
+        return cls(sha256, base.getvalue(), slide_parts, locations)
+    
+    @staticmethod
+    def _scan_slide(xml, pattern):
+        """Record which paragraphs of a slide contain which placeholders"""
+        found = []
+        for index, paragraph in enumerate(etree.fromstring(xml).iter(_A_P)):
+            text = ''.join(t.text or '' for t in paragraph.iter(_A_T))
+            if '{{' not in text:
+                continue
+            present = sorted(set(pattern.findall(text)))
+            if present:
+                found.append((index, present))
+        return found
+    
+    def to_json(self):
+        """Serializable form: the recorded locations and the template hash"""
+        return self.locations_to_json(self.locations, self.sha256)
+    
+    @staticmethod
+    def locations_to_json(locations, sha256):
+        """Serializable form of recorded locations, see locations_from_json"""
+        return {
+            'format': _COMPILED_FORMAT,
+            'sha256': sha256,
+            'locations': {part: [[index, present] for index, present in runs]
+                          for part, runs in locations.items()}
+        }
+    
+    @staticmethod
+    def locations_from_json(data, sha256):
+        """Recorded locations from to_json output, if it matches the template"""
+        if data.get('format') != _COMPILED_FORMAT or data.get('sha256') != sha256:
+            return None
+        return {part: [(index, present) for index, present in runs]
+                for part, runs in data['locations'].items()}
+    
+    def render(self, replacements, output, pattern):
+        """
+        Write a filled-in copy of the template
+        
+        Args:
+            replacements: Dictionary of placeholder to replacement text
+            output: Seekable binary file object to write the .pptx into
+            pattern: Regex matching the placeholders (see placeholder_pattern)
+        """
+        with timed('export_substitute'):
+            slides = [(info, self.render_slide(part, replacements, pattern))
+                      for part, (info, _) in self.slide_parts.items()]
+        with timed('export_save'):
+            output.write(self.base_zip)
+            output.seek(0)
+            with zipfile.ZipFile(output, 'a') as target:
+                for info, xml in slides:
+                    # writestr records offsets and sizes on the ZipInfo, so
+                    # concurrent renders must not share the cached one
+                    target.writestr(copy.copy(info), xml)
+    
+    def render_slide(self, part, replacements, pattern):
+        """Filled-in XML of one slide that contains placeholders"""
+        root = etree.fromstring(self.slide_parts[part][1])
+        paragraphs = list(root.iter(_A_P))
+        for index, _ in self.locations[part]:
+            substitute_paragraph(paragraphs[index], pattern, replacements)
+        return _xml_bytes(root)
+
+
+def _shape_of(paragraph):
+    """(id, name) of the shape or graphic frame holding a paragraph"""
+    for ancestor in paragraph.iterancestors():
+        properties = ancestor.find(f'*/{{{_P_NS}}}cNvPr')
+        if properties is not None:
+            return int(properties.get('id', 0)), properties.get('name', '')
+    return None, ''
+
+
+def inspect_template(path, max_bytes=None, max_slides=None):
+    """
+    Parse a template once and take inventory of its placeholders
+    
+    Needs no app or database, so it can run in a pool worker. Returns a
+    JSON-serializable dict:
+    
+    - size, slide_count
+    - slides: in presentation order, each with its number, part name and
+      the shapes holding placeholders
+    - placeholders: occurrences of each known placeholder
+    - compiled: placeholder locations for PPTExporter(known_locations=...)
+    - errors: problems that make the template unusable
+    - warnings: problems that would show up in every export
+    """
+    size = os.path.getsize(path)
+    inventory = {'size': size, 'slide_count': 0, 'slides': [], 'placeholders': {},
+                 'compiled': None, 'errors': [], 'warnings': []}
+    errors, warnings = inventory['errors'], inventory['warnings']
+    if max_bytes and size > max_bytes:
+        errors.append(f'Template is {size} bytes, more than the {max_bytes} allowed')
+        return inventory
+    
+    with open(path, 'rb') as f:
+        template_bytes = f.read()
+    try:
+        package = zipfile.ZipFile(io.BytesIO(template_bytes))
+        presentation = etree.fromstring(package.read('ppt/presentation.xml'))
+        rels = etree.fromstring(package.read('ppt/_rels/presentation.xml.rels'))
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        errors.append('Not a valid PowerPoint (.pptx) file')
+        return inventory
+    
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+    slide_refs = [sld_id.get(f'{{{_R_NS}}}id') for sld_id in presentation.iter(f'{{{_P_NS}}}sldId')]
+    inventory['slide_count'] = len(slide_refs)
+    if max_slides and len(slide_refs) > max_slides:
+        errors.append(f'Template has {len(slide_refs)} slides, more than the {max_slides} allowed')
+        return inventory
+    
+    pattern = PPTExporter.placeholder_regex()
+    known = set(PPTExporter.placeholder_keys())
+    counts, unknown = Counter(), Counter()
+    locations = {}
+    split = 0
+    for number, ref in enumerate(slide_refs, start=1):
+        if targets.get(ref) is None:
+            errors.append(f'Slide {number} is missing from the package')
+            continue
+        part = _part_name('ppt/presentation.xml', targets[ref])
+        try:
+            root = etree.fromstring(package.read(part))
+        except (KeyError, etree.XMLSyntaxError):
+            errors.append(f'Slide {number} is missing or not valid XML')
+            continue
+        
+        shapes = OrderedDict()
+        found = []
+        for index, paragraph in enumerate(root.iter(_A_P)):
+            runs = [t.text or '' for t in paragraph.iter(_A_T)]
+            text = ''.join(runs)
+            if '{{' not in text and '}}' not in text:
+                continue
+            present = sorted(set(pattern.findall(text)))
+            if present:
+                found.append((index, present))
+                shapes.setdefault(_shape_of(paragraph), set()).update(present)
+            for match in _PLACEHOLDER_LIKE.finditer(text):
+                placeholder = match.group(0)
+                if placeholder not in known:
+                    unknown[placeholder] += 1
+                    continue
+                counts[placeholder] += 1
+                if not any(placeholder in run for run in runs):
+                    split += 1
+            rest = _PLACEHOLDER_LIKE.sub('', text)
+            if '{{' in rest or '}}' in rest:
+                warnings.append(f'Slide {number}: unbalanced braces in "{text.strip()[:80]}"')
+        
+        if found:
+            locations[part] = found
+        inventory['slides'].append({
+            'number': number,
+            'part': part,
+            'shapes': [{'id': shape_id, 'name': name, 'placeholders': sorted(present)}
+                       for (shape_id, name), present in shapes.items()]
+        })
+    
+    if errors:
+        return inventory
+    inventory['placeholders'] = dict(sorted(counts.items()))
+    inventory['compiled'] = CompiledTemplate.locations_to_json(
+        locations, hashlib.sha256(template_bytes).hexdigest()
+    )
+    if unknown:
+        warnings.append(f"Unknown placeholders, left as they are: {', '.join(sorted(unknown))}")
+    if split:
+        warnings.append(f'{split} placeholder(s) span several differently formatted text runs; '
+                        f'each is replaced in the formatting of its first run')
+    if not counts:
+        warnings.append('The template has no placeholders, so every export is an unchanged copy')
+    return inventory
+
+
+def _xml_bytes(root):
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+def _part_name(base_part, target):
+    """Resolve a relationship target relative to the part owning it"""
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+
+def _rels_name(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, '_rels', f'{name}.rels')
+
+
+class _MergedDeck:
+    """
+    Writes the template's slide set once per case study into one package
+    
+    Slides are appended as case studies arrive; the presentation part,
+    its relationships and the content types listing every slide are
+    written last, so the number of case studies need not be known up front.
+    """
+    
+    def __init__(self, template_bytes, compiled, pattern, target):
+        self.compiled = compiled
+        self.pattern = pattern
+        self.target = target
+        self.source = zipfile.ZipFile(io.BytesIO(template_bytes))
+        self.written = 0
+        
+        self.presentation = etree.fromstring(self.source.read('ppt/presentation.xml'))
+        self.presentation_rels = etree.fromstring(self.source.read('ppt/_rels/presentation.xml.rels'))
+        rels = {rel.get('Id'): rel.get('Target') for rel in self.presentation_rels}
+        
+        # Template slides in presentation order, with their relationships
+        self.slides = []
+        for sld_id in self.presentation.iter(f'{{{_P_NS}}}sldId'):
+            part = _part_name('ppt/presentation.xml', rels[sld_id.get(f'{{{_R_NS}}}id')])
+            self.slides.append((part, self._slide_rels(part)))
+    
+    def _slide_rels(self, part):
+        name = _rels_name(part)
+        if name not in self.source.namelist():
+            return None
+        root = etree.fromstring(self.source.read(name))
+        for rel in list(root):
+            if rel.get('Type') in _MERGE_DROPPED_RELS:
+                root.remove(rel)
+        return _xml_bytes(root)
+    
+    def write_shared_parts(self):
+        """Copy every part that is the same for all case studies"""
+        for info in self.source.infolist():
+            if not _MERGE_REBUILT.match(info.filename):
+                self.target.writestr(info, self.source.read(info))
+    
+    def add(self, replacements):
+        """Append one filled-in copy of the template slides"""
+        for part, rels in self.slides:
+            self.written += 1
+            name = f'ppt/slides/slide{self.written}.xml'
+            if part in self.compiled.locations:
+                xml = self.compiled.render_slide(part, replacements, self.pattern)
+            else:
+                xml = self.source.read(part)
+            self.target.writestr(name, xml)
+            if rels is not None:
+                self.target.writestr(_rels_name(name), rels)
+    
+    def finish(self):
+        """Write the presentation part, its relationships and the content types"""
+        # Point the presentation at the new slides instead of the template's
+        for rel in list(self.presentation_rels):
+            if rel.get('Type') == _RT_SLIDE:
+                self.presentation_rels.remove(rel)
+        sld_id_lst = self.presentation.find(f'{{{_P_NS}}}sldIdLst')
+        if sld_id_lst is None:
+            # Schema order: the slide list goes right before the slide size
+            sld_id_lst = etree.Element(f'{{{_P_NS}}}sldIdLst')
+            sld_sz = self.presentation.find(f'{{{_P_NS}}}sldSz')
+            if sld_sz is not None:
+                sld_sz.addprevious(sld_id_lst)
+            else:
+                self.presentation.append(sld_id_lst)
+        for child in list(sld_id_lst):
+            sld_id_lst.remove(child)
+        
+        for number in range(1, self.written + 1):
+            rel_id = f'rIdMergedSlide{number}'
+            etree.SubElement(self.presentation_rels, f'{{{_PKG_RELS_NS}}}Relationship',
+                             Id=rel_id, Type=_RT_SLIDE, Target=f'slides/slide{number}.xml')
+            # Slide ids start at 256 per the spec
+            etree.SubElement(sld_id_lst, f'{{{_P_NS}}}sldId',
+                             {'id': str(255 + number), f'{{{_R_NS}}}id': rel_id})
+        
+        content_types = etree.fromstring(self.source.read('[Content_Types].xml'))
+        for override in list(content_types.iter(f'{{{_CT_NS}}}Override')):
+            if _MERGE_REBUILT.match(override.get('PartName').lstrip('/')) and \
+                    override.get('PartName') != '/ppt/presentation.xml':
+                content_types.remove(override)
+        for number in range(1, self.written + 1):
+            etree.SubElement(content_types, f'{{{_CT_NS}}}Override',
+                             PartName=f'/ppt/slides/slide{number}.xml', ContentType=_CT_SLIDE)
+        
+        self.target.writestr('ppt/presentation.xml', _xml_bytes(self.presentation))
+        self.target.writestr('ppt/_rels/presentation.xml.rels', _xml_bytes(self.presentation_rels))
+        self.target.writestr('[Content_Types].xml', _xml_bytes(content_types))
+
+
+class TemplateCache:
+    """In-process LRU cache of compiled templates"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+            return compiled
+    
+    def put(self, key, compiled):
+        with self._lock:
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def discard(self, path):
+        """Drop every cached version of the template at `path`"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+
 
 class PPTExporter:
     """Handle PowerPoint export with template support"""
@@ -24,9 +500,31 @@ class PPTExporter:
         'CREATED_BY': 'created_by',
     }
     
-    def __init__(self, template_path):
-        """Initialize with template path"""
+    # Format of {{EXPORT_DATE}}; also the granularity of cached exports
+    EXPORT_DATE_FORMAT = "%B %d, %Y"
+    
+    # Compiled templates kept in memory, least recently used evicted first
+    TEMPLATE_CACHE_SIZE = 8
+    template_cache = TemplateCache(TEMPLATE_CACHE_SIZE)
+    
+    _placeholder_regex = None
+    
+    def __init__(self, template_path, persist_compiled=False, known_locations=None):
+        """
+        Initialize with template path
+        
+        Args:
+            template_path: Path to the .pptx template
+            persist_compiled: Store the compiled form next to the template
+                so other processes (and restarts) can skip the slide scan
+            known_locations: Placeholder locations recorded when the
+                template was inspected (the 'compiled' entry of
+                inspect_template); used instead of scanning the slides
+                while they still match the file
+        """
         self.template_path = template_path
+        self.persist_compiled = persist_compiled
+        self.known_locations = known_locations
     
     def export_case_study(self, case_study, output_path):
         """
@@ -34,29 +532,132 @@ class PPTExporter:
         
         Args:
             case_study: CaseStudy object
-            output_path: Path to save the generated PowerPoint
+            output_path: Path to save the generated PowerPoint, or a
+                seekable binary file object (e.g. an in-memory or spooled
+                buffer) to write it into
         """
-        # Load the template
-        prs = Presentation(self.template_path)
-        
-        # Build replacement dictionary
+        with timed('export_template_load'):
+            compiled = self.compile()
         replacements = self._build_replacements(case_study)
         
-        # Process all slides
-        for slide in prs.slides:
-            # Process shapes in slide
-            for shape in slide.shapes:
-                if hasattr(shape, "text_frame"):
-                    self._replace_text_in_shape(shape, replacements)
-                
-                # Handle tables
-                if hasattr(shape, "table"):
-                    self._replace_text_in_table(shape.table, replacements)
-        
-        # Save the presentation
-        prs.save(output_path)
+        if hasattr(output_path, 'write'):
+            compiled.render(replacements, output_path, self.placeholder_regex())
+            return output_path
+        
+        with open(output_path, 'w+b') as output:
+            compiled.render(replacements, output, self.placeholder_regex())
         return output_path
     
+    def iter_export_batch(self, case_studies, output, as_zip=False):
+        """
+        Export many case studies into one stream
+        
+        Renders either one merged presentation holding the template's slide
+        set once per case study, or a zip archive with one presentation per
+        case study. The output does not need to be seekable, so it can be a
+        buffer drained between steps; this generator yields each case study
+        once its slides have been written.
+        
+        Args:
+            case_studies: Iterable of CaseStudy objects
+            output: Writable binary file object
+            as_zip: Write a zip of separate decks instead of one merged deck
+        """
+        with timed('export_template_load'):
+            compiled = self.compile()
+        pattern = self.placeholder_regex()
+        
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as target:
+            if as_zip:
+                for number, case_study in enumerate(case_studies, start=1):
+                    deck = io.BytesIO()
+                    compiled.render(self._build_replacements(case_study), deck, pattern)
+                    name = secure_filename(case_study.project_name or '') or 'case_study'
+                    # Decks are already compressed
+                    target.writestr(f'{number:03d}_{name}.pptx', deck.getvalue(),
+                                    compress_type=zipfile.ZIP_STORED)
+                    yield case_study
+                return
+            
+            with open(self.template_path, 'rb') as f:
+                merged = _MergedDeck(f.read(), compiled, pattern, target)
+            merged.write_shared_parts()
+            for case_study in case_studies:
+                merged.add(self._build_replacements(case_study))
+                yield case_study
+            merged.finish()
+    
+    def compile(self):
+        """Return the compiled template, compiling it on first use"""
+        path = os.path.abspath(self.template_path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        
+        compiled = self.template_cache.get(key)
+        if compiled is not None:
+            return compiled
+        
+        with open(path, 'rb') as f:
+            template_bytes = f.read()
+        
+        # Reuse the locations recorded at upload or by an earlier compile if still valid
+        sha256 = hashlib.sha256(template_bytes).hexdigest()
+        locations = None
+        if self.known_locations:
+            locations = CompiledTemplate.locations_from_json(self.known_locations, sha256)
+        sidecar = self.compiled_path(path)
+        if locations is None and self.persist_compiled and os.path.exists(sidecar):
+            try:
+                with open(sidecar) as f:
+                    locations = CompiledTemplate.locations_from_json(json.load(f), sha256)
+            except (OSError, ValueError, KeyError, TypeError):
+                locations = None
+        
+        compiled = CompiledTemplate.build(template_bytes, self.placeholder_regex(), locations)
+        
+        if self.persist_compiled and locations is None:
+            tmp_path = f'{sidecar}.{os.getpid()}.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(compiled.to_json(), f)
+                os.replace(tmp_path, sidecar)
+            except OSError:
+                pass
+        
+        self.template_cache.put(key, compiled)
+        return compiled
+    
+    @staticmethod
+    def compiled_path(template_path):
+        """Location of the persisted compiled form of a template"""
+        return f'{template_path}.compiled.json'
+    
+    @classmethod
+    def discard_compiled(cls, template_path):
+        """Forget the compiled form of a template (in memory and on disk)"""
+        cls.template_cache.discard(os.path.abspath(template_path))
+        try:
+            os.remove(cls.compiled_path(template_path))
+        except OSError:
+            pass
+    
+    @classmethod
+    def export_date(cls):
+        """Current value of {{EXPORT_DATE}}"""
+        return datetime.now().strftime(cls.EXPORT_DATE_FORMAT)
+    
+    @classmethod
+    def placeholder_keys(cls):
+        """All placeholder strings, e.g. '{{CLIENT}}'"""
+        return [f"{{{{{name}}}}}" for name in cls.PLACEHOLDERS] + ["{{EXPORT_DATE}}"]
+    
+    @classmethod
+    def placeholder_regex(cls):
+        """Precompiled regex matching any placeholder"""
+        if cls._placeholder_regex is None:
+            cls._placeholder_regex = placeholder_pattern(cls.placeholder_keys())
+        return cls._placeholder_regex
+    
     def _build_replacements(self, case_study):
         """Build dictionary of placeholder replacements"""
         replacements = {}
@@ -77,46 +678,13 @@ class PPTExporter:
                 value = str(value)
             
             # Add with double curly braces
-            replacements[f"{{{{{placeholder}}}}}"] = value
+            replacements[f"{{{{{placeholder}}}}}"] = escape_xml_invalid(value)
         
         # Add current date
-        replacements["{{EXPORT_DATE}}"] = datetime.now().strftime("%B %d, %Y")
+        replacements["{{EXPORT_DATE}}"] = self.export_date()
         
         return replacements
     
-    def _replace_text_in_shape(self, shape, replacements):
-        """Replace placeholders in a shape's text"""
-        if not shape.has_text_frame:
-            return
-        
-        text_frame = shape.text_frame
-        
-        # Process each paragraph
-        for paragraph in text_frame.paragraphs:
-            # Process each run
-            for run in paragraph.runs:
-                original_text = run.text
-                
-                # Replace all placeholders
-                for placeholder, value in replacements.items():
-                    if placeholder in original_text:
-                        original_text = original_text.replace(placeholder, value)
-                
-                run.text = original_text
-    
-    def _replace_text_in_table(self, table, replacements):
-        """Replace placeholders in a table"""
-        for row in table.rows:
-            for cell in row.cells:
-                original_text = cell.text
-                
-                # Replace all placeholders
-                for placeholder, value in replacements.items():
-                    if placeholder in original_text:
-                        original_text = original_text.replace(placeholder, value)
-                
-                cell.text = original_text
-    
     @staticmethod
     def get_placeholder_guide():
         """Return a guide for available placeholders"""
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """
+    Per-process LRU dictionary whose entries expire after `ttl` seconds
+
+    Holds at most `maxsize` entries and, if set, `max_bytes` of values; a
+    value larger than that on its own isn't stored.
+    """
+
+    def __init__(self, maxsize, ttl, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._bytes += len(value)
+            while len(self._entries) > self.maxsize or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteBackend:
+    """
+    LRU cache in a SQLite file, shared by every worker process on a host
+
+    Kept apart from the application database so cache traffic never
+    contends with its writers. Each thread uses its own connection. Bounded
+    like MemoryBackend, by entries and optionally by bytes.
+    """
+
+    def __init__(self, path, maxsize, ttl, timeout=5, max_bytes=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)""")
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_used ON entries (used)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """The cached value, or None; errors such as a lock timeout count as a miss"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE entries SET used = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            logger.warning('Search cache read failed, treating it as a miss: %s', e)
+            return None
+        return row[0]
+
+    def put(self, key, value):
+        """Store a value; it is skipped if the cache file can't be written"""
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO entries (key, value, expires, used) VALUES (?, ?, ?, ?)',
+                         (key, value, now + self.ttl, now))
+            conn.execute("""DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)""", (self.maxsize,))
+            if self.max_bytes is not None:
+                # Drop the least recently used entries beyond the byte budget
+                conn.execute("""DELETE FROM entries WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(length(value)) OVER (ORDER BY used DESC, key) AS total FROM entries
+                    ) WHERE total > ?)""", (self.max_bytes,))
+        except sqlite3.Error as e:
+            logger.warning('Search cache write failed, not caching: %s', e)
+
+    def clear(self):
+        self._connect().execute('DELETE FROM entries')
+
+
+class SearchCache:
+    """
+    Cache of serialized GET /api/case-studies responses
+
+    Keys combine the case_studies change counter (see app.changes) with the
+    normalized search parameters, so any case study write makes every older
+    entry unreachable; those entries then age out of the LRU.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @classmethod
+    def from_config(cls):
+        """Cache of the current app, or None if disabled"""
+        app = current_app._get_current_object()
+        if not app.config.get('SEARCH_CACHE_ENABLED', True):
+            return None
+        cache = app.extensions.get('search_cache')
+        if cache is None:
+            size = app.config.get('SEARCH_CACHE_SIZE', 512)
+            ttl = app.config.get('SEARCH_CACHE_TTL', 60)
+            max_bytes = app.config.get('SEARCH_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+            if app.config.get('SEARCH_CACHE_BACKEND', 'memory') == 'sqlite':
+                path = app.config.get('SEARCH_CACHE_PATH') or \
+                    os.path.join(app.config['UPLOAD_FOLDER'], 'search_cache.sqlite')
+                backend = SQLiteBackend(path, size, ttl, max_bytes=max_bytes)
+            else:
+                backend = MemoryBackend(size, ttl, max_bytes)
+            cache = app.extensions['search_cache'] = cls(backend)
+        return cache
+
+    @staticmethod
+    def key(generation, params):
+        """Cache key of normalized parameters at a counter generation"""
+        raw = json.dumps([generation, sorted(params.items())], separators=(',', ':'), default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        """(body bytes, headers dict) or None"""
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        headers, body = value.split(b'\n', 1)
+        return body, json.loads(headers)
+
+    def put(self, key, body, headers):
+        # Compact JSON has no newlines, so the first one ends the headers
+        self.backend.put(key, json.dumps(headers, separators=(',', ':')).encode() + b'\n' + body)
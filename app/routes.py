@@ -1,11 +1,24 @@
+import hashlib
+import json
+import mimetypes
 import os
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+import tempfile
+import unicodedata
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from urllib.parse import quote
+from flask import (Blueprint, Response, render_template, request, jsonify, send_file,
+                   current_app, stream_with_context, url_for)
+from werkzeug.http import dump_options_header
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from app import db
-from app.models import CaseStudy, Attachment, PPTTemplate
+from app import blobs, changes, db, facets, importer, library_export, live_search
+from app.models import CaseStudy, Attachment, PPTTemplate, ExportJob, TemplateInventory
+from app.export_cache import ExportCache
+from app.jobs import export_jobs
+from app.response_cache import SearchCache
 from app.search import SearchService
-from app.ppt_export import PPTExporter
+from app.serializers import serialize_case_studies
+from app.streaming import ChunkBuffer, iter_file
 
 main = Blueprint('main', __name__)
 
@@ -15,6 +28,88 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 
+def _invalidate_exports(case_study_id=None, template_id=None):
+    """Drop cached exports whose inputs changed"""
+    cache = ExportCache.from_config()
+    if cache is None:
+        return
+    if case_study_id is not None:
+        cache.invalidate_case_study(case_study_id)
+    if template_id is not None:
+        cache.invalidate_template(template_id)
+
+
+def _etag(*parts):
+    """Strong ETag for the representation determined by parts"""
+    return hashlib.sha1('\0'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _not_modified(etag):
+    """A 304 response if the client already has this representation, else None"""
+    if request.if_none_match.contains(etag):
+        return _with_etag(Response(status=304), etag)
+    return None
+
+
+def _with_etag(response, etag):
+    """Tag a response; no-cache makes browsers revalidate it on every use"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _search_criteria(args=None):
+    """
+    build_query arguments from the search parameters of the request
+
+    `args` replaces the query string, e.g. with a JSON object.
+    Returns (criteria, None), or (None, error response) for invalid parameters.
+    """
+    if args is None:
+        args = request.args
+    technologies_match = args.get('technologies_match') or 'all'
+    tags_match = args.get('tags_match') or 'all'
+    if technologies_match not in ('all', 'any') or tags_match not in ('all', 'any'):
+        return None, (jsonify({'error': "Match modes must be 'all' or 'any'"}), 400)
+
+    confidential = args.get('confidential')
+    if confidential is not None and not isinstance(confidential, bool):
+        if str(confidential).lower() not in ('true', 'false'):
+            return None, (jsonify({'error': "confidential must be 'true' or 'false'"}), 400)
+        confidential = str(confidential).lower() == 'true'
+
+    query = args.get('q') or None
+    return dict(
+        query=query,
+        industry=args.get('industry') or None,
+        year=args.get('year') or None,
+        technologies=args.get('technologies') or None,
+        tags=args.get('tags') or None,
+        confidential=confidential,
+        technologies_match=technologies_match,
+        tags_match=tags_match,
+        # Rank by relevance when searching unless a sort order is requested
+        sort_by=args.get('sort_by') or ('relevance' if query else 'updated_at'),
+        sort_order=args.get('sort_order') or 'desc'
+    ), None
+
+
+def _parse_fields(allowed):
+    """
+    The comma-separated `fields` parameter of the request as a list
+
+    Returns (fields, None), fields being None if not given, or (None, error
+    response) if it names fields not in `allowed`.
+    """
+    if not request.args.get('fields'):
+        return None, None
+    fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        return None, (jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400)
+    return fields, None
+
+
 @main.route('/')
 def index():
     """Home page"""
@@ -23,34 +118,89 @@ def index():
 
 @main.route('/api/case-studies', methods=['GET'])
 def get_case_studies():
-    """Get all case studies with optional filtering"""
-    query = request.args.get('q', '')
-    industry = request.args.get('industry', '')
-    year = request.args.get('year', '')
-    technologies = request.args.get('technologies', '')
-    tags = request.args.get('tags', '')
-    sort_by = request.args.get('sort_by', 'updated_at')
-    sort_order = request.args.get('sort_order', 'desc')
-    
-    # Search
-    case_studies = SearchService.search(
-        query=query if query else None,
-        industry=industry if industry else None,
-        year=year if year else None,
-        technologies=technologies if technologies else None,
-        tags=tags if tags else None,
-        sort_by=sort_by,
-        sort_order=sort_order
-    )
+    """
+    Get case studies with optional filtering
+    
+    Pass `limit` (and then `cursor`) for keyset pagination and `fields` to
+    project each case study to a comma-separated subset of its fields;
+    `confidential` (true/false) filters on confidentiality. The total
+    number of matches is returned in the X-Total-Count header, the cursor
+    for the following page in X-Next-Cursor and a Link header.
+    """
+    criteria, error = _search_criteria()
+    if error is not None:
+        return error
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    
+    fields, error = _parse_fields(CaseStudy.FIELDS)
+    if error is not None:
+        return error
+    
+    # Any case study write changes the version, and so the tag of every list
+    generation = changes.version(changes.CASE_STUDIES)
+    etag = _etag('case-studies', generation, sorted(request.args.items(multi=True)))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    
+    paginated = limit is not None or bool(cursor)
+    if paginated:
+        max_page_size = current_app.config.get('MAX_PAGE_SIZE', 200)
+        limit = max(1, min(limit or max_page_size, max_page_size))
+    
+    # Serialized responses are shared by every request with equivalent
+    # parameters until the next case study write
+    cache = SearchCache.from_config()
+    if cache is not None:
+        cache_key = SearchCache.key(generation, dict(
+            SearchService.normalize_criteria(**criteria),
+            limit=limit, cursor=cursor, fields=','.join(fields) if fields else None
+        ))
+        cached = cache.get(cache_key)
+    else:
+        cached = None
     
-    return jsonify([cs.to_dict() for cs in case_studies])
+    if cached is not None:
+        body, headers = cached
+    else:
+        if paginated:
+            try:
+                page = SearchService.search_page(limit, cursor=cursor, fields=fields, **criteria)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            items, headers = page.items, {'X-Total-Count': str(page.total)}
+            if page.next_cursor:
+                headers['X-Next-Cursor'] = page.next_cursor
+        else:
+            # Unpaginated: the whole result set
+            results, _ = SearchService.build_query(**criteria)
+            items = serialize_case_studies(results, fields)
+            headers = {'X-Total-Count': str(len(items))}
+        body = jsonify(items).get_data()
+        if cache is not None:
+            cache.put(cache_key, body, headers)
+    
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers.update(headers)
+    if 'X-Next-Cursor' in headers:
+        next_args = request.args.to_dict()
+        next_args.update(cursor=headers['X-Next-Cursor'], limit=limit)
+        response.headers['Link'] = f'<{url_for("main.get_case_studies", **next_args)}>; rel="next"'
+    return _with_etag(response, etag)
 
 
 @main.route('/api/case-studies/<int:id>', methods=['GET'])
 def get_case_study(id):
     """Get a specific case study"""
+    updated_at = db.session.query(CaseStudy.updated_at).filter_by(id=id).first_or_404()[0]
+    etag = _etag('case-study', id, updated_at.isoformat() if updated_at else '')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    
     case_study = CaseStudy.query.get_or_404(id)
-    return jsonify(case_study.to_dict())
+    return _with_etag(jsonify(case_study.to_dict()), etag)
 
 
 @main.route('/api/case-studies', methods=['POST'])
@@ -81,6 +231,147 @@ def create_case_study():
     return jsonify(case_study.to_dict()), 201
 
 
+@main.route('/api/case-studies/import', methods=['POST'])
+def import_case_studies():
+    """
+    Bulk import case studies from JSON Lines or CSV
+
+    Accepts the file as a multipart upload ('file') or as the raw request
+    body. The format comes from ?format=, the file name or the content type.
+    Invalid records are skipped and listed in the response by line number.
+    Files that aren't UTF-8 get a 400 response listing the lines affected.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename, mimetype = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, mimetype = request.stream, None, request.mimetype
+
+    format = request.args.get('format') or importer.detect_format(filename, mimetype)
+    if format not in importer.FORMATS:
+        return jsonify({'error': 'Unknown import format, use ?format=jsonl or ?format=csv'}), 400
+
+    default_batch_size = current_app.config.get('IMPORT_BATCH_SIZE', 500)
+    batch_size = request.args.get('batch_size', default_batch_size, type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+
+    report = importer.import_stream(stream, format, batch_size,
+                                    current_app.config.get('IMPORT_MAX_REPORTED_ERRORS', 1000))
+    if report.not_utf8:
+        # The other lines are imported, but the file needs fixing
+        return jsonify(dict(report.to_dict(), error='The file is not UTF-8 encoded')), 400
+    return jsonify(report.to_dict())
+
+
+@main.route('/api/case-studies/export', methods=['GET'])
+def export_case_studies():
+    """
+    Stream every case study matching the search filters as NDJSON or CSV
+
+    Takes the filters and sort order of GET /api/case-studies plus
+    `format` and `fields`.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in library_export.FORMATS:
+        return jsonify({'error': "format must be 'ndjson' or 'csv'"}), 400
+
+    fields, error = _parse_fields(CaseStudy.FIELDS)
+    if error is not None:
+        return error
+
+    criteria, error = _search_criteria()
+    if error is not None:
+        return error
+    results, _ = SearchService.build_query(**criteria)
+
+    chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+    chunks = library_export.iter_export(results, export_format, fields, chunk_size)
+    filename = f"case_studies_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=library_export.MIMETYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@main.route('/api/case-studies/live', methods=['GET'])
+def live_case_studies():
+    """
+    Search as the user types: compact rows, best matches first, streamed
+
+    Takes the filters and sort order of GET /api/case-studies plus `top`,
+    the number of rows on the first line. See app.live_search for the
+    format; at most LIVE_SEARCH_MAX_RESULTS rows are sent, taken from the
+    newest LIVE_SEARCH_CANDIDATES text matches.
+    """
+    criteria, error = _search_criteria()
+    if error is not None:
+        return error
+    max_results = current_app.config.get('LIVE_SEARCH_MAX_RESULTS', 500)
+    top = request.args.get('top', current_app.config.get('LIVE_SEARCH_TOP', 20), type=int)
+    top = max(1, min(top, max_results))
+    # Rank a bounded set of text matches: a one-letter prefix matches
+    # nearly everything, and ranking all of it would cost every keystroke
+    criteria['max_candidates'] = current_app.config.get('LIVE_SEARCH_CANDIDATES', 2000)
+    results, _ = SearchService.build_query(**criteria)
+
+    # The first line is what the user sees while typing, so it is shared
+    # like the search responses until the next case study write
+    cache = SearchCache.from_config()
+    if cache is not None:
+        cache_key = SearchCache.key(changes.version(changes.CASE_STUDIES), dict(
+            SearchService.normalize_criteria(**criteria), live=True, top=top
+        ))
+        cached = cache.get(cache_key)
+    else:
+        cached = None
+
+    if cached is not None:
+        first, headers = cached
+        count, more = headers['count'], headers['more']
+    else:
+        first, count, more = live_search.head(results, top)
+        if cache is not None:
+            cache.put(cache_key, first, {'count': count, 'more': more})
+
+    chunk_size = current_app.config.get('LIVE_SEARCH_CHUNK_SIZE', 100)
+    lines = live_search.iter_live(first, count, more, results, max_results, chunk_size)
+    response = Response(stream_with_context(lines), mimetype=live_search.MIMETYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    # Ask proxies not to buffer, so the first line arrives on its own
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@main.route('/api/case-studies/<int:id>/similar', methods=['GET'])
+def get_similar_case_studies(id):
+    """
+    Case studies most like one by their text (TF-IDF cosine similarity)
+
+    `limit` (default 5, at most 50) and `fields` as for GET /api/case-studies;
+    every case study carries its `score` between 0 and 1, best first. Until
+    the first index is built the answer is 503.
+    """
+    db.session.query(CaseStudy.id).filter_by(id=id).first_or_404()
+    fields, error = _parse_fields(CaseStudy.FIELDS)
+    if error is not None:
+        return error
+    if fields is not None and 'id' not in fields:
+        fields.insert(0, 'id')
+    limit = max(1, min(request.args.get('limit', 5, type=int), 50))
+    
+    from app.similarity import SimilarityIndex
+    ranked = SimilarityIndex.from_config().similar(id, limit)
+    if ranked is None:
+        response = jsonify({'error': 'The similarity index is being built, try again shortly'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    items = serialize_case_studies(CaseStudy.query.filter(CaseStudy.id.in_([i for i, _ in ranked])), fields)
+    by_id = {item['id']: item for item in items}
+    return jsonify([dict(by_id[i], score=round(score, 4)) for i, score in ranked if i in by_id])
+
+
 @main.route('/api/case-studies/<int:id>', methods=['PUT'])
 def update_case_study(id):
     """Update a case study"""
@@ -97,6 +388,7 @@ def update_case_study(id):
     
     case_study.updated_at = datetime.utcnow()
     db.session.commit()
+    _invalidate_exports(case_study_id=id)
     
     return jsonify(case_study.to_dict())
 
@@ -106,15 +398,110 @@ def delete_case_study(id):
     """Delete a case study"""
     case_study = CaseStudy.query.get_or_404(id)
     
-    # Delete associated attachments from filesystem
-    for attachment in case_study.attachments:
-        try:
-            os.remove(attachment.file_path)
-        except:
-            pass
-    
+    # Attachments go with the case study; files no other attachment uses are removed
     db.session.delete(case_study)
     db.session.commit()
+    blobs.collect_garbage()
+    _invalidate_exports(case_study_id=id)
+    
+    return '', 204
+
+
+@main.route('/api/case-studies/<int:id>/attachments', methods=['POST'])
+def upload_attachment(id):
+    """
+    Attach a file to a case study
+    
+    Send the file as multipart 'file', or as the raw request body with its
+    name in ?filename=. The content is streamed to disk in chunks and stored
+    once, however many attachments share it.
+    """
+    case_study = CaseStudy.query.get_or_404(id)
+    
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename = upload.stream, upload.filename
+    else:
+        stream, filename = request.stream, request.args.get('filename', '')
+    # Keep the name as given, minus any directories, for the download
+    filename = (filename or '').replace('\\', '/').rsplit('/', 1)[-1].strip()[:255]
+    if not filename:
+        return jsonify({'error': 'No file selected'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    
+    try:
+        pending = blobs.receive(stream, current_app.config.get('ATTACHMENT_MAX_BYTES'))
+    except blobs.TooLarge:
+        return jsonify({'error': 'File too large'}), 413
+    if not pending.size:
+        pending.discard()
+        return jsonify({'error': 'File is empty'}), 400
+    
+    try:
+        attachment = blobs.attach(case_study, pending, filename)
+        case_study.updated_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        pending.discard()
+        db.session.rollback()
+        raise
+    
+    return jsonify(attachment.to_dict()), 201
+
+
+def _content_disposition(filename):
+    """Content-Disposition header value for downloading a file under its name"""
+    try:
+        filename.encode('ascii')
+        options = {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        options = {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='')}"}
+    return dump_options_header('attachment', options)
+
+
+@main.route('/api/attachments/<int:id>', methods=['GET'])
+def download_attachment(id):
+    """
+    Download an attachment
+    
+    Supports conditional and Range requests. With
+    ATTACHMENT_ACCEL_REDIRECT_PREFIX set, nginx serves the file from an
+    internal location instead (X-Accel-Redirect); USE_X_SENDFILE hands it
+    to servers that understand X-Sendfile.
+    """
+    attachment = Attachment.query.get_or_404(id)
+    mimetype = mimetypes.guess_type(attachment.original_filename)[0] or 'application/octet-stream'
+    
+    prefix = current_app.config.get('ATTACHMENT_ACCEL_REDIRECT_PREFIX')
+    if prefix:
+        location = os.path.relpath(attachment.file_path, current_app.config['ATTACHMENTS_FOLDER'])
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{location.replace(os.sep, '/')}"
+        response.headers['Content-Disposition'] = _content_disposition(attachment.original_filename)
+        return response
+    
+    if not os.path.exists(attachment.file_path):
+        return jsonify({'error': 'Attachment file not found'}), 404
+    return send_file(
+        attachment.file_path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=attachment.original_filename,
+        conditional=True,
+        etag=attachment.filename
+    )
+
+
+@main.route('/api/attachments/<int:id>', methods=['DELETE'])
+def delete_attachment(id):
+    """Delete an attachment, and its file if no other attachment shares it"""
+    attachment = Attachment.query.get_or_404(id)
+    attachment.case_study.updated_at = datetime.utcnow()
+    db.session.delete(attachment)
+    db.session.commit()
+    blobs.collect_garbage()
     
     return '', 204
 
@@ -122,15 +509,53 @@ def delete_case_study(id):
 @main.route('/api/facets', methods=['GET'])
 def get_facets():
     """Get filtering facets"""
+    etag = _etag('facets', changes.version(changes.CASE_STUDIES))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    
     facets = SearchService.get_facets()
-    return jsonify(facets)
+    return _with_etag(jsonify(facets), etag)
+
+
+@main.route('/api/suggestions', methods=['GET'])
+def get_suggestions():
+    """
+    Autocomplete client, industry, technology and tag names
+
+    `q` is the typed prefix, `fields` a comma-separated subset of client,
+    industry, technology and tag (default: all), `limit` the number of
+    suggestions (at most 50). Suggestions are ranked by the number of case
+    studies using them.
+    """
+    fields, error = _parse_fields(facets.SUGGEST_DIMENSIONS)
+    if error is not None:
+        return error
+    if fields is None:
+        fields = facets.SUGGEST_DIMENSIONS
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+
+    etag = _etag('suggestions', changes.version(changes.CASE_STUDIES), sorted(request.args.items(multi=True)))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    suggestions = facets.suggest(request.args.get('q', ''), fields, limit)
+    return _with_etag(jsonify([
+        {'field': field, 'value': value, 'count': count} for field, value, count in suggestions
+    ]), etag)
 
 
 @main.route('/api/templates', methods=['GET'])
 def get_templates():
     """Get all PowerPoint templates"""
+    etag = _etag('templates', changes.version(changes.TEMPLATES))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    
     templates = PPTTemplate.query.all()
-    return jsonify([t.to_dict() for t in templates])
+    return _with_etag(jsonify([t.to_dict() for t in templates]), etag)
 
 
 @main.route('/api/templates', methods=['POST'])
@@ -155,8 +580,40 @@ def upload_template():
     filename = secure_filename(file.filename)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"{timestamp}_{filename}"
-    file_path = os.path.join(current_app.config['TEMPLATE_FOLDER'], filename)
-    file.save(file_path)
+    
+    # Parse the template once now, so broken ones fail here rather than at
+    # export; it keeps a temporary name until accepted
+    fd, upload_path = tempfile.mkstemp(suffix='.upload', dir=current_app.config['TEMPLATE_FOLDER'])
+    os.close(fd)
+    try:
+        file.save(upload_path)
+        try:
+            inventory = _inspect_template(upload_path)
+        except FuturesTimeoutError:
+            inventory = {'errors': ['Template took too long to inspect']}
+        if inventory['errors']:
+            return jsonify({
+                'error': f"Template rejected: {'; '.join(inventory['errors'])}",
+                'problems': inventory['errors']
+            }), 400
+        
+        # Never replace another template's file
+        stem, extension = os.path.splitext(filename)
+        file_path = os.path.join(current_app.config['TEMPLATE_FOLDER'], filename)
+        suffix = 1
+        while os.path.exists(file_path):
+            filename = f'{stem}_{suffix}{extension}'
+            file_path = os.path.join(current_app.config['TEMPLATE_FOLDER'], filename)
+            suffix += 1
+        os.replace(upload_path, file_path)
+        upload_path = None
+    finally:
+        # Whatever went wrong, don't leave the temporary file behind
+        if upload_path is not None:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
     
     # If this is set as default, unset other defaults
     if is_default:
@@ -168,13 +625,38 @@ def upload_template():
         filename=filename,
         file_path=file_path,
         description=description,
-        is_default=is_default
+        is_default=is_default,
+        inventory=TemplateInventory(
+            size=inventory['size'],
+            slide_count=inventory['slide_count'],
+            data=json.dumps(inventory)
+        )
     )
     
     db.session.add(template)
     db.session.commit()
     
-    return jsonify(template.to_dict()), 201
+    # Warnings don't stop the upload but are reported with it
+    return jsonify(dict(template.to_dict(), inventory=template.inventory.to_dict())), 201
+
+
+def _inspect_template(path):
+    """inspect_template for an upload, run in the export pool unless disabled"""
+    from app.ppt_export import inspect_template
+    args = (path, current_app.config.get('TEMPLATE_MAX_BYTES'), current_app.config.get('TEMPLATE_MAX_SLIDES'))
+    if current_app.config.get('TEMPLATE_INSPECT_IN_WORKER', True):
+        return export_jobs.run(inspect_template, *args,
+                               timeout=current_app.config.get('TEMPLATE_INSPECT_TIMEOUT', 60))
+    return inspect_template(*args)
+
+
+@main.route('/api/templates/<int:id>/inventory', methods=['GET'])
+def get_template_inventory(id):
+    """Placeholders per slide and shape, metrics and warnings of a template"""
+    template = PPTTemplate.query.get_or_404(id)
+    if template.inventory is None:
+        return jsonify({'error': 'Template has not been inspected yet, run flask inspect-templates'}), 404
+    return jsonify(template.inventory.to_dict())
 
 
 @main.route('/api/templates/<int:id>', methods=['DELETE'])
@@ -182,14 +664,17 @@ def delete_template(id):
     """Delete a PowerPoint template"""
     template = PPTTemplate.query.get_or_404(id)
     
-    # Delete file
+    # Delete file and its compiled form
     try:
         os.remove(template.file_path)
     except:
         pass
+    from app.ppt_export import PPTExporter
+    PPTExporter.discard_compiled(template.file_path)
     
     db.session.delete(template)
     db.session.commit()
+    _invalidate_exports(template_id=id)
     
     return '', 204
 
@@ -209,51 +694,218 @@ def set_default_template(id):
     return jsonify(template.to_dict())
 
 
+def _export_template(template_id):
+    """Template to export with: the requested one, or the default"""
+    if template_id:
+        return PPTTemplate.query.get_or_404(template_id)
+    return PPTTemplate.query.filter_by(is_default=True).first()
+
+
+def _exporter_for(template):
+    from app.ppt_export import PPTExporter
+    return PPTExporter(
+        template.file_path,
+        persist_compiled=current_app.config.get('PPT_PERSIST_COMPILED_TEMPLATES', True),
+        known_locations=template.inventory.known_locations if template.inventory else None
+    )
+
+
 @main.route('/api/case-studies/<int:id>/export/pptx', methods=['GET'])
 def export_to_pptx(id):
     """Export a case study to PowerPoint"""
+    from app.ppt_export import PPTExporter, PPTX_MIMETYPE
     case_study = CaseStudy.query.get_or_404(id)
     
     # Get template ID from query params or use default
-    template_id = request.args.get('template_id')
-    
-    if template_id:
-        template = PPTTemplate.query.get_or_404(template_id)
-    else:
-        # Get default template
-        template = PPTTemplate.query.filter_by(is_default=True).first()
-        if not template:
-            return jsonify({'error': 'No template available. Please upload a template first.'}), 400
+    template = _export_template(request.args.get('template_id'))
+    if not template:
+        return jsonify({'error': 'No template available. Please upload a template first.'}), 400
     
     # Export to PowerPoint
-    exporter = PPTExporter(template.file_path)
-    
-    # Create output filename
-    output_filename = f"case_study_{case_study.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pptx"
-    output_path = os.path.join(current_app.config['UPLOAD_FOLDER'], output_filename)
+    exporter = _exporter_for(template)
+    download_name = f"{secure_filename(case_study.project_name)}.pptx"
     
     try:
-        exporter.export_case_study(case_study, output_path)
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=f"{secure_filename(case_study.project_name)}.pptx",
-            mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation'
+        # Serve an identical earlier export from the cache
+        cache = ExportCache.from_config()
+        if cache is not None:
+            digest = ExportCache.digest(case_study, template.id, exporter.compile().sha256,
+                                        PPTExporter.export_date())
+            cached_path = cache.get(case_study.id, template.id, digest)
+            if cached_path:
+                return send_file(cached_path, as_attachment=True, download_name=download_name,
+                                 mimetype=PPTX_MIMETYPE)
+        
+        # Render into memory, spilling to a temporary file only for large decks
+        buffer = tempfile.SpooledTemporaryFile(
+            max_size=current_app.config.get('EXPORT_SPOOL_MAX_MEMORY', 8 * 1024 * 1024)
         )
+        exporter.export_case_study(case_study, buffer)
+        if cache is not None:
+            cache.put(case_study.id, template.id, digest, buffer)
     except Exception as e:
         return jsonify({'error': f'Export failed: {str(e)}'}), 500
-    finally:
-        # Clean up temporary file
-        try:
-            if os.path.exists(output_path):
-                os.remove(output_path)
-        except:
-            pass
+    
+    size = buffer.seek(0, os.SEEK_END)
+    buffer.seek(0)
+    response = Response(iter_file(buffer), mimetype=PPTX_MIMETYPE, direct_passthrough=True)
+    response.content_length = size
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
+
+
+def _iter_case_studies_by_id(ids, chunk_size=100):
+    """Load case studies in the given order, a chunk at a time"""
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        by_id = {cs.id: cs for cs in CaseStudy.query.filter(CaseStudy.id.in_(chunk))}
+        for cs_id in chunk:
+            if cs_id in by_id:
+                yield by_id[cs_id]
+
+
+def _export_selection(data):
+    """
+    Validate a batch export request body
+    
+    Returns ((ids, template, format), None), or (None, error response).
+    """
+    export_format = data.get('format', 'pptx')
+    if export_format not in ('pptx', 'zip'):
+        return None, (jsonify({'error': "format must be 'pptx' or 'zip'"}), 400)
+    
+    template = _export_template(data.get('template_id'))
+    if not template:
+        return None, (jsonify({'error': 'No template available. Please upload a template first.'}), 400)
+    
+    if 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return None, (jsonify({'error': 'ids must be a list of case study ids'}), 400)
+        found = {row.id for row in db.session.query(CaseStudy.id).filter(CaseStudy.id.in_(ids))}
+        missing = [i for i in ids if i not in found]
+        if missing:
+            return None, (jsonify({'error': f"Case studies not found: {', '.join(map(str, missing))}"}), 404)
+    elif isinstance(data.get('search'), dict):
+        criteria, error = _search_criteria(data['search'])
+        if error is not None:
+            return None, error
+        results, _ = SearchService.build_query(**criteria)
+        ids = [row.id for row in results.with_entities(CaseStudy.id)]
+    else:
+        return None, (jsonify({'error': 'Provide ids or search'}), 400)
+    
+    max_items = current_app.config.get('MAX_BATCH_EXPORT', 500)
+    if not ids:
+        return None, (jsonify({'error': 'No case studies to export'}), 400)
+    if len(ids) > max_items:
+        return None, (jsonify({'error': f'Too many case studies ({len(ids)}), the limit is {max_items}'}), 400)
+    
+    return (ids, template, export_format), None
+
+
+@main.route('/api/case-studies/export/pptx', methods=['POST'])
+def export_batch_to_pptx():
+    """
+    Export many case studies at once
+    
+    JSON body:
+        ids: Case study ids, in slide order; or
+        search: Search arguments (as for GET /api/case-studies) selecting them
+        template_id: Optional template, the default template otherwise
+        format: 'pptx' for one merged deck (default) or 'zip' for one
+            deck per case study
+    
+    The file is streamed while it is rendered, so memory use does not
+    grow with the number of case studies.
+    """
+    from app.ppt_export import PPTX_MIMETYPE
+    data = request.get_json() or {}
+    selection, error = _export_selection(data)
+    if error:
+        return error
+    ids, template, export_format = selection
+    
+    exporter = _exporter_for(template)
+    
+    def generate():
+        buffer = ChunkBuffer()
+        case_studies = _iter_case_studies_by_id(ids)
+        for _ in exporter.iter_export_batch(case_studies, buffer, as_zip=export_format == 'zip'):
+            yield buffer.drain()
+        yield buffer.drain()
+    
+    filename = f"case_studies_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=PPTX_MIMETYPE if export_format == 'pptx' else 'application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@main.route('/api/export-jobs', methods=['POST'])
+def submit_export_job():
+    """
+    Queue an export to run in the background
+    
+    Takes the same JSON body as POST /api/case-studies/export/pptx. Poll
+    the returned job until its status is 'finished', then download it.
+    """
+    data = request.get_json() or {}
+    selection, error = _export_selection(data)
+    if error:
+        return error
+    ids, template, export_format = selection
+    
+    job = export_jobs.submit(ids, template, export_format)
+    response = jsonify(_export_job_dict(job))
+    response.headers['Location'] = url_for('main.get_export_job', job_id=job.id)
+    return response, 202
+
+
+def _export_job_dict(job):
+    data = job.to_dict()
+    if job.status == 'finished':
+        data['download_url'] = url_for('main.download_export_job', job_id=job.id)
+    return data
+
+
+@main.route('/api/export-jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Get the status of an export job"""
+    job = ExportJob.query.get_or_404(job_id)
+    # Expired jobs are deleted by the next dispatch; polls only read them
+    if export_jobs.has_expired(job):
+        return jsonify({'error': 'Export job has expired'}), 404
+    if job.status in ('queued', 'running'):
+        # Picks up queued jobs and jobs orphaned by a restart
+        export_jobs.dispatch()
+        db.session.refresh(job)
+    return jsonify(_export_job_dict(job))
+
+
+@main.route('/api/export-jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    """Download the result of a finished export job"""
+    from app.ppt_export import PPTX_MIMETYPE
+    job = ExportJob.query.get_or_404(job_id)
+    if export_jobs.has_expired(job):
+        return jsonify({'error': 'Export job has expired'}), 404
+    if job.status != 'finished':
+        return jsonify({'error': f'Export job is {job.status}'}), 409
+    
+    return send_file(
+        job.result_path,
+        as_attachment=True,
+        download_name=job.download_name,
+        mimetype=PPTX_MIMETYPE if job.export_format == 'pptx' else 'application/zip'
+    )
 
 
 @main.route('/api/placeholder-guide', methods=['GET'])
 def get_placeholder_guide():
     """Get the placeholder guide for PowerPoint templates"""
+    from app.ppt_export import PPTExporter
     guide = PPTExporter.get_placeholder_guide()
     return jsonify({'guide': guide})
 
@@ -261,26 +913,22 @@ def get_placeholder_guide():
 @main.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get statistics about case studies"""
-    total = CaseStudy.query.count()
-    
-    # Count by industry
-    from sqlalchemy import func
-    by_industry = db.session.query(
-        CaseStudy.industry,
-        func.count(CaseStudy.id)
-    ).filter(
-        CaseStudy.industry.isnot(None)
-    ).group_by(
-        CaseStudy.industry
-    ).all()
+    etag = _etag('stats', changes.version(changes.CASE_STUDIES))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    
+    # Totals come from the counters maintained by app.facets
+    total = facets.get_total()
+    by_industry = facets.industry_counts()
     
     # Recent case studies
-    recent = CaseStudy.query.order_by(
+    recent = serialize_case_studies(CaseStudy.query.order_by(
         CaseStudy.created_at.desc()
-    ).limit(5).all()
+    ).limit(5))
     
-    return jsonify({
+    return _with_etag(jsonify({
         'total': total,
         'by_industry': [{'industry': ind, 'count': count} for ind, count in by_industry],
-        'recent': [cs.to_dict() for cs in recent]
-    })
+        'recent': recent
+    }), etag)
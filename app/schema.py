@@ -0,0 +1,60 @@
+"""
+Creating and upgrading the database schema
+
+Run once per deploy with `flask init-db`, not by every process that
+starts the app: with several workers each would otherwise take the write
+lock at boot to find nothing to do. create_app still migrates in-memory
+databases and debug runs, see migrates_on_boot.
+"""
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+from app import db, facets, fts, taxonomy
+from app.database import is_file_database
+
+
+def migrate():
+    """
+    Bring the database up to date; safe to run again
+
+    Creates missing tables, the nullable columns and indexes added to
+    existing ones since, and the FTS5 index and its triggers, then
+    backfills the taxonomy links and facet counters if they are missing.
+    """
+    db.create_all()
+    # create_all skips tables that exist; add columns and indexes introduced since
+    with db.engine.begin() as connection:
+        _add_columns(connection)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+    current_app.extensions['fts5'] = fts.init_fts(db.engine)
+    taxonomy.ensure_links()
+    facets.ensure_counts()
+
+
+def _add_columns(connection):
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                type_ = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {type_}')
+
+
+def migrates_on_boot(app):
+    """
+    Whether create_app should migrate the app's database itself
+
+    DATABASE_AUTO_MIGRATE decides if set. Otherwise in-memory databases,
+    which start out empty, and development servers in debug mode are
+    migrated, so a fresh checkout runs without `flask init-db`.
+    """
+    auto = app.config.get('DATABASE_AUTO_MIGRATE')
+    if auto is not None:
+        return auto
+    if app.debug:
+        return True
+    with app.app_context():
+        return not is_file_database(db.engine)
@@ -1,24 +1,178 @@
-from sqlalchemy import or_, and_
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import func, or_, and_
+from app import facets, fts, taxonomy
 from app.models import CaseStudy
+from app.serializers import rows_to_dicts
+
+# One page of keyset-paginated search results
+SearchPage = namedtuple('SearchPage', ['items', 'total', 'next_cursor'])
+
+
+def _encode_cursor(sort_by, descending, value, last_id):
+    """Encode the position after the last row of a page as an opaque token"""
+    payload = {'s': sort_by, 'd': descending, 'id': last_id, 'v': value}
+    if isinstance(value, datetime):
+        payload['v'] = value.isoformat()
+        payload['t'] = 'datetime'
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, sort_by, descending):
+    """Decode a cursor token into (value, last_id) for the given sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value, last_id = payload['v'], int(payload['id'])
+        if payload.get('t') == 'datetime':
+            value = datetime.fromisoformat(value)
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+    
+    if payload.get('s') != sort_by or payload.get('d') != descending:
+        raise ValueError('Cursor does not match the requested sort order')
+    return value, last_id
+
+
+def _after(sort_column, descending, value, last_id):
+    """
+    Keyset condition selecting the rows after (value, last_id)
+    
+    SQLite sorts NULLs first in ascending and last in descending order,
+    so rows with a NULL sort value need their own branch.
+    """
+    if descending:
+        if value is None:
+            return and_(sort_column.is_(None), CaseStudy.id < last_id)
+        return or_(
+            sort_column < value,
+            and_(sort_column == value, CaseStudy.id < last_id),
+            sort_column.is_(None)
+        )
+    if value is None:
+        return or_(
+            and_(sort_column.is_(None), CaseStudy.id > last_id),
+            sort_column.isnot(None)
+        )
+    return or_(
+        sort_column > value,
+        and_(sort_column == value, CaseStudy.id > last_id)
+    )
+
 
 class SearchService:
     """Handle search and filtering of case studies"""
     
+    # Columns results can be sorted (and paginated) by, besides 'relevance'
+    SORT_FIELDS = ('updated_at', 'created_at', 'project_name', 'client_name',
+                   'industry', 'project_year')
+    
     @staticmethod
     def search(query=None, industry=None, year=None, technologies=None, tags=None, 
-               confidential=None, sort_by='updated_at', sort_order='desc'):
+               confidential=None, sort_by='updated_at', sort_order='desc',
+               technologies_match='all', tags_match='all'):
         """
         Search case studies with various filters
         
+        Takes the same arguments as build_query and returns all matches.
+        """
+        results, _ = SearchService.build_query(
+            query=query, industry=industry, year=year, technologies=technologies,
+            tags=tags, confidential=confidential, sort_by=sort_by, sort_order=sort_order,
+            technologies_match=technologies_match, tags_match=tags_match
+        )
+        return results.all()
+    
+    @staticmethod
+    def normalize_criteria(**criteria):
+        """
+        Canonical form of build_query arguments
+        
+        Criteria that select the same rows in the same order normalize to
+        the same dictionary: case and order of technology and tag names,
+        industry case and surplus whitespace in the text query don't matter.
+        """
+        normalized = {}
+        for name, value in criteria.items():
+            if value is None or value == '':
+                continue
+            if name == 'query':
+                value = ' '.join(value.split())
+            elif name == 'industry':
+                value = facets.sql_lower(value)
+            elif name == 'year':
+                value = str(value).strip()
+            elif name in ('technologies', 'tags'):
+                value = ','.join(sorted(taxonomy.split_names(value)))
+            normalized[name] = value
+        return normalized
+    
+    @staticmethod
+    def search_page(limit, cursor=None, fields=None, **criteria):
+        """
+        Fetch one page of serialized search results using keyset pagination
+        
+        Args:
+            limit: Maximum number of case studies on the page
+            cursor: Token from a previous page's next_cursor, or None
+            fields: Optional subset of CaseStudy.FIELDS to include
+            **criteria: Search arguments as accepted by build_query
+        
+        Returns a SearchPage of case study dictionaries (as produced by
+        CaseStudy.to_dict); raises ValueError for a malformed cursor.
+        """
+        results, (sort_by, sort_column, descending) = SearchService.build_query(**criteria)
+        
+        total = results.order_by(None).count()
+        
+        if cursor:
+            value, last_id = _decode_cursor(cursor, sort_by, descending)
+            results = results.filter(_after(sort_column, descending, value, last_id))
+        
+        # Select plain columns plus the sort key, and one extra row to
+        # learn whether another page follows
+        fields = list(fields or CaseStudy.FIELDS)
+        selected = ['id'] + [f for f in fields if f not in ('id', 'attachments')]
+        rows = results.with_entities(
+            *[getattr(CaseStudy, f) for f in selected], sort_column
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(sort_by, descending, rows[-1][-1], rows[-1][0])
+        
+        return SearchPage(rows_to_dicts(rows, selected, fields), total, next_cursor)
+    
+    @staticmethod
+    def build_query(query=None, industry=None, year=None, technologies=None, tags=None,
+                    confidential=None, sort_by='updated_at', sort_order='desc',
+                    technologies_match='all', tags_match='all', max_candidates=None):
+        """
+        Build the filtered and sorted case study query
+        
         Args:
-            query: Text search query
-            industry: Filter by industry
+            query: Text search query (words match as prefixes,
+                "quoted text" matches as a phrase)
+            industry: Filter by industry (exact match, ignoring case)
             year: Filter by project year
-            technologies: Filter by technology (partial match)
-            tags: Filter by tag (partial match)
+            technologies: Filter by technologies, comma-separated (exact
+                match, ignoring case)
+            tags: Filter by tags, comma-separated (exact match, ignoring case)
             confidential: Filter by confidential status
-            sort_by: Field to sort by
+            sort_by: Field to sort by, or 'relevance' for bm25 ranking
             sort_order: 'asc' or 'desc'
+            technologies_match: 'all' to require every technology, 'any'
+                for at least one
+            tags_match: 'all' or 'any', as for technologies
+            max_candidates: Only consider the newest max_candidates text
+                matches (live search trades completeness for speed)
+        
+        Returns (query, (sort_by, sort_column, descending)). Ties on the
+        sort column are broken by id so the order is total.
         """
         # Start with base query
         results = CaseStudy.query
@@ -26,8 +180,16 @@ class SearchService:
         # Apply filters
         filters = []
         
+        # Full-text search through the FTS5 index when available
+        ranked = None
+        if query and fts.is_enabled():
+            match_query = fts.build_match_query(query)
+            if match_query:
+                ranked = fts.ranked_matches(match_query, max_candidates)
+                results = results.join(ranked, ranked.c.rowid == CaseStudy.id)
+        
         # Text search across multiple fields
-        if query:
+        if query and ranked is None:
             search_term = f"%{query}%"
             filters.append(
                 or_(
@@ -41,21 +203,24 @@ class SearchService:
                 )
             )
         
-        # Industry filter
+        # Industry filter (exact, ignoring case, to use the lower(industry) index)
         if industry:
-            filters.append(CaseStudy.industry.ilike(f"%{industry}%"))
+            filters.append(func.lower(CaseStudy.industry) == facets.sql_lower(industry))
         
         # Year filter
         if year:
             filters.append(CaseStudy.project_year == int(year))
         
-        # Technology filter
+        # Technology and tag filters through the normalized link tables
         if technologies:
-            filters.append(CaseStudy.technologies.ilike(f"%{technologies}%"))
+            filters.append(CaseStudy.id.in_(taxonomy.matching(
+                taxonomy.TECHNOLOGIES, technologies, match_all=technologies_match != 'any'
+            )))
         
-        # Tag filter
         if tags:
-            filters.append(CaseStudy.tags.ilike(f"%{tags}%"))
+            filters.append(CaseStudy.id.in_(taxonomy.matching(
+                taxonomy.TAGS, tags, match_all=tags_match != 'any'
+            )))
         
         # Confidential filter
         if confidential is not None:
@@ -65,45 +230,28 @@ class SearchService:
         if filters:
             results = results.filter(and_(*filters))
         
-        # Apply sorting
-        if hasattr(CaseStudy, sort_by):
-            sort_column = getattr(CaseStudy, sort_by)
-            if sort_order == 'desc':
-                results = results.order_by(sort_column.desc())
-            else:
-                results = results.order_by(sort_column.asc())
+        # Apply sorting (relevance needs a full-text match to rank by)
+        if sort_by == 'relevance' and ranked is None:
+            sort_by = 'updated_at'
+        elif sort_by != 'relevance' and sort_by not in SearchService.SORT_FIELDS:
+            sort_by = 'updated_at'
         
-        return results.all()
+        if sort_by == 'relevance':
+            # bm25 scores are lower for better matches
+            sort_column, descending = ranked.c.rank, False
+        else:
+            sort_column, descending = getattr(CaseStudy, sort_by), sort_order == 'desc'
+        
+        if descending:
+            results = results.order_by(sort_column.desc(), CaseStudy.id.desc())
+        else:
+            results = results.order_by(sort_column.asc(), CaseStudy.id.asc())
+        
+        return results, (sort_by, sort_column, descending)
     
     @staticmethod
     def get_facets():
-        """Get facets for filtering (industries, years, technologies)"""
-        from sqlalchemy import func
-        from app import db
-        
-        # Get unique industries
-        industries = db.session.query(
-            CaseStudy.industry,
-            func.count(CaseStudy.id).label('count')
-        ).filter(
-            CaseStudy.industry.isnot(None)
-        ).group_by(
-            CaseStudy.industry
-        ).all()
-        
-        # Get unique years
-        years = db.session.query(
-            CaseStudy.project_year,
-            func.count(CaseStudy.id).label('count')
-        ).filter(
-            CaseStudy.project_year.isnot(None)
-        ).group_by(
-            CaseStudy.project_year
-        ).order_by(
-            CaseStudy.project_year.desc()
-        ).all()
-        
-        return {
-            'industries': [{'name': ind, 'count': count} for ind, count in industries if ind],
-            'years': [{'year': year, 'count': count} for year, count in years if year]
-        }
+        """Get facets for filtering (industries, years, technologies, tags)"""
+        from app import facets
+        
+        return facets.get_facets()
@@ -0,0 +1,92 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select
+from app import db
+from app.instrumentation import timed
+from app.models import CaseStudy, Attachment
+
+# Keep IN lists below SQLite's default host parameter limit
+_IN_CHUNK_SIZE = 900
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def attachments_by_case_study(case_study_ids):
+    """
+    Load the attachments of many case studies with one query per chunk of ids
+
+    Returns a dict mapping case study id to its serialized attachments,
+    in the same format as Attachment.to_dict.
+    """
+    grouped = defaultdict(list)
+    ids = list(case_study_ids)
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        chunk = ids[start:start + _IN_CHUNK_SIZE]
+        rows = db.session.execute(
+            select(
+                Attachment.case_study_id,
+                Attachment.id,
+                Attachment.original_filename,
+                Attachment.file_type,
+                Attachment.uploaded_at
+            ).where(
+                Attachment.case_study_id.in_(chunk)
+            ).order_by(Attachment.id)
+        )
+        for case_study_id, att_id, filename, file_type, uploaded_at in rows:
+            grouped[case_study_id].append({
+                'id': att_id,
+                'filename': filename,
+                'file_type': file_type,
+                'uploaded_at': _isoformat(uploaded_at)
+            })
+    return grouped
+
+
+def serialize_case_studies(query, fields=None):
+    """
+    Serialize the case studies selected by an ORM query
+
+    Produces the same dictionaries as CaseStudy.to_dict, but selects plain
+    column tuples instead of building ORM instances, and loads attachments
+    for the whole result set at once instead of one lazy load per row.
+
+    Args:
+        query: CaseStudy query (filters, joins and ordering are kept)
+        fields: Optional subset of CaseStudy.FIELDS to include
+    """
+    fields = list(fields or CaseStudy.FIELDS)
+    columns = [f for f in fields if f != 'attachments']
+    selected = ['id'] + [f for f in columns if f != 'id']
+
+    rows = query.with_entities(*[getattr(CaseStudy, f) for f in selected]).all()
+    return rows_to_dicts(rows, selected, fields)
+
+
+def rows_to_dicts(rows, selected, fields):
+    """
+    Turn column tuples into case study dictionaries
+
+    Args:
+        rows: Sequences whose leading values are the `selected` columns
+        selected: Column names in the order they appear in each row
+        fields: Output fields, in output order
+    """
+    index = {name: i for i, name in enumerate(selected)}
+    plan = [(field, index[field]) for field in fields if field != 'attachments']
+
+    with timed('serialize'):
+        result = []
+        for row in rows:
+            result.append({field: _isoformat(row[i]) for field, i in plan})
+
+    if 'attachments' in fields and result:
+        id_index = index['id']
+        attachments = attachments_by_case_study(row[id_index] for row in rows)
+        with timed('serialize'):
+            for data, row in zip(result, rows):
+                data['attachments'] = attachments.get(row[id_index], [])
+
+    return result
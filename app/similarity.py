@@ -0,0 +1,448 @@
+"""
+Similar case studies by TF-IDF cosine similarity
+
+The index is a TF-IDF matrix over the challenge, solution, outcomes,
+technologies and tags of every case study. It is built in bulk and saved
+as NumPy arrays in two layouts: by row (CSR, the terms of each case study)
+and by column (CSC, the case studies of each term, which is what scoring
+reads). Workers open the arrays with memory mapping, so they share one
+copy through the page cache and nothing is recomputed at startup.
+
+Writes after a build are picked up incrementally. Case studies created or
+updated since the build are vectorized on the fly with the index's IDF
+weights, once per change of the case_studies counter (see app.changes).
+Their stale rows, like those of deleted case studies, are ignored. Once
+the changes outnumber SIMILARITY_REBUILD_FRACTION of the index, the next
+lookup rebuilds it in a background thread.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from sqlalchemy import or_, select
+from app import changes, db, facets, taxonomy
+from app.models import CaseStudy
+
+TEXT_FIELDS = ('challenge', 'solution', 'outcomes', 'technologies', 'tags')
+
+# Longer words are dropped; the vocabulary is stored with this fixed width
+MAX_TERM_LENGTH = 40
+
+STOP_WORDS = frozenset("""
+    a about after all also an and any are as at be been but by can could did do does
+    for from had has have how if in into is it its more most no not of on or other our
+    out over per so such than that the their them then there these they this those
+    through to up us was we were what when which while who will with within would you your
+""".split())
+
+# Saved arrays, in both layouts; see VectorIndex
+_ARRAYS = ('ids', 'terms', 'idf', 'row_ptr', 'row_terms', 'row_weights',
+           'col_ptr', 'col_rows', 'col_weights')
+_CURRENT = 'CURRENT'
+_LOCK = 'build.lock'
+
+# Versions kept besides the current one, for workers still opening them
+_KEEP_PREVIOUS = 1
+
+# Writes flushed just before a build may commit after its snapshot was
+# read; treating them as changed costs little and loses nothing
+_BUILD_MARGIN = timedelta(minutes=1)
+
+# A build lock older than this was left by a process that died
+_STALE_LOCK_SECONDS = 3600
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def terms_of(challenge, solution, outcomes, technologies, tags):
+    """Terms of a case study: the words of its text and its technology and tag names"""
+    terms = []
+    for text in (challenge, solution, outcomes, technologies, tags):
+        for word in _WORD.findall((text or '').lower()):
+            if 1 < len(word) <= MAX_TERM_LENGTH and word not in STOP_WORDS and not word.isdigit():
+                terms.append(word)
+    for kind, value in ((taxonomy.TECHNOLOGIES, technologies), (taxonomy.TAGS, tags)):
+        for key in taxonomy.split_names(value):
+            term = f'{kind.dimension}:{key}'
+            if len(term) <= MAX_TERM_LENGTH:
+                terms.append(term)
+    return terms
+
+
+def _idf(document_frequency, documents):
+    return np.log((1 + documents) / (1 + document_frequency)) + 1
+
+
+class VectorIndex:
+    """
+    A TF-IDF matrix of case studies, L2-normalized by row
+
+    Attributes:
+        ids: Case study ids in ascending order; row i belongs to ids[i]
+        terms: Vocabulary in sorted order; column j is terms[j]
+        idf: IDF weight of each column
+        row_ptr, row_terms, row_weights: The matrix by row (CSR)
+        col_ptr, col_rows, col_weights: The matrix by column (CSC)
+        built_at: Case studies updated after this may be stale in the matrix
+        version: Folder name of the saved index, None until saved
+    """
+
+    def __init__(self, arrays, built_at, version=None):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.built_at = built_at
+        self.version = version
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    @property
+    def max_id(self):
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def rows_of(self, ids):
+        """Rows of the given case study ids, skipping ids not in the index"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids) or not self.size:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, ids), self.size - 1)
+        return rows[self.ids[rows] == ids]
+
+    def columns(self, terms):
+        """Column of each term, -1 for terms outside the vocabulary"""
+        terms = np.array(terms, dtype=f'<U{MAX_TERM_LENGTH}')
+        if not len(terms) or not len(self.terms):
+            return np.full(len(terms), -1)
+        columns = np.minimum(np.searchsorted(self.terms, terms), len(self.terms) - 1)
+        return np.where(self.terms[columns] == terms, columns, -1)
+
+    def row_vector(self, row):
+        """Term to weight of a row"""
+        start, end = self.row_ptr[row], self.row_ptr[row + 1]
+        return dict(zip(self.terms[self.row_terms[start:end]].tolist(),
+                        self.row_weights[start:end].tolist()))
+
+    def vectorize(self, terms):
+        """Term to weight of a document that is not in the matrix, using its IDF"""
+        counts = Counter(terms)
+        if not counts:
+            return {}
+        columns = self.columns(list(counts))
+        unseen = _idf(0, self.size)
+        weights = np.array([1 + np.log(count) for count in counts.values()])
+        weights *= np.where(columns >= 0, self.idf[np.maximum(columns, 0)] if len(self.idf) else unseen, unseen)
+        weights /= np.sqrt(np.sum(weights ** 2))
+        return dict(zip(counts, weights.tolist()))
+
+    def scores(self, vector):
+        """Cosine similarity of every row with a normalized term to weight vector"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        terms = list(vector)
+        for column, term in zip(self.columns(terms), terms):
+            if column < 0:
+                continue
+            start, end = self.col_ptr[column], self.col_ptr[column + 1]
+            # A column lists each row once, so the fancy-indexed add is safe
+            scores[self.col_rows[start:end]] += vector[term] * self.col_weights[start:end]
+        return scores
+
+
+def build(rows, built_at):
+    """
+    Build an index from (id, *TEXT_FIELDS) rows in ascending id order
+
+    Term frequencies are dampened (1 + log tf) and IDF is smoothed,
+    log((1 + n) / (1 + df)) + 1.
+    """
+    vocabulary = {}
+    ids, row_columns, row_counts = [], [], []
+    for id_, *texts in rows:
+        counts = Counter(terms_of(*texts))
+        ids.append(id_)
+        row_columns.append([vocabulary.setdefault(term, len(vocabulary)) for term in counts])
+        row_counts.append(list(counts.values()))
+
+    documents = len(ids)
+    terms = sorted(vocabulary)
+    remap = np.empty(len(terms), dtype=np.int32)
+    for column, term in enumerate(terms):
+        remap[vocabulary[term]] = column
+
+    lengths = np.array([len(columns) for columns in row_columns], dtype=np.int64)
+    row_ptr = np.zeros(documents + 1, dtype=np.int64)
+    np.cumsum(lengths, out=row_ptr[1:])
+    row_of = np.repeat(np.arange(documents, dtype=np.int32), lengths)
+    row_terms = remap[np.fromiter((c for columns in row_columns for c in columns), dtype=np.int64,
+                                  count=int(row_ptr[-1]))]
+    counts = np.fromiter((c for row in row_counts for c in row), dtype=np.float64, count=int(row_ptr[-1]))
+
+    document_frequency = np.bincount(row_terms, minlength=len(terms))
+    idf = _idf(document_frequency, documents)
+    weights = (1 + np.log(counts)) * idf[row_terms]
+    norms = np.sqrt(np.bincount(row_of, weights=weights ** 2, minlength=documents))
+    weights /= norms[row_of]
+
+    # Columns ascending within each row, rows ascending within each column
+    order = np.lexsort((row_terms, row_of))
+    row_terms, weights = row_terms[order].astype(np.int32), weights[order].astype(np.float32)
+    by_column = np.argsort(row_terms, kind='stable')
+    col_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(document_frequency, out=col_ptr[1:])
+
+    return VectorIndex({
+        'ids': np.array(ids, dtype=np.int64),
+        'terms': np.array(terms, dtype=f'<U{MAX_TERM_LENGTH}'),
+        'idf': idf.astype(np.float32),
+        'row_ptr': row_ptr,
+        'row_terms': row_terms,
+        'row_weights': weights,
+        'col_ptr': col_ptr,
+        'col_rows': row_of[by_column],
+        'col_weights': weights[by_column],
+    }, built_at)
+
+
+def save(index, folder):
+    """Write an index to a new version folder and make it the current one"""
+    version = f"{index.built_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(folder, version)
+    os.makedirs(path)
+    for name in _ARRAYS:
+        np.save(os.path.join(path, f'{name}.npy'), getattr(index, name))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'built_at': index.built_at.isoformat(), 'size': index.size}, f)
+
+    temp_path = os.path.join(folder, f'.{_CURRENT}.{version}')
+    with open(temp_path, 'w') as f:
+        f.write(version)
+    os.replace(temp_path, os.path.join(folder, _CURRENT))
+    index.version = version
+
+    # Processes that mapped an older version keep it readable after removal
+    versions = sorted(name for name in os.listdir(folder)
+                      if os.path.isdir(os.path.join(folder, name)) and name != version)
+    for name in versions[:len(versions) - _KEEP_PREVIOUS]:
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    return version
+
+
+def current_version(folder):
+    """Name of the current saved version, or None"""
+    try:
+        with open(os.path.join(folder, _CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load(folder, version):
+    """Open a saved index, memory-mapping its arrays"""
+    path = os.path.join(folder, version)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in _ARRAYS:
+        file = os.path.join(path, f'{name}.npy')
+        # An empty file can't be mapped
+        arrays[name] = np.load(file, mmap_mode='r' if meta['size'] else None)
+    return VectorIndex(arrays, datetime.fromisoformat(meta['built_at']), version)
+
+
+def _lock_held(path):
+    """Whether a build lock exists and was not left by a process that died"""
+    try:
+        return time.time() - os.path.getmtime(path) <= _STALE_LOCK_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def _build_lock(folder):
+    """Yield whether this process got the build lock of folder"""
+    path = os.path.join(folder, _LOCK)
+    if os.path.exists(path) and not _lock_held(path):
+        os.remove(path)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        yield False
+        return
+    os.close(fd)
+    try:
+        yield True
+    finally:
+        os.remove(path)
+
+
+class SimilarityIndex:
+    """The saved index of an app as seen by this process, with the writes made since"""
+
+    def __init__(self, folder, rebuild_fraction=0.1, rebuild_min_changes=100):
+        self.folder = folder
+        self.rebuild_fraction = rebuild_fraction
+        self.rebuild_min_changes = rebuild_min_changes
+        self._index = None
+        self._changes = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    @classmethod
+    def from_config(cls):
+        """Index of the current app"""
+        app = current_app._get_current_object()
+        index = app.extensions.get('similarity')
+        if index is None:
+            folder = app.config.get('SIMILARITY_INDEX_FOLDER') or \
+                os.path.join(app.config['UPLOAD_FOLDER'], 'similarity')
+            index = app.extensions['similarity'] = cls(
+                folder,
+                app.config.get('SIMILARITY_REBUILD_FRACTION', 0.1),
+                app.config.get('SIMILARITY_REBUILD_MIN_CHANGES', 100)
+            )
+        return index
+
+    def rebuild(self, wait=True):
+        """
+        Build the index from the database and save it
+
+        Another process building at the same time is waited for (or, with
+        wait=False, left to it). Returns the new index, or None if another
+        process built it.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        while True:
+            with _build_lock(self.folder) as locked:
+                if locked:
+                    built_at = datetime.utcnow() - _BUILD_MARGIN
+                    columns = [getattr(CaseStudy, field) for field in TEXT_FIELDS]
+                    rows = db.session.execute(
+                        select(CaseStudy.id, *columns).order_by(CaseStudy.id).execution_options(yield_per=1000)
+                    )
+                    index = build(rows, built_at)
+                    save(index, self.folder)
+                    return index
+            if not wait:
+                return None
+            while _lock_held(os.path.join(self.folder, _LOCK)):
+                time.sleep(0.2)
+            # Try again if the other build failed
+            if current_version(self.folder) is not None:
+                return None
+
+    def rebuild_in_background(self):
+        """Rebuild in a thread of this process unless one is running"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    self.rebuild(wait=False)
+            finally:
+                self._building = False
+
+        threading.Thread(target=run, name='similarity-rebuild', daemon=True).start()
+
+    def current(self):
+        """
+        The current saved index, or None if there is none yet
+
+        Without one, a build is started in the background: reading and
+        vectorizing a large library takes too long for a request.
+        """
+        version = current_version(self.folder)
+        if version is None:
+            self.rebuild_in_background()
+            return None
+        index = self._index
+        if index is None or index.version != version:
+            index = self._index = load(self.folder, version)
+        return index
+
+    def build_if_stale(self, changed=0):
+        """
+        Rebuild now if there is no index, or if `changed` case studies would
+        make the next lookup rebuild it; for commands, so that requests find
+        an index ready. Returns the new index, or None if none was built.
+        """
+        version = current_version(self.folder)
+        if version is not None:
+            size = load(self.folder, version).size
+            if changed <= max(self.rebuild_min_changes, self.rebuild_fraction * size):
+                return None
+        return self.rebuild()
+
+    def changed(self, index):
+        """Vectors of the case studies created or updated since index was built"""
+        key = (index.version, changes.version(changes.CASE_STUDIES))
+        cached = self._changes
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        columns = [getattr(CaseStudy, field) for field in TEXT_FIELDS]
+        rows = db.session.execute(select(CaseStudy.id, *columns).where(or_(
+            CaseStudy.id > index.max_id, CaseStudy.updated_at > index.built_at
+        )))
+        vectors = {id_: index.vectorize(terms_of(*texts)) for id_, *texts in rows}
+        self._changes = (key, vectors)
+        return vectors
+
+    def similar(self, case_study_id, limit=10):
+        """
+        The case studies most like one, best first
+
+        Returns up to `limit` (case study id, cosine similarity) pairs of
+        existing case studies with some similarity, or None while there is
+        no index yet (see current).
+        """
+        index = self.current()
+        if index is None:
+            return None
+        changed = self.changed(index)
+
+        vector = changed.get(case_study_id)
+        if vector is None:
+            own = index.rows_of([case_study_id])
+            if not len(own):
+                return []
+            vector = index.row_vector(own[0])
+
+        scores = index.scores(vector)
+        # Rows of rewritten case studies are stale, and none is like itself
+        scores[index.rows_of(list(changed) + [case_study_id])] = 0
+
+        # Deleted case studies still have rows; rank enough to skip them
+        added = sum(1 for id_ in changed if id_ > index.max_id)
+        deleted = max(0, index.size + added - facets.get_total())
+        candidates = min(limit + deleted, index.size)
+        ranked = []
+        if candidates:
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            ranked = [(int(index.ids[row]), float(scores[row])) for row in top if scores[row] > 0]
+        for id_, other in changed.items():
+            if id_ != case_study_id:
+                score = sum(weight * other.get(term, 0.0) for term, weight in vector.items())
+                if score > 0:
+                    ranked.append((id_, score))
+        ranked.sort(key=lambda pair: (-pair[1], pair[0]))
+
+        existing = set()
+        ids = [id_ for id_, _ in ranked[:limit + deleted]]
+        if ids:
+            existing.update(db.session.execute(select(CaseStudy.id).where(CaseStudy.id.in_(ids))).scalars())
+        results = [(id_, score) for id_, score in ranked if id_ in existing][:limit]
+
+        if len(changed) + deleted > max(self.rebuild_min_changes, self.rebuild_fraction * index.size):
+            self.rebuild_in_background()
+        return results
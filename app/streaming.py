@@ -0,0 +1,37 @@
+class ChunkBuffer:
+    """
+    Write-only, non-seekable file object collecting bytes between drains
+
+    Lets writers that expect a file (zipfile, csv) feed a streaming
+    response: write into the buffer, then yield drain() from the
+    response generator. Only the bytes written since the last drain are
+    held in memory.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget everything written so far"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_file(file, chunk_size=64 * 1024):
+    """Yield a file object's remaining contents in chunks, then close it"""
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
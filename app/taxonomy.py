@@ -0,0 +1,175 @@
+from collections import Counter, namedtuple
+from sqlalchemy import event, func, inspect, select
+from flask_sqlalchemy.session import Session
+from app import db, facets
+from app.models import CaseStudy, Tag, Technology, case_study_tags, case_study_technologies
+
+# Keep IN lists below SQLite's default host parameter limit
+_IN_CHUNK_SIZE = 900
+
+# A comma-separated case study column and the tables normalizing it
+Kind = namedtuple('Kind', ['attribute', 'dimension', 'model', 'links', 'link_column'])
+
+TECHNOLOGIES = Kind('technologies', 'technology', Technology, case_study_technologies, 'technology_id')
+TAGS = Kind('tags', 'tag', Tag, case_study_tags, 'tag_id')
+KINDS = (TECHNOLOGIES, TAGS)
+
+
+def name_key(name):
+    """Matching key of a technology or tag name"""
+    return name.strip().casefold()
+
+
+def split_names(value):
+    """Map of key to name for the distinct items of a comma-separated value"""
+    names = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if item:
+            names.setdefault(name_key(item), item)
+    return names
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), _IN_CHUNK_SIZE):
+        yield items[start:start + _IN_CHUNK_SIZE]
+
+
+def _resolve(connection, kind, names):
+    """Map key to (id, canonical name), inserting names not seen before"""
+    table = kind.model.__table__
+    resolved = {}
+    for chunk in _chunks(names):
+        for key, id_, name in connection.execute(
+            select(table.c.key, table.c.id, table.c.name).where(table.c.key.in_(chunk))
+        ):
+            resolved[key] = (id_, name)
+    for key in names:
+        if key not in resolved:
+            result = connection.execute(table.insert().values(key=key, name=names[key]))
+            resolved[key] = (result.inserted_primary_key[0], names[key])
+    return resolved
+
+
+def link(connection, kind, values):
+    """
+    Link case studies to the items of their column values
+
+    Args:
+        connection: Connection of the current transaction
+        kind: TECHNOLOGIES or TAGS
+        values: Mapping of case study id to its comma-separated value
+
+    Returns a Counter of facet deltas for the added links.
+    """
+    per_case_study = {case_study_id: split_names(value) for case_study_id, value in values.items()}
+    names = {}
+    for items in per_case_study.values():
+        for key, name in items.items():
+            names.setdefault(key, name)
+    if not names:
+        return Counter()
+
+    resolved = _resolve(connection, kind, names)
+    rows = []
+    deltas = Counter()
+    for case_study_id, items in per_case_study.items():
+        for key in items:
+            item_id, name = resolved[key]
+            rows.append({'case_study_id': case_study_id, kind.link_column: item_id})
+            deltas[(kind.dimension, name)] += 1
+    connection.execute(kind.links.insert(), rows)
+    return deltas
+
+
+def unlink(connection, kind, case_study_ids):
+    """Remove the links of case studies; returns a Counter of the removed links"""
+    links, table = kind.links, kind.model.__table__
+    deltas = Counter()
+    for chunk in _chunks(case_study_ids):
+        names = connection.execute(
+            select(table.c.name).join(links, links.c[kind.link_column] == table.c.id)
+            .where(links.c.case_study_id.in_(chunk))
+        )
+        deltas.update((kind.dimension, name) for name, in names)
+        connection.execute(links.delete().where(links.c.case_study_id.in_(chunk)))
+    return deltas
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_links(session, flush_context):
+    """Relink case studies whose technologies or tags were written in this flush"""
+    new = [obj for obj in session.new if isinstance(obj, CaseStudy)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, CaseStudy)]
+    dirty = [obj for obj in session.dirty if isinstance(obj, CaseStudy) and obj not in session.deleted]
+    if not (new or deleted or dirty):
+        return
+
+    connection = session.connection()
+    deltas = Counter()
+    for kind in KINDS:
+        changed = [obj for obj in dirty if inspect(obj).attrs[kind.attribute].history.has_changes()]
+        stale = [obj.id for obj in deleted + changed]
+        if stale:
+            deltas.subtract(unlink(connection, kind, stale))
+        deltas.update(link(connection, kind, {obj.id: getattr(obj, kind.attribute) for obj in new + changed}))
+    facets.apply_deltas(connection, deltas)
+
+
+def matching(kind, names, match_all=True):
+    """
+    Select the ids of case studies having the given items
+
+    Args:
+        kind: TECHNOLOGIES or TAGS
+        names: Comma-separated string or list of names, matched exactly
+            (ignoring case)
+        match_all: Require every name (AND) rather than any of them (OR)
+    """
+    if isinstance(names, str):
+        names = [names]
+    keys = {key for value in names for key in split_names(value)}
+    links, table = kind.links, kind.model.__table__
+    query = select(links.c.case_study_id).join(
+        table, table.c.id == links.c[kind.link_column]
+    ).where(table.c.key.in_(keys))
+    if match_all and len(keys) > 1:
+        query = query.group_by(links.c.case_study_id).having(func.count() == len(keys))
+    return query
+
+
+def item_counts(kind):
+    """(name, number of case studies) for every linked item, counted by the database"""
+    links, table = kind.links, kind.model.__table__
+    return db.session.execute(
+        select(table.c.name, func.count()).join(links, links.c[kind.link_column] == table.c.id)
+        .group_by(table.c.id)
+    ).all()
+
+
+def backfill():
+    """Rebuild every link from the comma-separated columns, recount facets and commit"""
+    connection = db.session.connection()
+    rows = connection.execute(
+        select(CaseStudy.__table__.c.id, CaseStudy.__table__.c.technologies, CaseStudy.__table__.c.tags)
+    ).all()
+    for kind in KINDS:
+        connection.execute(kind.links.delete())
+    for start in range(0, len(rows), _IN_CHUNK_SIZE):
+        chunk = rows[start:start + _IN_CHUNK_SIZE]
+        link(connection, TECHNOLOGIES, {id_: technologies for id_, technologies, _ in chunk})
+        link(connection, TAGS, {id_: tags for id_, _, tags in chunk})
+    return facets.rebuild()
+
+
+def ensure_links():
+    """Backfill the link tables of a database created before they existed"""
+    linked = any(db.session.execute(select(kind.links.c.case_study_id).limit(1)).first() for kind in KINDS)
+    if linked:
+        return
+    unlinked = db.session.query(CaseStudy.id).filter(
+        (func.coalesce(CaseStudy.technologies, '') != '') | (func.coalesce(CaseStudy.tags, '') != '')
+    ).first()
+    if unlinked is not None:
+        backfill()
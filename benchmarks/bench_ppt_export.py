@@ -0,0 +1,101 @@
+"""
+Benchmark PowerPoint export on a large template
+
+    python -m benchmarks.bench_ppt_export [slides]
+
+Compares the original approach (load the package with python-pptx, test
+every placeholder against every run) with PPTExporter's compiled template
+and single-pass substitution, cold (first export) and warm.
+"""
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+from pptx import Presentation
+from pptx.util import Inches
+
+from app.ppt_export import PPTExporter
+from benchmarks.common import best_of
+
+
+def build_template(path, slides=100):
+    """A template whose slides mix placeholders, split placeholders, tables and plain text"""
+    prs = Presentation()
+    for i in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = f'{{{{PROJECT_NAME}}}} - part {i}'
+        body = slide.shapes.add_textbox(Inches(1), Inches(1.5), Inches(8), Inches(3)).text_frame
+        body.text = 'Challenge: {{CHALLENGE}}'
+        for line in ('Solution: {{SOLUTION}}', 'Delivered with {{TECHNOLOGIES}}',
+                     'Plain text without any placeholder at all.'):
+            body.add_paragraph().text = line
+        split = body.add_paragraph()
+        for text in ('Client: {{CLI', 'ENT}} ({{YEAR}})'):
+            split.add_run().text = text
+        table = slide.shapes.add_table(3, 2, Inches(1), Inches(5), Inches(8), Inches(1.5)).table
+        for row, (label, value) in enumerate((('Team', '{{TEAM_SIZE}}'), ('Duration', '{{DURATION}}'),
+                                               ('Exported', '{{EXPORT_DATE}}'))):
+            table.cell(row, 0).text = label
+            table.cell(row, 1).text = value
+    prs.save(path)
+
+
+def sample_case_study():
+    values = {field: f'{field} value ' * 10 for field in PPTExporter.PLACEHOLDERS.values()}
+    values.update(project_year=2024, team_size=8, duration_months=6)
+    return SimpleNamespace(**values)
+
+
+def export_baseline(template_path, case_study, output_path):
+    """The per-run, per-placeholder export this module replaced"""
+    prs = Presentation(template_path)
+    replacements = PPTExporter(template_path)._build_replacements(case_study)
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                for paragraph in shape.text_frame.paragraphs:
+                    for run in paragraph.runs:
+                        text = run.text
+                        for placeholder, value in replacements.items():
+                            if placeholder in text:
+                                text = text.replace(placeholder, value)
+                        run.text = text
+            if getattr(shape, 'has_table', False):
+                for row in shape.table.rows:
+                    for cell in row.cells:
+                        text = cell.text
+                        for placeholder, value in replacements.items():
+                            if placeholder in text:
+                                text = text.replace(placeholder, value)
+                        cell.text = text
+    prs.save(output_path)
+
+
+def main(slides=100):
+    workdir = tempfile.mkdtemp(prefix='bench_pptx_')
+    template_path = os.path.join(workdir, 'template.pptx')
+    output_path = os.path.join(workdir, 'out.pptx')
+    build_template(template_path, slides)
+    case_study = sample_case_study()
+    exporter = PPTExporter(template_path)
+
+    def cold():
+        PPTExporter.template_cache.discard(os.path.abspath(template_path))
+        exporter.export_case_study(case_study, output_path)
+
+    results = (
+        ('baseline (python-pptx)', best_of(lambda: export_baseline(template_path, case_study, output_path))[0]),
+        ('compiled, cold', best_of(cold)[0]),
+        ('compiled, warm', best_of(lambda: exporter.export_case_study(case_study, output_path))[0]),
+    )
+    for name, seconds in results:
+        print(f'{name:>24}: {seconds * 1000:8.1f} ms  ({slides} slides)')
+
+    # The split placeholder is only handled by the compiled path
+    text = Presentation(output_path).slides[0].shapes[1].text_frame.paragraphs[4].text
+    print(f'{"split placeholder":>24}: {text!r}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,66 @@
+"""
+Compare per-instance CaseStudy.to_dict against the bulk serializer
+
+    python -m benchmarks.bench_serialization [rows]
+
+The fixture gives every third case study two attachments, so the old path
+pays one lazy attachment SELECT per row.
+"""
+import sys
+from datetime import datetime
+
+from app import db
+from app.models import Attachment, CaseStudy
+from app.serializers import serialize_case_studies
+from benchmarks.common import StatementCounter, best_of, make_app
+
+
+def seed(rows):
+    """Insert `rows` case studies with attachments on every third one"""
+    now = datetime.utcnow()
+    db.session.execute(db.insert(CaseStudy), [{
+        'project_name': f'Project {i}',
+        'client_name': f'Client {i % 500}',
+        'industry': ('Healthcare', 'Finance', 'Retail', 'Energy')[i % 4],
+        'project_year': 2015 + i % 10,
+        'challenge': 'Legacy systems slowed every release. ' * 20,
+        'solution': 'Migrated the platform to managed cloud services. ' * 20,
+        'outcomes': 'Release cadence went from quarterly to weekly. ' * 20,
+        'technologies': 'AWS,Python,Terraform',
+        'tags': 'cloud,migration',
+        'confidential': False,
+        'created_at': now,
+        'updated_at': now,
+    } for i in range(rows)])
+    db.session.execute(db.insert(Attachment), [{
+        'filename': f'{i}-{n}.pdf',
+        'original_filename': f'brief-{n}.pdf',
+        'file_path': f'/tmp/{i}-{n}.pdf',
+        'file_type': 'pdf',
+        'case_study_id': i,
+    } for i in range(1, rows + 1, 3) for n in range(2)])
+    db.session.commit()
+
+
+def main(rows=10000):
+    app = make_app()
+    with app.app_context():
+        seed(rows)
+        query = CaseStudy.query.order_by(CaseStudy.updated_at.desc())
+
+        def orm_to_dict():
+            db.session.expire_all()
+            return [cs.to_dict() for cs in query.all()]
+
+        def bulk():
+            return serialize_case_studies(query)
+
+        for name, func in (('to_dict', orm_to_dict), ('serialize_case_studies', bulk)):
+            with StatementCounter(db.engine) as counter:
+                func()
+            seconds, _ = best_of(func, repeat=3)
+            print(f'{name:>24}: {seconds * 1000:8.1f} ms  {counter.count:6d} statements  ({rows} rows)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
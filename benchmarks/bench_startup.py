@@ -0,0 +1,249 @@
+"""
+Startup time and memory of app processes and of a gunicorn server
+
+    python -m benchmarks.bench_startup [--rows 20000] [--repeat 5] [--workers 4]
+                                       [--output results.json]
+
+Seeds a database file (benchmarks.datagen) and migrates it as
+`flask init-db` would, then measures:
+
+- create_app in a fresh interpreter, as a worker starts now, with the
+  schema work create_app used to do on every boot, and with that and the
+  modules requests import lazily (the old import set): seconds to a ready
+  app and peak RSS;
+- if gunicorn is installed, a server with and without preload_app:
+  seconds until every worker answers, and the memory of the master and
+  workers together (PSS, which splits shared pages between the processes
+  sharing them) after boot and after every worker served similar-case
+  lookups and template exports.
+
+Linux only: memory is read from /proc.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROCESS_SCENARIOS = (
+    ('create_app', {}, False),
+    ('create_app+migrate', {'DATABASE_AUTO_MIGRATE': '1'}, False),
+    ('create_app+migrate+eager', {'DATABASE_AUTO_MIGRATE': '1'}, True),
+)
+
+CHILD = '''
+import time
+from benchmarks.bench_startup import server_app
+start = time.perf_counter()
+app = server_app()
+if {eager}:
+    from app import preload
+    preload()
+elapsed = time.perf_counter() - start
+# Unlike ru_maxrss, VmHWM doesn't count the parent's memory before exec
+with open('/proc/self/status') as f:
+    peak = next(line.split()[1] for line in f if line.startswith('VmHWM:'))
+print(elapsed, peak)
+'''
+
+
+def _config(workdir):
+    from config import Config
+
+    class StartupConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, 'app.db')}"
+        DATABASE_AUTO_MIGRATE = os.environ.get('DATABASE_AUTO_MIGRATE') == '1'
+        UPLOAD_FOLDER = workdir
+        TEMPLATE_FOLDER = os.path.join(workdir, 'templates')
+        ATTACHMENTS_FOLDER = os.path.join(workdir, 'attachments')
+        EXPORT_CACHE_ENABLED = False
+        SEARCH_CACHE_ENABLED = False
+        SIMILARITY_INDEX_FOLDER = os.path.join(workdir, 'similarity')
+
+        @staticmethod
+        def init_app(app):
+            os.makedirs(StartupConfig.TEMPLATE_FOLDER, exist_ok=True)
+
+    return StartupConfig
+
+
+def server_app():
+    """The app the benchmark processes serve, on the database in BENCH_WORKDIR"""
+    from app import create_app
+    return create_app(_config(os.environ['BENCH_WORKDIR']))
+
+
+def prepare(workdir, rows):
+    """Seed and migrate the database, build the similarity index, upload a template"""
+    from app import create_app, db, schema
+    from app.similarity import SimilarityIndex
+    from benchmarks.bench_ppt_export import build_template
+    from benchmarks.datagen import seed_database
+
+    app = create_app(_config(workdir))
+    with app.app_context():
+        schema.migrate()
+        seed_database(rows)
+        SimilarityIndex.from_config().rebuild()
+        db.session.remove()
+    path = os.path.join(workdir, 'template.pptx')
+    build_template(path, 1)
+    with open(path, 'rb') as f:
+        response = app.test_client().post('/api/templates', data={'name': 'Bench', 'is_default': 'true', 'file': f})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _env(workdir, **extra):
+    return dict(os.environ, BENCH_WORKDIR=workdir, PYTHONPATH=ROOT, **extra)
+
+
+def process_scenarios(workdir, repeat):
+    results = []
+    for name, env, eager in PROCESS_SCENARIOS:
+        seconds, peaks = [], []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', CHILD.format(eager=eager)], cwd=ROOT,
+                                    env=_env(workdir, **env), capture_output=True, text=True, check=True)
+            elapsed, peak = output.stdout.split()
+            seconds.append(float(elapsed))
+            peaks.append(int(peak))
+        results.append({
+            'scenario': name,
+            'median_ms': round(sorted(seconds)[len(seconds) // 2] * 1000, 1),
+            'peak_rss_mb': round(sorted(peaks)[len(peaks) // 2] / 1024, 1),
+        })
+    return results
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name in parentheses may contain spaces
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+    return children
+
+
+def _memory(pids):
+    """Summed PSS and RSS of the processes, in MB"""
+    totals = {'Pss': 0, 'Rss': 0}
+    for pid in pids:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in totals:
+                    totals[key] += int(value.split()[0])
+    return {'pss_mb': round(totals['Pss'] / 1024, 1), 'rss_mb': round(totals['Rss'] / 1024, 1)}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _get(url, data=None):
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+
+def server_scenarios(workdir, workers, requests_per_worker=10):
+    results = []
+    for preload in (False, True):
+        port = _free_port()
+        base = f'http://127.0.0.1:{port}'
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'benchmarks.bench_startup:server_app()'], cwd=ROOT,
+            env=_env(workdir, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(workers),
+                     GUNICORN_PRELOAD='1' if preload else '0'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError('gunicorn exited during startup')
+                try:
+                    if len(_children(server.pid)) == workers:
+                        # Every worker has to answer once before boot counts as done
+                        for _ in range(workers * 2):
+                            _get(f'{base}/api/suggestions?q=a')
+                        break
+                except OSError:
+                    pass
+                time.sleep(0.01)
+            boot = time.perf_counter() - start
+            pids = [server.pid] + _children(server.pid)
+            booted = _memory(pids)
+
+            # Have every worker load the similarity index and the exporter
+            for i in range(workers * requests_per_worker):
+                _get(f'{base}/api/case-studies/{i + 1}/similar')
+                _get(f'{base}/api/case-studies/export/pptx', json.dumps({'ids': [i + 1]}).encode())
+            results.append({
+                'scenario': 'gunicorn+preload' if preload else 'gunicorn',
+                'workers': workers,
+                'boot_ms': round(boot * 1000, 1),
+                'booted': booted,
+                'warm': _memory(pids),
+            })
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def run(rows, repeat, workers):
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    print(f'Seeding {rows} case studies in {workdir}', file=sys.stderr)
+    prepare(workdir, rows)
+    results = process_scenarios(workdir, repeat)
+    for result in results:
+        print(f'{result["scenario"]:>26}: {result["median_ms"]:8.1f} ms median  '
+              f'{result["peak_rss_mb"]:6.1f} MB peak RSS', file=sys.stderr)
+    if importlib.util.find_spec('gunicorn') is None:
+        print('gunicorn is not installed, skipping the server scenarios', file=sys.stderr)
+    else:
+        for result in server_scenarios(workdir, workers):
+            results.append(result)
+            print(f'{result["scenario"]:>26}: {result["boot_ms"]:8.1f} ms to boot  '
+                  f'{result["booted"]["pss_mb"]:6.1f} MB PSS booted  '
+                  f'{result["warm"]["pss_mb"]:6.1f} MB PSS warm ({result["warm"]["rss_mb"]} MB RSS)',
+                  file=sys.stderr)
+    return {'rows': rows, 'repeat': repeat, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help='case studies in the database')
+    parser.add_argument('--repeat', type=int, default=5, help='process starts per scenario')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(args.rows, args.repeat, args.workers)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
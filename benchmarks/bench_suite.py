@@ -0,0 +1,227 @@
+"""
+Timed API and export scenarios on synthetic databases
+
+    python -m benchmarks.bench_suite [--sizes 1000,10000,100000] [--repeat 5]
+                                     [--output results.json]
+
+For every size a fresh in-memory database is seeded (benchmarks.datagen,
+fixed seed), then each scenario is run through the Flask test client or
+PPTExporter. Results, with the commit and environment they were measured
+on, are written as JSON; compare two runs with benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+from app import db
+from app.models import CaseStudy
+from app.ppt_export import PPTExporter
+from app.response_cache import SearchCache
+from benchmarks.bench_ppt_export import build_template
+from benchmarks.common import StatementCounter, make_app, summarize, timings
+from benchmarks.datagen import seed_database
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# name -> query string of GET /api/case-studies
+LIST_SCENARIOS = {
+    'list_page': 'limit=50',
+    'list_page_projected': 'limit=50&fields=id,project_name,client_name,industry,project_year',
+    'list_sorted_by_name': 'limit=50&sort_by=project_name&sort_order=asc',
+    'search_text': 'limit=50&q=migration',
+    'search_phrase': 'limit=50&q=%22legacy+platform%22',
+    'filter_industry': 'limit=50&industry=Retail',
+    'filter_year': 'limit=50&year=2021',
+    'filter_technology': 'limit=50&technologies=Python',
+    'filter_technologies_all': 'limit=50&technologies=Python,Azure',
+    'filter_tags_any': 'limit=50&tags=ai,security&tags_match=any',
+    'filter_combined': 'limit=50&q=reporting&industry=Finance&technologies=Kafka',
+    'list_all_projected': 'fields=id,project_name',
+}
+
+# name -> query string of the streaming GET /api/case-studies/export
+STREAM_SCENARIOS = {
+    'stream_ndjson': 'format=ndjson',
+    'stream_csv': 'format=csv',
+}
+
+# name -> words typed into the live search, one GET /api/case-studies/live per keystroke
+LIVE_SCENARIOS = {
+    'live_search_typing': 'migration',
+    'live_search_typing_filtered': 'reporting&industry=Finance',
+}
+
+# Template sizes for the export scenarios, in slides
+TEMPLATE_SLIDES = {'small': 1, 'large': 100}
+
+
+def _request(client, url, follow_cursor=0):
+    """GET url (and the next pages), returning the bytes received"""
+    received = 0
+    for _ in range(follow_cursor + 1):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+        received += len(response.data)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        url = f'{url.split("&cursor=")[0]}&cursor={cursor}'
+    return received
+
+
+def _stream(client, url):
+    """GET a streamed response chunk by chunk, returning the bytes received"""
+    response = client.get(url, buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {url} returned {response.status_code}')
+    received = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return received
+
+
+def _first_line(client, url):
+    """GET a streamed response until its first line, then hang up like an aborted fetch"""
+    response = client.get(url, buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {url} returned {response.status_code}')
+    first = next(iter(response.response))
+    response.close()
+    return len(first)
+
+
+def _type(client, text):
+    """First lines of the live searches for each prefix of text, as typed"""
+    word, _, filters = text.partition('&')
+    SearchCache.from_config().backend.clear()
+    return sum(_first_line(client, f'/api/case-studies/live?q={word[:n]}&{filters}')
+               for n in range(1, len(word) + 1))
+
+
+def _peak_memory(func):
+    """Peak traced allocation while func runs, in KiB"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _measure(name, func, repeat, rows, **extra):
+    with StatementCounter(db.engine) as counter:
+        func()
+    result = {'scenario': name, 'rows': rows, 'statements': counter.count}
+    result.update(summarize(timings(func, repeat=repeat)))
+    result.update(extra)
+    return result
+
+
+def api_scenarios(app, rows, repeat):
+    client = app.test_client()
+    results = []
+    scenarios = [(name, f'/api/case-studies?{query}', 0) for name, query in LIST_SCENARIOS.items()]
+    scenarios += [
+        ('list_deep_pages', '/api/case-studies?limit=50', 9),
+        ('facets', '/api/facets', 0),
+        ('suggestions', '/api/suggestions?q=p', 0),
+        ('similar', '/api/case-studies/1/similar', 0),
+        ('stats', '/api/stats', 0),
+    ]
+    for name, url, pages in scenarios:
+        received = _request(client, url, pages)
+        results.append(_measure(name, lambda: _request(client, url, pages), repeat, rows, bytes=received))
+    # Streaming exports of everything; peak memory should not grow with rows
+    for name, query in STREAM_SCENARIOS.items():
+        url = f'/api/case-studies/export?{query}'
+        received = _stream(client, url)
+        peak = _peak_memory(lambda: _stream(client, url))
+        results.append(_measure(name, lambda: _stream(client, url), repeat, rows,
+                                bytes=received, peak_kib=peak))
+    # Keystrokes with an empty search cache; per-keystroke time is the median / len(word)
+    for name, text in LIVE_SCENARIOS.items():
+        received = _type(client, text)
+        results.append(_measure(name, lambda: _type(client, text), repeat, rows,
+                                bytes=received, keystrokes=len(text.partition('&')[0])))
+    return results
+
+
+def export_scenarios(app, rows, repeat, workdir):
+    results = []
+    case_study = CaseStudy.query.order_by(CaseStudy.id).first()
+    output_path = os.path.join(workdir, 'out.pptx')
+    for size, slides in TEMPLATE_SLIDES.items():
+        template_path = os.path.join(workdir, f'template_{size}.pptx')
+        build_template(template_path, slides)
+        exporter = PPTExporter(template_path)
+
+        def cold():
+            PPTExporter.template_cache.discard(os.path.abspath(template_path))
+            exporter.export_case_study(case_study, output_path)
+
+        def warm():
+            exporter.export_case_study(case_study, output_path)
+
+        for name, func in ((f'export_{size}_cold', cold), (f'export_{size}_warm', warm)):
+            results.append(_measure(name, func, repeat, rows, slides=slides))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def run(sizes, repeat):
+    workdir = tempfile.mkdtemp(prefix='bench_suite_')
+    results = []
+    for rows in sizes:
+        app = make_app()
+        with app.app_context():
+            print(f'seeding {rows} case studies...', file=sys.stderr)
+            seed_database(rows)
+            for result in api_scenarios(app, rows, repeat) + export_scenarios(app, rows, repeat, workdir):
+                print(f'{rows:>7} {result["scenario"]:>26}: {result["median_ms"]:9.2f} ms median  '
+                      f'{result["statements"]:4d} statements', file=sys.stderr)
+                results.append(result)
+            db.session.remove()
+            db.engine.dispose()
+    return {'environment': environment(), 'repeat': repeat, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated database sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per scenario')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run([int(size) for size in args.sizes.split(',')], args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
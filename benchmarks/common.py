@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+
+from app import create_app, db
+
+
+class BenchConfig:
+    """Isolated configuration: in-memory database, throwaway upload folders"""
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = 'bench'
+    UPLOAD_FOLDER = tempfile.mkdtemp(prefix='bench_uploads_')
+    TEMPLATE_FOLDER = os.path.join(UPLOAD_FOLDER, 'templates')
+    ATTACHMENTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'attachments')
+
+    @staticmethod
+    def init_app(app):
+        """Create the upload folders"""
+        os.makedirs(BenchConfig.TEMPLATE_FOLDER, exist_ok=True)
+        os.makedirs(BenchConfig.ATTACHMENTS_FOLDER, exist_ok=True)
+
+
+def make_app(config_class=BenchConfig):
+    """Create an app with an empty schema"""
+    app = create_app(config_class)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def best_of(func, repeat=5):
+    """Run func `repeat` times; return (best seconds, last result)"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class StatementCounter:
+    """Count SQL statements executed on an engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def timings(func, repeat=5, warmup=1):
+    """Run func `warmup` times untimed, then `repeat` times; return the seconds of each timed run"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples):
+    """Min, median and 95th percentile of samples, in milliseconds"""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'runs': len(ordered),
+    }
@@ -0,0 +1,51 @@
+"""
+Compare two benchmark suite results
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 1.25]
+
+Prints the median of every scenario in both runs and their ratio, and
+exits with status 1 if any scenario got slower than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return {(r['scenario'], r['rows']): r for r in report['results']}, report.get('environment', {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='current/baseline median ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    baseline, baseline_env = load(args.baseline)
+    current, current_env = load(args.current)
+    print(f'baseline {baseline_env.get("commit")}  current {current_env.get("commit")}')
+
+    regressions = 0
+    for key in sorted(current, key=lambda k: (k[1], k[0])):
+        scenario, rows = key
+        new = current[key]['median_ms']
+        if key not in baseline:
+            print(f'{rows:>7} {scenario:>26}: {"":>10}   {new:10.2f} ms  (new)')
+            continue
+        old = baseline[key]['median_ms']
+        ratio = new / old if old else float('inf')
+        flag = ''
+        if ratio > args.threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f'{rows:>7} {scenario:>26}: {old:10.2f} -> {new:10.2f} ms  x{ratio:5.2f}{flag}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
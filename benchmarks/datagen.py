@@ -0,0 +1,111 @@
+"""
+Seeded synthetic case studies for benchmarks
+
+The same seed always produces the same rows, so timings from different
+commits are measured on identical data. Text fields are sized like real
+write-ups (a few hundred to a couple of thousand characters), and about
+half of the case studies get one to three attachment rows.
+"""
+import random
+from datetime import datetime, timedelta
+
+from app import db, taxonomy
+from app.models import Attachment, CaseStudy
+
+INDUSTRIES = (
+    'Healthcare', 'Finance', 'Retail', 'Energy', 'Manufacturing', 'Public Sector',
+    'Telecommunications', 'Logistics', 'Insurance', 'Media',
+)
+TECHNOLOGIES = (
+    'Python', 'Java', 'JavaScript', 'TypeScript', 'Go', 'C#', 'Azure', 'AWS', 'GCP',
+    'Kubernetes', 'Terraform', 'PostgreSQL', 'Kafka', 'Spark', 'React', 'Angular',
+    'Databricks', 'Snowflake', 'Power BI', 'SAP',
+)
+TAGS = (
+    'cloud', 'migration', 'data', 'analytics', 'ai', 'security', 'devops', 'mobile',
+    'integration', 'modernization', 'compliance', 'automation',
+)
+VALUES = ('<$100K', '$100K-$500K', '$500K-$1M', '>$1M')
+WORDS = (
+    'legacy', 'platform', 'reporting', 'latency', 'customer', 'pipeline', 'release',
+    'regional', 'warehouse', 'migration', 'onboarding', 'billing', 'forecast', 'audit',
+    'inventory', 'dashboard', 'integration', 'throughput', 'backlog', 'workflow',
+    'partner', 'scalable', 'manual', 'nightly', 'batch', 'realtime', 'compliance',
+    'team', 'operations', 'costs', 'quality', 'insight', 'portal', 'claims', 'orders',
+)
+
+# Rows per INSERT batch
+BATCH_SIZE = 5000
+
+
+def _text(rng, min_chars, max_chars):
+    """Sentences of filler words, between min_chars and max_chars long"""
+    target = rng.randint(min_chars, max_chars)
+    sentences, length = [], 0
+    while length < target:
+        words = rng.choices(WORDS, k=rng.randint(8, 18))
+        sentence = ' '.join(words).capitalize() + '.'
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(sentences)
+
+
+def case_study_rows(count, seed=0):
+    """Yield `count` case study column dictionaries"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for i in range(count):
+        created = start + timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 5))
+        yield {
+            'project_name': f'{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} {i}',
+            'client_name': f'Client {rng.randint(1, max(count // 20, 1))}',
+            'industry': rng.choice(INDUSTRIES),
+            'project_year': rng.randint(2015, 2025),
+            'challenge': _text(rng, 300, 1500),
+            'solution': _text(rng, 500, 2500),
+            'outcomes': _text(rng, 200, 1000),
+            'technologies': ', '.join(rng.sample(TECHNOLOGIES, rng.randint(1, 5))),
+            'team_size': rng.randint(2, 40),
+            'duration_months': rng.randint(1, 36),
+            'tags': ', '.join(rng.sample(TAGS, rng.randint(0, 4))),
+            'project_value': rng.choice(VALUES),
+            'confidential': rng.random() < 0.1,
+            'created_at': created,
+            'updated_at': created + timedelta(days=rng.randint(0, 400)),
+            'created_by': rng.choice(('alice', 'bob', 'carol', 'System')),
+        }
+
+
+def seed_database(count, seed=0):
+    """
+    Insert `count` case studies and their attachments in batches
+
+    Uses Core inserts, which bypass the ORM flush listeners, so the link
+    tables and facet counters are rebuilt once at the end. Attachments
+    are rows only; their files are not created.
+    """
+    rng = random.Random(seed + 1)
+    rows = case_study_rows(count, seed)
+    next_id = 1
+    while True:
+        batch = [row for _, row in zip(range(BATCH_SIZE), rows)]
+        if not batch:
+            break
+        for offset, row in enumerate(batch):
+            row['id'] = next_id + offset
+        db.session.execute(db.insert(CaseStudy), batch)
+
+        attachments = [{
+            'filename': f'{row["id"]}-{n}.pdf',
+            'original_filename': f'{rng.choice(WORDS)}-{n}.pdf',
+            'file_path': f'/nonexistent/{row["id"]}-{n}.pdf',
+            'file_type': 'pdf',
+            'case_study_id': row['id'],
+        } for row in batch if rng.random() < 0.5 for n in range(rng.randint(1, 3))]
+        if attachments:
+            db.session.execute(db.insert(Attachment), attachments)
+        next_id += len(batch)
+
+    taxonomy.backfill()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
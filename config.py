@@ -1,6 +1,13 @@
 import os
 from datetime import timedelta
 
+def _env_flag(name):
+    """True or False if the environment variable is set, otherwise None"""
+    value = os.environ.get(name)
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
 class Config:
     """Application configuration"""
     
@@ -11,6 +18,15 @@ class Config:
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'case_studies.db')}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Per-worker connection pools; SQLite pragmas and read/write engines are
+    # set up by app.database
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 30}
+    DATABASE_READ_WRITE_SPLIT = True
+    SQLITE_PRAGMAS = {}
+    # Create and upgrade the schema in create_app instead of `flask init-db`.
+    # Unset, only in-memory databases and debug runs (flask run --debug) do.
+    DATABASE_AUTO_MIGRATE = _env_flag('DATABASE_AUTO_MIGRATE')
+    
     # Upload folders
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
     TEMPLATE_FOLDER = os.path.join(UPLOAD_FOLDER, 'templates')
@@ -20,6 +36,81 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pptx', 'pdf', 'doc', 'docx', 'png', 'jpg', 'jpeg'}
     
+    # Largest attachment accepted (MAX_CONTENT_LENGTH also applies); None for no extra limit
+    ATTACHMENT_MAX_BYTES = None
+    # Behind nginx, let it send attachment files from this internal location,
+    # e.g. '/protected-attachments' (see DEPLOYMENT.md)
+    ATTACHMENT_ACCEL_REDIRECT_PREFIX = os.environ.get('ATTACHMENT_ACCEL_REDIRECT_PREFIX')
+    
+    # Store compiled PowerPoint templates next to the template files
+    PPT_PERSIST_COMPILED_TEMPLATES = True
+    
+    # Uploaded templates are parsed in the export pool and rejected above these limits
+    TEMPLATE_MAX_BYTES = 12 * 1024 * 1024
+    TEMPLATE_MAX_SLIDES = 100
+    TEMPLATE_INSPECT_IN_WORKER = True
+    TEMPLATE_INSPECT_TIMEOUT = 60
+    
+    # Most case studies a single batch export may include
+    MAX_BATCH_EXPORT = 500
+    
+    # Exports larger than this are spooled to a temporary file instead of memory
+    EXPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+    
+    # Cache of rendered single-case-study decks
+    EXPORT_CACHE_ENABLED = True
+    EXPORT_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'export_cache')
+    EXPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    
+    # Background exports: pool size, lease before a job counts as lost (renewed
+    # every third of it while the job renders), and how long finished results
+    # are kept (seconds)
+    EXPORT_JOB_WORKERS = 2
+    EXPORT_JOB_TIMEOUT = 600
+    EXPORT_JOB_TTL = 3600
+    EXPORT_JOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'exports')
+    
+    # Largest page GET /api/case-studies returns when paginating
+    MAX_PAGE_SIZE = 200
+    
+    # Bulk import: rows inserted per transaction, and failed rows listed in detail
+    IMPORT_BATCH_SIZE = 500
+    IMPORT_MAX_REPORTED_ERRORS = 1000
+    
+    # Rows fetched per round trip when streaming NDJSON/CSV exports
+    EXPORT_CHUNK_SIZE = 1000
+    
+    # Live search: rows on the first streamed line, rows per following line,
+    # the most rows one response sends, and the text matches ranked for it
+    LIVE_SEARCH_TOP = 20
+    LIVE_SEARCH_CHUNK_SIZE = 100
+    LIVE_SEARCH_MAX_RESULTS = 500
+    LIVE_SEARCH_CANDIDATES = 2000
+    
+    # TF-IDF index of similar case studies, rebuilt in the background once the
+    # case studies written since the last build exceed both thresholds
+    SIMILARITY_INDEX_FOLDER = os.path.join(UPLOAD_FOLDER, 'similarity')
+    SIMILARITY_REBUILD_FRACTION = 0.1
+    SIMILARITY_REBUILD_MIN_CHANGES = 100
+    
+    # Cache of serialized search responses, invalidated by any case study write.
+    # 'sqlite' shares one cache file between the workers of a host. Bounded by
+    # entries and by bytes of responses (per process for 'memory', per host for
+    # 'sqlite'), as unpaginated lists of a large archive run to megabytes.
+    SEARCH_CACHE_ENABLED = True
+    SEARCH_CACHE_BACKEND = os.environ.get('SEARCH_CACHE_BACKEND', 'memory')
+    SEARCH_CACHE_PATH = os.path.join(UPLOAD_FOLDER, 'search_cache.sqlite')
+    SEARCH_CACHE_SIZE = 512
+    SEARCH_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    SEARCH_CACHE_TTL = 60
+    
+    # Opt-in metrics on /metrics (Prometheus text format) and Server-Timing headers
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # With instrumentation on, write sampled stacks of requests slower than this
+    PROFILE_SLOW_REQUEST_MS = int(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0)) or None
+    PROFILE_INTERVAL_MS = 5
+    PROFILE_FOLDER = os.path.join(UPLOAD_FOLDER, 'profiles')
+    
     # Secret key for sessions
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
@@ -0,0 +1,33 @@
+"""
+gunicorn settings, read from the working directory: gunicorn run:app
+
+The app is imported once in the master and the workers are forked from
+it, so they share its modules copy-on-write instead of each importing
+them, and start without importing anything. Run `flask init-db` first;
+workers don't create or upgrade the schema.
+"""
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+timeout = 120
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() not in ('0', 'false', 'no')
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    # Also share the modules requests would import on first use
+    from app import preload
+    preload()
+    # Move what is loaded out of the collector's reach: collections would
+    # write to every object header and so copy the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import database
+        database.after_fork(server.app.wsgi())
@@ -3,4 +3,9 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    # The development server creates and upgrades the schema itself; under
+    # gunicorn run `flask init-db` first
+    from app import schema
+    with app.app_context():
+        schema.migrate()
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -4,6 +4,54 @@ let currentCaseId = null;
 let allCases = [];
 let templates = [];
 
+// Case list paging: cards only need a summary, details are loaded on demand
+const CASE_LIST_FIELDS = 'id,project_name,client_name,industry,project_year,challenge,technologies,confidential';
+const CASE_PAGE_SIZE = 50;
+let nextCasesCursor = null;
+
+// Live search while typing: requests start after a short pause, and each one
+// aborts its predecessor, so a slow response can't overwrite a newer one
+const LIVE_SEARCH_DELAY = 150;
+const LIVE_SEARCH_TOP = 20;
+let liveSearchTimer = null;
+let liveSearchController = null;
+
+// Name suggestions for text inputs: input id -> [suggestion field, comma-separated list?]
+const SUGGESTION_INPUTS = {
+    techFilter: ['technology', true],
+    clientName: ['client', false],
+    industry: ['industry', false],
+    technologies: ['technology', true],
+    tags: ['tag', true]
+};
+const SUGGESTION_DELAY = 100;
+
+// Last response per URL, revalidated with If-None-Match so unchanged data
+// costs the server a version lookup and us nothing to re-render
+const RESPONSE_CACHE_SIZE = 50;
+const responseCache = new Map();
+
+async function fetchCached(url) {
+    const cached = responseCache.get(url);
+    const response = await fetch(url, {
+        headers: cached ? { 'If-None-Match': cached.etag } : {}
+    });
+    if (response.status === 304 && cached) {
+        return { ...cached, changed: false };
+    }
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    
+    const entry = { etag: response.headers.get('ETag'), data: await response.json(), headers: response.headers };
+    if (entry.etag) {
+        responseCache.delete(url);
+        responseCache.set(url, entry);
+        if (responseCache.size > RESPONSE_CACHE_SIZE) {
+            responseCache.delete(responseCache.keys().next().value);
+        }
+    }
+    return { ...entry, changed: true };
+}
+
 // Initialize app
 document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
@@ -47,8 +95,12 @@ function setupEventListeners() {
     document.getElementById('searchInput').addEventListener('keyup', (e) => {
         if (e.key === 'Enter') loadCasesList();
     });
+    document.getElementById('searchInput').addEventListener('input', scheduleLiveSearch);
+    Object.entries(SUGGESTION_INPUTS).forEach(([id, [field, multiple]]) => attachSuggestions(id, field, multiple));
     document.getElementById('sortBy').addEventListener('change', loadCasesList);
     document.getElementById('sortOrder').addEventListener('change', loadCasesList);
+    document.getElementById('loadMoreCases').addEventListener('click', loadMoreCases);
+    document.getElementById('exportResults').addEventListener('click', exportResults);
     
     // Template form
     document.getElementById('templateForm').addEventListener('submit', handleTemplateUpload);
@@ -90,8 +142,8 @@ function showView(view) {
 // Dashboard
 async function loadDashboard() {
     try {
-        const response = await fetch('/api/stats');
-        const stats = await response.json();
+        const { data: stats, changed } = await fetchCached('/api/stats');
+        if (!changed) return;
         
         document.getElementById('totalCases').textContent = stats.total;
         
@@ -132,21 +184,34 @@ async function loadDashboard() {
 }
 
 // Case List
+function caseListParams(cursor) {
+    const params = new URLSearchParams({
+        q: document.getElementById('searchInput').value || '',
+        industry: document.getElementById('industryFilter').value || '',
+        year: document.getElementById('yearFilter').value || '',
+        technologies: document.getElementById('techFilter').value || '',
+        technologies_match: document.getElementById('techMatchAny').checked ? 'any' : 'all',
+        sort_by: document.getElementById('sortBy').value,
+        sort_order: document.getElementById('sortOrder').value,
+        fields: CASE_LIST_FIELDS,
+        limit: CASE_PAGE_SIZE
+    });
+    if (cursor) params.set('cursor', cursor);
+    return params;
+}
+
+async function fetchCasesPage(cursor) {
+    const { data: page, headers } = await fetchCached(`/api/case-studies?${caseListParams(cursor)}`);
+    nextCasesCursor = headers.get('X-Next-Cursor');
+    document.getElementById('caseCount').textContent = headers.get('X-Total-Count') || page.length;
+    document.getElementById('loadMoreCases').style.display = nextCasesCursor ? 'block' : 'none';
+    return page;
+}
+
 async function loadCasesList() {
+    cancelLiveSearch();
     try {
-        const params = new URLSearchParams({
-            q: document.getElementById('searchInput').value || '',
-            industry: document.getElementById('industryFilter').value || '',
-            year: document.getElementById('yearFilter').value || '',
-            technologies: document.getElementById('techFilter').value || '',
-            sort_by: document.getElementById('sortBy').value,
-            sort_order: document.getElementById('sortOrder').value
-        });
-        
-        const response = await fetch(`/api/case-studies?${params}`);
-        allCases = await response.json();
-        
-        document.getElementById('caseCount').textContent = allCases.length;
+        allCases = await fetchCasesPage(null);
         
         const casesDiv = document.getElementById('casesList');
         if (allCases.length === 0) {
@@ -156,53 +221,7 @@ async function loadCasesList() {
                 </div>
             `;
         } else {
-            casesDiv.innerHTML = allCases.map(cs => `
-                <div class="card mb-3">
-                    <div class="card-body">
-                        <div class="row align-items-center">
-                            <div class="col-md-9">
-                                <div class="d-flex align-items-center mb-2">
-                                    <h5 class="card-title mb-0 me-2">
-                                        ${cs.project_name}
-                                    </h5>
-                                    ${cs.confidential ? '<span class="badge bg-warning text-dark"><i class="bi bi-shield-lock"></i> Confidential</span>' : ''}
-                                </div>
-                                <h6 class="card-subtitle mb-3 text-muted">
-                                    <i class="bi bi-building"></i> ${cs.client_name} 
-                                    ${cs.industry ? `<span class="mx-2">•</span> <i class="bi bi-tag"></i> ${cs.industry}` : ''} 
-                                    ${cs.project_year ? `<span class="mx-2">•</span> <i class="bi bi-calendar"></i> ${cs.project_year}` : ''}
-                                </h6>
-                                <p class="card-text text-muted mb-3" style="display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; overflow: hidden;">
-                                    ${cs.challenge}
-                                </p>
-                                ${cs.technologies ? `
-                                    <div class="mt-2">
-                                        ${cs.technologies.split(',').map(t => 
-                                            `<span class="badge bg-secondary me-1 mb-1"><i class="bi bi-code-slash"></i> ${t.trim()}</span>`
-                                        ).join('')}
-                                    </div>
-                                ` : ''}
-                            </div>
-                            <div class="col-md-3">
-                                <div class="d-grid gap-2">
-                                    <button class="btn btn-primary btn-sm" onclick="viewCaseDetail(${cs.id})">
-                                        <i class="bi bi-eye"></i> View Details
-                                    </button>
-                                    <button class="btn btn-outline-primary btn-sm" onclick="exportCase(${cs.id})">
-                                        <i class="bi bi-file-earmark-ppt"></i> Export
-                                    </button>
-                                    <button class="btn btn-warning btn-sm" onclick="editCase(${cs.id})">
-                                        <i class="bi bi-pencil"></i> Edit
-                                    </button>
-                                    <button class="btn btn-danger btn-sm" onclick="deleteCase(${cs.id})">
-                                        <i class="bi bi-trash"></i> Delete
-                                    </button>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            `).join('');
+            casesDiv.innerHTML = allCases.map(renderCaseCard).join('');
         }
     } catch (error) {
         console.error('Error loading cases:', error);
@@ -211,10 +230,195 @@ async function loadCasesList() {
     }
 }
 
+async function loadMoreCases() {
+    if (!nextCasesCursor) return;
+    
+    try {
+        const page = await fetchCasesPage(nextCasesCursor);
+        allCases = allCases.concat(page);
+        document.getElementById('casesList').insertAdjacentHTML('beforeend', page.map(renderCaseCard).join(''));
+    } catch (error) {
+        console.error('Error loading more cases:', error);
+    }
+}
+
+function scheduleLiveSearch() {
+    clearTimeout(liveSearchTimer);
+    liveSearchTimer = setTimeout(liveSearch, LIVE_SEARCH_DELAY);
+}
+
+function cancelLiveSearch() {
+    clearTimeout(liveSearchTimer);
+    if (liveSearchController) liveSearchController.abort();
+    liveSearchController = null;
+}
+
+// Yield the JSON objects of an NDJSON response as its lines arrive
+async function* readJsonLines(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (line) yield JSON.parse(line);
+        }
+    }
+    if (buffer.trim()) yield JSON.parse(buffer);
+}
+
+// Show the best matches as soon as they arrive and append the rest as they stream in
+async function liveSearch() {
+    if (!document.getElementById('searchInput').value.trim()) {
+        loadCasesList();
+        return;
+    }
+    cancelLiveSearch();
+    const controller = liveSearchController = new AbortController();
+    
+    const params = caseListParams(null);
+    params.delete('fields');
+    params.delete('limit');
+    params.set('top', LIVE_SEARCH_TOP);
+    
+    const casesDiv = document.getElementById('casesList');
+    const caseCount = document.getElementById('caseCount');
+    try {
+        const response = await fetch(`/api/case-studies/live?${params}`, { signal: controller.signal });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        
+        nextCasesCursor = null;
+        document.getElementById('loadMoreCases').style.display = 'none';
+        let fields = [];
+        for await (const message of readJsonLines(response)) {
+            if (message.fields) {
+                fields = message.fields;
+                allCases = [];
+                casesDiv.innerHTML = '';
+            }
+            if (message.rows) {
+                const cases = message.rows.map(row => Object.fromEntries(fields.map((f, i) => [f, row[i]])));
+                allCases = allCases.concat(cases);
+                casesDiv.insertAdjacentHTML('beforeend', cases.map(renderCaseCard).join(''));
+                caseCount.textContent = allCases.length;
+            }
+            if (message.done) {
+                caseCount.textContent = message.truncated ? `${message.count}+` : message.count;
+                if (message.count === 0) {
+                    casesDiv.innerHTML = `
+                        <div class="alert alert-info">
+                            <i class="bi bi-info-circle"></i> No case studies found. Try adjusting your filters.
+                        </div>
+                    `;
+                }
+            }
+        }
+    } catch (error) {
+        // Superseded by a newer search
+        if (error.name === 'AbortError') return;
+        console.error('Error in live search:', error);
+    } finally {
+        if (liveSearchController === controller) liveSearchController = null;
+    }
+}
+
+function renderCaseCard(cs) {
+    return `
+        <div class="card mb-3">
+            <div class="card-body">
+                <div class="row align-items-center">
+                    <div class="col-md-9">
+                        <div class="d-flex align-items-center mb-2">
+                            <h5 class="card-title mb-0 me-2">
+                                ${cs.project_name}
+                            </h5>
+                            ${cs.confidential ? '<span class="badge bg-warning text-dark"><i class="bi bi-shield-lock"></i> Confidential</span>' : ''}
+                        </div>
+                        <h6 class="card-subtitle mb-3 text-muted">
+                            <i class="bi bi-building"></i> ${cs.client_name} 
+                            ${cs.industry ? `<span class="mx-2">•</span> <i class="bi bi-tag"></i> ${cs.industry}` : ''} 
+                            ${cs.project_year ? `<span class="mx-2">•</span> <i class="bi bi-calendar"></i> ${cs.project_year}` : ''}
+                        </h6>
+                        <p class="card-text text-muted mb-3" style="display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; overflow: hidden;">
+                            ${cs.challenge}
+                        </p>
+                        ${cs.technologies ? `
+                            <div class="mt-2">
+                                ${cs.technologies.split(',').map(t => 
+                                    `<span class="badge bg-secondary me-1 mb-1"><i class="bi bi-code-slash"></i> ${t.trim()}</span>`
+                                ).join('')}
+                            </div>
+                        ` : ''}
+                    </div>
+                    <div class="col-md-3">
+                        <div class="d-grid gap-2">
+                            <button class="btn btn-primary btn-sm" onclick="viewCaseDetail(${cs.id})">
+                                <i class="bi bi-eye"></i> View Details
+                            </button>
+                            <button class="btn btn-outline-primary btn-sm" onclick="exportCase(${cs.id})">
+                                <i class="bi bi-file-earmark-ppt"></i> Export
+                            </button>
+                            <button class="btn btn-warning btn-sm" onclick="editCase(${cs.id})">
+                                <i class="bi bi-pencil"></i> Edit
+                            </button>
+                            <button class="btn btn-danger btn-sm" onclick="deleteCase(${cs.id})">
+                                <i class="bi bi-trash"></i> Delete
+                            </button>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+    `;
+}
+
+// Offer names used in other case studies in a datalist; for comma-separated
+// lists, complete the item being typed
+function attachSuggestions(inputId, field, multiple) {
+    const input = document.getElementById(inputId);
+    const list = document.createElement('datalist');
+    list.id = `${inputId}Suggestions`;
+    input.after(list);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    
+    let timer = null;
+    let latest = 0;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            const request = ++latest;
+            const value = input.value;
+            const cut = multiple ? value.lastIndexOf(',') + 1 : 0;
+            const head = value.slice(0, cut) + (cut && value[cut] === ' ' ? ' ' : '');
+            const prefix = value.slice(cut).trim();
+            if (!prefix) {
+                list.innerHTML = '';
+                return;
+            }
+            try {
+                const params = new URLSearchParams({ q: prefix, fields: field, limit: 10 });
+                const { data: suggestions } = await fetchCached(`/api/suggestions?${params}`);
+                // A newer keystroke has asked in the meantime
+                if (request !== latest) return;
+                list.innerHTML = suggestions.map(s =>
+                    `<option value="${(head + s.value).replace(/"/g, '&quot;')}">${s.count} case studies</option>`
+                ).join('');
+            } catch (error) {
+                console.error('Error loading suggestions:', error);
+            }
+        }, SUGGESTION_DELAY);
+    });
+}
+
 async function loadFacets() {
     try {
-        const response = await fetch('/api/facets');
-        const facets = await response.json();
+        const { data: facets, changed } = await fetchCached('/api/facets');
+        if (!changed) return;
         
         // Populate industry filter
         const industryFilter = document.getElementById('industryFilter');
@@ -239,14 +443,14 @@ function clearFilters() {
     document.getElementById('industryFilter').value = '';
     document.getElementById('yearFilter').value = '';
     document.getElementById('techFilter').value = '';
+    document.getElementById('techMatchAny').checked = false;
     loadCasesList();
 }
 
 // Case Detail Modal
 async function viewCaseDetail(id) {
     try {
-        const response = await fetch(`/api/case-studies/${id}`);
-        const cs = await response.json();
+        const { data: cs } = await fetchCached(`/api/case-studies/${id}`);
         
         currentCaseId = id;
         
@@ -323,16 +527,45 @@ async function viewCaseDetail(id) {
                     ).join('')}
                 </div>
             ` : ''}
+            
+            <div class="mt-4" id="similarCases"></div>
         `;
         
-        const modal = new bootstrap.Modal(document.getElementById('caseDetailModal'));
-        modal.show();
+        // The modal may already be open when moving on to a similar case study
+        bootstrap.Modal.getOrCreateInstance(document.getElementById('caseDetailModal')).show();
+        loadSimilarCases(id);
     } catch (error) {
         console.error('Error loading case detail:', error);
         alert('Error loading case study details.');
     }
 }
 
+async function loadSimilarCases(id) {
+    try {
+        const { data: similar } = await fetchCached(
+            `/api/case-studies/${id}/similar?limit=5&fields=id,project_name,client_name,industry`);
+        // Another case study was opened meanwhile
+        if (currentCaseId !== id || similar.length === 0) return;
+        document.getElementById('similarCases').innerHTML = `
+            <h6><i class="bi bi-diagram-3"></i> Similar Case Studies</h6>
+            <div class="list-group">
+                ${similar.map(cs => `
+                    <a href="#" class="list-group-item list-group-item-action d-flex justify-content-between align-items-center"
+                       onclick="viewCaseDetail(${cs.id}); return false;">
+                        <span>
+                            <strong>${cs.project_name}</strong>
+                            <small class="text-muted ms-2">${cs.client_name}${cs.industry ? ' • ' + cs.industry : ''}</small>
+                        </span>
+                        <span class="badge bg-light text-dark">${Math.round(cs.score * 100)}%</span>
+                    </a>
+                `).join('')}
+            </div>
+        `;
+    } catch (error) {
+        console.error('Error loading similar case studies:', error);
+    }
+}
+
 // Case Form
 function showCaseForm(caseId = null) {
     currentCaseId = caseId;
@@ -353,8 +586,7 @@ function showCaseForm(caseId = null) {
 
 async function loadCaseForEdit(id) {
     try {
-        const response = await fetch(`/api/case-studies/${id}`);
-        const cs = await response.json();
+        const { data: cs } = await fetchCached(`/api/case-studies/${id}`);
         
         document.getElementById('caseId').value = cs.id;
         document.getElementById('projectName').value = cs.project_name || '';
@@ -448,25 +680,77 @@ async function deleteCase(id) {
 }
 
 // Export functions
+// Batch exports run as background jobs: submit, poll until finished, then download
+async function runExportJob(body) {
+    const response = await fetch('/api/export-jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    let job = await response.json();
+    if (!response.ok) {
+        throw new Error(job.error || 'Error starting export.');
+    }
+    
+    const statusUrl = response.headers.get('Location');
+    while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        job = await (await fetch(statusUrl)).json();
+    }
+    if (job.status !== 'finished') {
+        throw new Error(job.error || 'Export failed.');
+    }
+    
+    const a = document.createElement('a');
+    a.href = job.download_url;
+    a.click();
+}
+
+// Name the server gave a download in its Content-Disposition header
+function downloadName(response, fallback) {
+    const header = response.headers.get('Content-Disposition') || '';
+    const encoded = header.match(/filename\*=UTF-8''([^;]+)/i);
+    if (encoded) {
+        return decodeURIComponent(encoded[1]);
+    }
+    const plain = header.match(/filename="?([^";]+)"?/i);
+    return plain ? plain[1] : fallback;
+}
+
+// A single case study is exported directly: the server serves repeated
+// exports from its deck cache, so there is no job to wait for
 async function exportCase(id) {
     try {
         const response = await fetch(`/api/case-studies/${id}/export/pptx`);
-        
-        if (response.ok) {
-            const blob = await response.blob();
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = `case_study_${id}.pptx`;
-            a.click();
-            window.URL.revokeObjectURL(url);
-        } else {
+        if (!response.ok) {
             const error = await response.json();
-            alert(error.error || 'Error exporting case study.');
+            throw new Error(error.error || 'Error exporting case study.');
         }
+        const url = window.URL.createObjectURL(await response.blob());
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = downloadName(response, `case_study_${id}.pptx`);
+        a.click();
+        window.URL.revokeObjectURL(url);
     } catch (error) {
         console.error('Error exporting case:', error);
-        alert('Error exporting case study.');
+        alert(error.message || 'Error exporting case study.');
+    }
+}
+
+// Export every case study matching the current filters into one deck
+async function exportResults() {
+    const params = caseListParams(null);
+    const search = {};
+    ['q', 'industry', 'year', 'technologies', 'technologies_match', 'sort_by', 'sort_order'].forEach(key => {
+        search[key] = params.get(key);
+    });
+    
+    try {
+        await runExportJob({ search: search, format: 'pptx' });
+    } catch (error) {
+        console.error('Error exporting results:', error);
+        alert(error.message || 'Error exporting case studies.');
     }
 }
 
@@ -491,8 +775,9 @@ async function handleDeleteCase() {
 // Template Management
 async function loadTemplates() {
     try {
-        const response = await fetch('/api/templates');
-        templates = await response.json();
+        const { data, changed } = await fetchCached('/api/templates');
+        templates = data;
+        if (!changed) return;
         
         const templatesDiv = document.getElementById('templatesList');
         if (templates.length === 0) {
@@ -1,13 +1,22 @@
 import io
+import json
 import os
 import shutil
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unittest
-from datetime import datetime
+import zipfile
+from datetime import datetime, timedelta
+from unittest import mock
 
+import numpy as np
 from pptx import Presentation
 
-from app import create_app, db
+from app import create_app, db, importer
+from app.models import ExportJob, TemplateInventory
 
 
 class TestConfig:
@@ -16,6 +25,7 @@ class TestConfig:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    ALLOWED_EXTENSIONS = {'pptx', 'pdf', 'doc', 'docx', 'png', 'jpg', 'jpeg'}
     SECRET_KEY = 'test-secret'
     
     @staticmethod
@@ -165,6 +175,932 @@ class CaseStudyAppTestCase(unittest.TestCase):
         # facets should be a dict-like structure
         self.assertIsInstance(facets, dict)
 
+    def test_industry_filter_matches_non_ascii_names(self):
+        payload = self._create_case_payload()
+        payload['industry'] = 'Öffentlicher Sektor'
+        self.client.post('/api/case-studies', json=payload)
+
+        facets = self.client.get('/api/facets').get_json()
+        self.assertEqual(facets['industries'], [{'name': 'Öffentlicher Sektor', 'count': 1}])
+        for industry in ('Öffentlicher Sektor', 'ÖFFENTLICHER SEKTOR'):
+            resp = self.client.get('/api/case-studies', query_string={'industry': industry})
+            self.assertEqual(len(resp.get_json()), 1, industry)
+
+    def test_facet_counters_follow_writes(self):
+        payload = self._create_case_payload(idx=1)
+        payload.update(technologies='Python, Azure', tags='cloud')
+        first = self.client.post('/api/case-studies', json=payload).get_json()
+        payload = self._create_case_payload(idx=2)
+        payload.update(industry='Retail', technologies='Python', tags='cloud, retail')
+        second = self.client.post('/api/case-studies', json=payload).get_json()
+
+        self.client.put(f"/api/case-studies/{first['id']}", json={'industry': 'Retail', 'technologies': 'Go'})
+        self.client.delete(f"/api/case-studies/{second['id']}")
+
+        facets = self.client.get('/api/facets').get_json()
+        self.assertEqual(facets['industries'], [{'name': 'Retail', 'count': 1}])
+        self.assertEqual(facets['technologies'], [{'name': 'Go', 'count': 1}])
+        self.assertEqual(facets['tags'], [{'name': 'cloud', 'count': 1}])
+        stats = self.client.get('/api/stats').get_json()
+        self.assertEqual(stats['total'], 1)
+        self.assertEqual(stats['by_industry'], [{'industry': 'Retail', 'count': 1}])
+
+        # A rebuild from the table gives the same counters
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['rebuild-facets'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.client.get('/api/facets').get_json(), facets)
+
+    def test_suggestions_complete_prefixes_by_count(self):
+        for idx, (client, technologies) in enumerate(
+                [('Acme', 'Azure, Python'), ('acme', 'AWS'), ('Apex Ltd', 'Azure'), ('Zeta', 'Ansible')], start=1):
+            payload = self._create_case_payload(idx=idx)
+            payload.update(client_name=client, technologies=technologies, industry='Aerospace')
+            self.client.post('/api/case-studies', json=payload)
+
+        resp = self.client.get('/api/suggestions?q=A&fields=technology')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), [
+            {'field': 'technology', 'value': 'Azure', 'count': 2},
+            {'field': 'technology', 'value': 'Ansible', 'count': 1},
+            {'field': 'technology', 'value': 'AWS', 'count': 1},
+        ])
+        suggestions = self.client.get('/api/suggestions?q=ac&limit=5').get_json()
+        self.assertEqual([(s['field'], s['value'], s['count']) for s in suggestions],
+                         [('client', 'Acme', 1), ('client', 'acme', 1)])
+        suggestions = self.client.get('/api/suggestions?q=a&limit=2').get_json()
+        self.assertEqual([(s['field'], s['value']) for s in suggestions],
+                         [('industry', 'Aerospace'), ('technology', 'Azure')])
+
+        # Counters follow deletes, and survive a rebuild
+        first = self.client.get('/api/case-studies?q=Acme').get_json()
+        for case_study in first:
+            if case_study['client_name'] == 'Acme':
+                self.client.delete(f"/api/case-studies/{case_study['id']}")
+        self.assertEqual(self.client.get('/api/suggestions?q=ac').get_json(),
+                         [{'field': 'client', 'value': 'acme', 'count': 1}])
+        self.app.test_cli_runner().invoke(args=['rebuild-facets'])
+        self.assertEqual(self.client.get('/api/suggestions?q=ac').get_json(),
+                         [{'field': 'client', 'value': 'acme', 'count': 1}])
+
+        self.assertEqual(self.client.get('/api/suggestions?fields=year').status_code, 400)
+
+    def test_technology_and_tag_filters_match_exactly(self):
+        for idx, technologies in enumerate(['Java, Azure', 'JavaScript, Azure', 'java'], start=1):
+            payload = self._create_case_payload(idx=idx)
+            payload.update(technologies=technologies)
+            self.client.post('/api/case-studies', json=payload)
+
+        def names(**params):
+            resp = self.client.get('/api/case-studies', query_string=params)
+            self.assertEqual(resp.status_code, 200)
+            return sorted(cs['project_name'] for cs in resp.get_json())
+
+        self.assertEqual(names(technologies='Java'), ['Project 1', 'Project 3'])
+        self.assertEqual(names(technologies='java,azure'), ['Project 1'])
+        self.assertEqual(names(technologies='Java, JavaScript', technologies_match='any'),
+                         ['Project 1', 'Project 2', 'Project 3'])
+        self.assertEqual(names(tags='cloud,migration'), ['Project 1', 'Project 2', 'Project 3'])
+        self.assertEqual(self.client.get('/api/case-studies?tags_match=some').status_code, 400)
+
+        # Editing the column relinks the case study
+        first = self.client.get('/api/case-studies', query_string={'technologies': 'azure'}).get_json()
+        self.client.put(f"/api/case-studies/{first[0]['id']}", json={'technologies': 'Go'})
+        self.assertEqual(len(names(technologies='Azure')), 1)
+
+        facets = self.client.get('/api/facets').get_json()
+        self.assertIn({'name': 'Java', 'count': 2}, facets['technologies'])
+
+        # Rows written before the link tables existed are backfilled
+        with self.app.app_context():
+            db.session.execute(db.text('DELETE FROM case_study_technologies'))
+            db.session.commit()
+        self.assertEqual(names(technologies='Java'), [])
+        result = self.app.test_cli_runner().invoke(args=['backfill-taxonomy'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(names(technologies='Java'), ['Project 1', 'Project 3'])
+        self.assertEqual(self.client.get('/api/facets').get_json(), facets)
+
+    def test_conditional_get(self):
+        cs_id = self.client.post('/api/case-studies', json=self._create_case_payload()).get_json()['id']
+        urls = ['/api/case-studies?industry=Healthcare', f'/api/case-studies/{cs_id}', '/api/facets',
+                '/api/stats', '/api/templates']
+        etags = {}
+        for url in urls:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            etags[url] = resp.headers['ETag']
+            resp = self.client.get(url, headers={'If-None-Match': etags[url]})
+            self.assertEqual(resp.status_code, 304, url)
+            self.assertEqual(resp.data, b'')
+
+        # Other parameters are another representation
+        resp = self.client.get('/api/case-studies?industry=Retail', headers={'If-None-Match': etags[urls[0]]})
+        self.assertEqual(resp.status_code, 200)
+
+        # A write changes the tags of case study data, not of templates
+        self.client.put(f'/api/case-studies/{cs_id}', json={'project_name': 'Renamed'})
+        for url in urls:
+            resp = self.client.get(url, headers={'If-None-Match': etags[url]})
+            self.assertEqual(resp.status_code, 304 if url == '/api/templates' else 200, url)
+
+    def test_search_response_cache(self):
+        for idx in (1, 2):
+            payload = self._create_case_payload(idx=idx)
+            payload.update(technologies='Python, Azure')
+            self.client.post('/api/case-studies', json=payload)
+
+        first = self.client.get('/api/case-studies?industry=Healthcare&technologies=Python,Azure&limit=1')
+        with self.app.app_context():
+            from app.response_cache import SearchCache
+            backend = SearchCache.from_config().backend
+        self.assertEqual(len(backend._entries), 1)
+
+        # Equivalent parameters are served from the same entry
+        second = self.client.get('/api/case-studies?technologies=azure,%20python&industry=healthcare&limit=1')
+        self.assertEqual(len(backend._entries), 1)
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(second.headers['X-Total-Count'], '2')
+        self.assertIn('technologies=azure', second.headers['Link'])
+
+        # A write moves on to a new generation
+        cs_id = first.get_json()[0]['id']
+        self.client.put(f'/api/case-studies/{cs_id}', json={'project_name': 'Renamed'})
+        third = self.client.get('/api/case-studies?industry=Healthcare&technologies=Python,Azure&limit=1')
+        self.assertEqual(third.get_json()[0]['project_name'], 'Renamed')
+        self.assertEqual(len(backend._entries), 2)
+
+    def test_full_text_search(self):
+        payload = self._create_case_payload(idx=1)
+        payload.update(project_name='Data Platform', challenge='Fragmented reporting across regions')
+        self.client.post('/api/case-studies', json=payload)
+        payload = self._create_case_payload(idx=2)
+        payload.update(project_name='Claims Portal', challenge='Manual data entry slowed the platform team')
+        resp = self.client.post('/api/case-studies', json=payload)
+        portal_id = resp.get_json()['id']
+
+        # Prefix match, ranked by relevance (project name outweighs body text)
+        resp = self.client.get('/api/case-studies?q=platf')
+        names = [cs['project_name'] for cs in resp.get_json()]
+        self.assertEqual(names, ['Data Platform', 'Claims Portal'])
+
+        # Phrase match
+        resp = self.client.get('/api/case-studies?q="reporting across"')
+        self.assertEqual([cs['project_name'] for cs in resp.get_json()], ['Data Platform'])
+        resp = self.client.get('/api/case-studies?q="across reporting"')
+        self.assertEqual(resp.get_json(), [])
+
+        # Index follows updates and deletes
+        self.client.put(f'/api/case-studies/{portal_id}', json={'challenge': 'Paper forms'})
+        resp = self.client.get('/api/case-studies?q=manual')
+        self.assertEqual(resp.get_json(), [])
+        resp = self.client.get('/api/case-studies?q=paper')
+        self.assertEqual([cs['id'] for cs in resp.get_json()], [portal_id])
+        self.client.delete(f'/api/case-studies/{portal_id}')
+        resp = self.client.get('/api/case-studies?q=paper')
+        self.assertEqual(resp.get_json(), [])
+
+    def test_keyset_pagination_and_projection(self):
+        for i in range(7):
+            payload = self._create_case_payload(idx=i + 1)
+            # Duplicate years and a NULL exercise the id tie-breaker
+            payload['project_year'] = None if i == 3 else 2020 + i % 3
+            self.client.post('/api/case-studies', json=payload)
+
+        for sort_order in ('asc', 'desc'):
+            expected = [cs['id'] for cs in self.client.get(
+                f'/api/case-studies?sort_by=project_year&sort_order={sort_order}').get_json()]
+
+            seen, cursor = [], None
+            while True:
+                url = f'/api/case-studies?sort_by=project_year&sort_order={sort_order}&limit=3&fields=id,project_name'
+                if cursor:
+                    url += f'&cursor={cursor}'
+                resp = self.client.get(url)
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.headers['X-Total-Count'], '7')
+                page = resp.get_json()
+                self.assertTrue(all(set(cs) == {'id', 'project_name'} for cs in page))
+                seen.extend(cs['id'] for cs in page)
+                cursor = resp.headers.get('X-Next-Cursor')
+                if not cursor:
+                    break
+            self.assertEqual(seen, expected)
+
+        resp = self.client.get('/api/case-studies?limit=2&cursor=garbage')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get('/api/case-studies?fields=id,secret')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bulk_serialization_matches_to_dict(self):
+        from sqlalchemy import event
+        from app.models import Attachment, CaseStudy
+        from app.serializers import serialize_case_studies
+
+        for i in range(4):
+            self.client.post('/api/case-studies', json=self._create_case_payload(idx=i + 1))
+
+        with self.app.app_context():
+            for cs_id in (1, 1, 3):
+                db.session.add(Attachment(filename='f', original_filename=f'brief-{cs_id}.pdf',
+                                          file_path='/tmp/f', file_type='pdf', case_study_id=cs_id))
+            db.session.commit()
+            db.session.expire_all()
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                bulk = serialize_case_studies(CaseStudy.query.order_by(CaseStudy.id))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+            # One query for the rows, one for all of their attachments
+            self.assertEqual(len(statements), 2)
+            expected = [cs.to_dict() for cs in CaseStudy.query.order_by(CaseStudy.id)]
+            self.assertEqual(bulk, expected)
+            self.assertEqual(len(bulk[0]['attachments']), 2)
+
+    def _upload_template(self, slide_titles):
+        ppt_path = os.path.join(self.tempdir, 'batch.pptx')
+        prs = Presentation()
+        for title in slide_titles:
+            prs.slides.add_slide(prs.slide_layouts[5]).shapes.title.text = title
+        prs.save(ppt_path)
+        with open(ppt_path, 'rb') as f:
+            resp = self.client.post('/api/templates', data={'name': 'Batch', 'is_default': 'true', 'file': (f, 'batch.pptx')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 201)
+        return resp.get_json()['id']
+
+    def test_batch_export(self):
+        self._upload_template(['{{PROJECT_NAME}}', 'Client: {{CLIENT}}'])
+        ids = [self.client.post('/api/case-studies', json=self._create_case_payload(idx=i + 1)).get_json()['id']
+               for i in range(3)]
+
+        # One merged deck, template slides repeated per case study in request order
+        resp = self.client.post('/api/case-studies/export/pptx', json={'ids': [ids[2], ids[0]]})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        prs = Presentation(io.BytesIO(resp.data))
+        titles = [slide.shapes.title.text for slide in prs.slides]
+        self.assertEqual(titles, ['Project 3', 'Client: Client 3', 'Project 1', 'Client: Client 1'])
+
+        # A zip with one deck per search result
+        resp = self.client.post('/api/case-studies/export/pptx',
+                                json={'search': {'sort_by': 'project_name', 'sort_order': 'asc'}, 'format': 'zip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(resp.data)) as archive:
+            names = archive.namelist()
+            self.assertEqual(names, ['001_Project_1.pptx', '002_Project_2.pptx', '003_Project_3.pptx'])
+            deck = Presentation(io.BytesIO(archive.read(names[1])))
+            self.assertEqual(deck.slides[1].shapes.title.text, 'Client: Client 2')
+
+        resp = self.client.post('/api/case-studies/export/pptx', json={'ids': [ids[0], 999]})
+        self.assertEqual(resp.status_code, 404)
+
+        # Searches filter as GET /api/case-studies does
+        self.client.put(f'/api/case-studies/{ids[1]}', json={'confidential': True})
+        search = {'confidential': False, 'sort_by': 'project_name', 'sort_order': 'asc', 'industry': None}
+        resp = self.client.post('/api/case-studies/export/pptx', json={'search': search, 'format': 'zip'})
+        with zipfile.ZipFile(io.BytesIO(resp.data)) as archive:
+            self.assertEqual(archive.namelist(), ['001_Project_1.pptx', '002_Project_3.pptx'])
+        resp = self.client.post('/api/case-studies/export/pptx', json={'search': {'confidential': 'maybe'}})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post('/api/case-studies/export/pptx', json={'ids': [True]})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_background_export_job(self):
+        self._upload_template(['{{PROJECT_NAME}}'])
+        cs_id = self.client.post('/api/case-studies', json=self._create_case_payload(idx=4)).get_json()['id']
+
+        from app.jobs import export_jobs
+        finish = export_jobs._finish
+        finished_on = []
+
+        def record_thread(*args, **kwargs):
+            finished_on.append(threading.current_thread().name)
+            return finish(*args, **kwargs)
+
+        with mock.patch.object(export_jobs, '_finish', side_effect=record_thread):
+            resp = self.client.post('/api/export-jobs', json={'ids': [cs_id]})
+            self.assertEqual(resp.status_code, 202)
+            status_url = resp.headers['Location']
+
+            deadline = time.time() + 60
+            job = resp.get_json()
+            while job['status'] in ('queued', 'running') and time.time() < deadline:
+                time.sleep(0.1)
+                job = self.client.get(status_url).get_json()
+        self.assertEqual(job['status'], 'finished', job.get('error'))
+        # Recorded off the pool's result thread
+        self.assertEqual(finished_on, ['export-job-completions'])
+
+        resp = self.client.get(job['download_url'])
+        self.assertEqual(resp.status_code, 200)
+        prs = Presentation(io.BytesIO(resp.data))
+        self.assertEqual(prs.slides[0].shapes.title.text, 'Project 4')
+        resp.close()
+
+        self.assertEqual(self.client.get('/api/export-jobs/unknown').status_code, 404)
+
+    def test_timed_out_pool_call_keeps_its_slot(self):
+        from concurrent.futures import TimeoutError as FuturesTimeoutError
+        from app.jobs import export_jobs
+        with self.app.app_context():
+            idle = export_jobs._in_flight
+            with self.assertRaises(FuturesTimeoutError):
+                export_jobs.run(time.sleep, 0.5, timeout=0.01)
+            # Still running in the pool, so still counted
+            self.assertEqual(export_jobs._in_flight, idle + 1)
+        deadline = time.time() + 60
+        while export_jobs._in_flight > idle and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(export_jobs._in_flight, idle)
+
+    def test_pool_is_replaced_after_a_worker_dies(self):
+        from concurrent.futures.process import BrokenProcessPool
+        from app.jobs import export_jobs
+        with self.app.app_context():
+            with self.assertRaises(BrokenProcessPool):
+                export_jobs.run(os._exit, 1)
+            self.assertNotEqual(export_jobs.run(os.getpid), os.getpid())
+
+    def test_export_job_run_that_lost_its_claim_is_discarded(self):
+        from app.jobs import export_jobs
+        job_id = 'a' * 32
+        with self.app.app_context():
+            db.session.add(ExportJob(id=job_id, status='queued', case_study_ids='[1]', template_id=1))
+            db.session.commit()
+            first = export_jobs._claim_next().claim
+
+            # The lease runs out and the job is claimed again
+            ExportJob.query.filter_by(id=job_id).update({'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+            export_jobs._requeue_expired()
+            second = export_jobs._claim_next().claim
+            self.assertNotEqual(first, second)
+
+            # Only the current claim may finish it, and renew its lease
+            paths = [os.path.join(self.tempdir, name) for name in ('stale.pptx', 'live.pptx')]
+            for path in paths:
+                open(path, 'wb').close()
+            export_jobs._finish(job_id, first, paths[0])
+            self.assertFalse(os.path.exists(paths[0]))
+            job = db.session.get(ExportJob, job_id)
+            self.assertEqual(job.status, 'running')
+            export_jobs._leases[job_id] = second
+            export_jobs.renew_leases()
+            db.session.refresh(job)
+            self.assertGreater(job.lease_expires_at, datetime.utcnow() + timedelta(seconds=60))
+
+            export_jobs._finish(job_id, second, paths[1])
+            db.session.refresh(job)
+            self.assertEqual((job.status, job.result_path), ('finished', paths[1]))
+            self.assertNotIn(job_id, export_jobs._leases)
+
+            job.finished_at = datetime.utcnow() - timedelta(days=1)
+            db.session.commit()
+
+        # Polls report expired jobs gone; the next dispatch deletes them
+        self.assertEqual(self.client.get(f'/api/export-jobs/{job_id}').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/export-jobs/{job_id}/download').status_code, 404)
+        with self.app.app_context():
+            export_jobs.dispatch()
+            self.assertIsNone(db.session.get(ExportJob, job_id))
+        self.assertFalse(os.path.exists(paths[1]))
+
+    def test_polling_an_export_job_does_not_write(self):
+        job_id = 'b' * 32
+        with self.app.app_context():
+            db.session.add(ExportJob(id=job_id, status='running', case_study_ids='[1]', template_id=1,
+                                     claim='c' * 32, lease_expires_at=datetime.utcnow() + timedelta(minutes=5)))
+            db.session.commit()
+            statements = []
+
+            def record(conn, cursor, statement, *args):
+                statements.append(statement.split(None, 1)[0].upper())
+
+            db.event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                resp = self.client.get(f'/api/export-jobs/{job_id}')
+            finally:
+                db.event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(resp.get_json()['status'], 'running')
+        self.assertEqual(set(statements), {'SELECT'})
+
+    def test_migrate_adds_new_columns(self):
+        from app import schema
+        with self.app.app_context():
+            db.session.execute(db.text('ALTER TABLE export_jobs DROP COLUMN claim'))
+            db.session.commit()
+            schema.migrate()
+            columns = [c['name'] for c in db.inspect(db.engine).get_columns('export_jobs')]
+        self.assertIn('claim', columns)
+
+    def test_instrumentation(self):
+        class InstrumentedConfig(TestConfig):
+            INSTRUMENTATION_ENABLED = True
+            PROFILE_SLOW_REQUEST_MS = 20
+            PROFILE_INTERVAL_MS = 1
+            PROFILE_FOLDER = os.path.join(self.tempdir, 'profiles')
+
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+        app = create_app(InstrumentedConfig)
+        app.add_url_rule('/slow', 'slow', lambda: time.sleep(0.1) or '')
+        client = app.test_client()
+        client.post('/api/case-studies', json=self._create_case_payload())
+
+        resp = client.get('/api/case-studies?limit=10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('serialize;dur=', resp.headers['Server-Timing'])
+        self.assertRegex(resp.headers['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ statements"')
+
+        client.get('/slow')
+        profiles = [p for p in os.listdir(InstrumentedConfig.PROFILE_FOLDER) if '_slow_' in p]
+        self.assertEqual(len(profiles), 1)
+        with open(os.path.join(InstrumentedConfig.PROFILE_FOLDER, profiles[0])) as f:
+            self.assertIn('full_dispatch_request (app.py:', f.read())
+
+        metrics = client.get('/metrics').get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{method="GET",endpoint="main.get_case_studies",status="200"} 1',
+                      metrics)
+        self.assertIn('db_statements_per_request_bucket{endpoint="main.create_case_study",le="+Inf"} 1', metrics)
+        self.assertIn('app_phase_duration_seconds_count{phase="serialize"}', metrics)
+
+    def test_export_cache(self):
+        tpl_id = self._upload_template(['{{PROJECT_NAME}}'])
+        cs_id = self.client.post('/api/case-studies', json=self._create_case_payload(idx=5)).get_json()['id']
+        cache_dir = os.path.join(self.tempdir, 'export_cache')
+
+        def cached():
+            return sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []
+
+        first = self.client.get(f'/api/case-studies/{cs_id}/export/pptx')
+        first_data = first.data
+        first.close()
+        self.assertEqual(int(first.headers['Content-Length']), len(first_data))
+        # Rendered in memory: nothing but the cache entry is written
+        self.assertFalse([f for f in os.listdir(self.tempdir) if f.endswith('.pptx') and f != 'batch.pptx'])
+        entries = cached()
+        self.assertEqual(len(entries), 1)
+        second = self.client.get(f'/api/case-studies/{cs_id}/export/pptx')
+        self.assertEqual(second.data, first_data)
+        second.close()
+        self.assertEqual(cached(), entries)
+
+        # Editing the case study drops its entries; the next export re-renders
+        self.client.put(f'/api/case-studies/{cs_id}', json={'project_name': 'Renamed'})
+        self.assertEqual(cached(), [])
+        resp = self.client.get(f'/api/case-studies/{cs_id}/export/pptx')
+        self.assertEqual(Presentation(io.BytesIO(resp.data)).slides[0].shapes.title.text, 'Renamed')
+        resp.close()
+        self.assertEqual(len(cached()), 1)
+
+        self.client.delete(f'/api/templates/{tpl_id}')
+        self.assertEqual(cached(), [])
+
+    def test_bulk_import(self):
+        payload = self._create_case_payload
+        lines = [json.dumps(payload(idx=i)) for i in range(1, 6)]
+        lines.insert(2, '{not json')
+        bad = payload(idx=9)
+        bad.update(project_year='soon', challenge='')
+        lines.append(json.dumps(bad))
+        body = '\n'.join(lines) + '\n'
+
+        resp = self.client.post('/api/case-studies/import?batch_size=2', data=body,
+                                content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 200)
+        report = resp.get_json()
+        self.assertEqual(report['imported'], 5)
+        self.assertEqual(report['failed'], 2)
+        self.assertEqual([e['line'] for e in report['errors']], [3, 7])
+        self.assertEqual(sorted(report['errors'][1]['errors']),
+                         ['challenge is required', 'project_year must be an integer'])
+
+        csv_body = ('project_name,client_name,industry,project_year,challenge,solution,outcomes,'
+                    'technologies,tags,confidential\n'
+                    'CSV Project,CSV Client,Retail,2023,C,S,O,"Go, Python",retail,yes\n')
+        resp = self.client.post('/api/case-studies/import', data={
+            'file': (io.BytesIO(csv_body.encode()), 'archive.csv')
+        }, content_type='multipart/form-data')
+        self.assertEqual(resp.get_json(), {'imported': 1, 'failed': 0, 'errors': [], 'errors_truncated': False})
+
+        # Search, facets and stats see the imported rows as if created one by one
+        found = self.client.get('/api/case-studies?q=CSV&technologies=go').get_json()
+        self.assertEqual([cs['project_name'] for cs in found], ['CSV Project'])
+        self.assertTrue(found[0]['confidential'])
+        facets = self.client.get('/api/facets').get_json()
+        self.assertIn({'name': 'Python', 'count': 6}, facets['technologies'])
+        self.assertIn({'name': 'Retail', 'count': 1}, facets['industries'])
+        self.assertEqual(self.client.get('/api/stats').get_json()['total'], 6)
+        runner = self.app.test_cli_runner()
+        runner.invoke(args=['rebuild-facets'])
+        self.assertEqual(self.client.get('/api/facets').get_json(), facets)
+
+        resp = self.client.post('/api/case-studies/import', data=body, content_type='text/plain')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_import_latin1_file(self):
+        csv_body = ('project_name,client_name,industry,project_year,challenge,solution,outcomes\n'
+                    'Plain,Client,Retail,2023,C,S,O\n'
+                    'Caf\u00e9 rollout,"Soci\u00e9t\u00e9\nG\u00e9n\u00e9rale",Retail,2023,C,S,O\n'
+                    'Also plain,Client,Retail,2023,C,S,O\n')
+        resp = self.client.post('/api/case-studies/import', data={
+            'file': (io.BytesIO(csv_body.encode('latin-1')), 'archive.csv')
+        }, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 400)
+        report = resp.get_json()
+        self.assertEqual(report['error'], 'The file is not UTF-8 encoded')
+        self.assertEqual((report['imported'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'], [{'line': 4, 'errors': [importer.NOT_UTF8]}])
+
+        lines = [json.dumps(self._create_case_payload(idx=1), ensure_ascii=False),
+                 json.dumps(dict(self._create_case_payload(idx=2), client_name='M\u00fcller'), ensure_ascii=False)]
+        resp = self.client.post('/api/case-studies/import', data='\n'.join(lines).encode('latin-1'),
+                                content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()['errors'], [{'line': 2, 'errors': [importer.NOT_UTF8]}])
+
+        csv_header = 'n\u00e4me,client_name\nX,Y\n'.encode('latin-1')
+        resp = self.client.post('/api/case-studies/import', data=csv_header, content_type='text/csv')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()['errors'][0]['line'], 1)
+
+    def test_import_out_of_range_integers(self):
+        payload = self._create_case_payload
+        lines = [json.dumps(dict(payload(idx=1), project_year=1e30)),
+                 json.dumps(dict(payload(idx=2), team_size=2 ** 63)),
+                 json.dumps(payload(idx=3))]
+        resp = self.client.post('/api/case-studies/import', data='\n'.join(lines),
+                                content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['imported'], 1)
+        self.assertEqual(resp.get_json()['errors'], [
+            {'line': 1, 'errors': ['project_year is out of range']},
+            {'line': 2, 'errors': ['team_size is out of range']},
+        ])
+
+        # A batch the database driver rejects fails on its own
+        with mock.patch.object(importer, 'insert_batch',
+                               side_effect=[OverflowError('Python int too large to convert to SQLite INTEGER'),
+                                            [10]]):
+            resp = self.client.post('/api/case-studies/import?batch_size=1',
+                                    data='\n'.join(json.dumps(payload(idx=i)) for i in (4, 5)),
+                                    content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 200)
+        report = resp.get_json()
+        self.assertEqual((report['imported'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 1)
+
+    def test_import_command(self):
+        path = os.path.join(self.tempdir, 'archive.jsonl')
+        with open(path, 'w') as f:
+            for i in range(1, 4):
+                f.write(json.dumps(self._create_case_payload(idx=i)) + '\n')
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['import-case-studies', path, '--batch-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 3 case studies, 0 failed', result.output)
+        self.assertEqual(len(self.client.get('/api/case-studies').get_json()), 3)
+        # ...and leaves the similarity index ready for requests
+        self.assertIn('Similarity index built: 3 case studies', result.output)
+        self.assertEqual(self.client.get('/api/case-studies/1/similar').status_code, 200)
+
+    def test_streaming_export(self):
+        for idx in range(1, 6):
+            payload = self._create_case_payload(idx=idx)
+            payload.update(industry='Retail' if idx % 2 else 'Healthcare', confidential=idx == 5)
+            self.client.post('/api/case-studies', json=payload)
+        self.app.config['EXPORT_CHUNK_SIZE'] = 2
+
+        resp = self.client.get('/api/case-studies/export?industry=retail&sort_by=project_name&sort_order=asc',
+                               buffered=False)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        chunks = [chunk for chunk in resp.response if chunk]
+        resp.close()
+        # Two chunks of rows fetched and serialized one after the other
+        self.assertEqual(len(chunks), 2)
+        items = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([item['project_name'] for item in items], ['Project 1', 'Project 3', 'Project 5'])
+        self.assertEqual(items[0], self.client.get(f"/api/case-studies/{items[0]['id']}").get_json())
+
+        resp = self.client.get('/api/case-studies/export?format=csv&confidential=false&fields=id,project_name,industry')
+        self.assertEqual(resp.mimetype, 'text/csv')
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], 'id,project_name,industry')
+        self.assertEqual(len(lines), 5)
+
+        self.assertEqual(self.client.get('/api/case-studies/export?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/case-studies/export?fields=nope').status_code, 400)
+
+    def test_live_search_streams_top_hits_first(self):
+        for idx in range(1, 8):
+            payload = self._create_case_payload(idx=idx)
+            payload['challenge'] = 'Legacy systems ' * 40
+            self.client.post('/api/case-studies', json=payload)
+        self.client.post('/api/case-studies', json=dict(self._create_case_payload(idx=8), project_name='Other'))
+        self.app.config.update(LIVE_SEARCH_CHUNK_SIZE=2, LIVE_SEARCH_MAX_RESULTS=6)
+
+        resp = self.client.get('/api/case-studies/live?q=proj&top=3&sort_by=project_name&sort_order=asc',
+                               buffered=False)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        lines = [json.loads(chunk) for chunk in resp.response if chunk]
+        resp.close()
+        head, rest, done = lines[0], lines[1:-1], lines[-1]
+        self.assertEqual(head['fields'][:3], ['id', 'project_name', 'client_name'])
+        names = [row[1] for row in head['rows']]
+        self.assertEqual(names, ['Project 1', 'Project 2', 'Project 3'])
+        # The remaining matches follow in chunks, cut off at the maximum
+        self.assertEqual([len(line['rows']) for line in rest], [2, 1])
+        self.assertEqual([row[1] for line in rest for row in line['rows']],
+                         ['Project 4', 'Project 5', 'Project 6'])
+        self.assertEqual(done, {'done': True, 'count': 6, 'truncated': True})
+        challenge = head['rows'][0][head['fields'].index('challenge')]
+        self.assertEqual(len(challenge), 160)
+
+        # Everything fits on the first line; served again from the cache
+        for _ in range(2):
+            lines = self.client.get('/api/case-studies/live?q=other').get_data(as_text=True).splitlines()
+            self.assertEqual([row[1] for row in json.loads(lines[0])['rows']], ['Other'])
+            self.assertEqual(json.loads(lines[1]), {'done': True, 'count': 1, 'truncated': False})
+
+        self.assertEqual(self.client.get('/api/case-studies/live?tags_match=some').status_code, 400)
+
+    def test_similar_case_studies(self):
+        texts = [
+            ('Kubernetes platform', 'Monolith on ageing servers', 'Containerised services on Kubernetes', 'Kubernetes,Docker'),
+            ('Cluster move', 'Ageing servers and manual deployments', 'Kubernetes cluster with Docker images', 'Kubernetes'),
+            ('Store dashboards', 'No view of retail sales', 'Sales dashboards in Power BI', 'Power BI'),
+        ]
+        ids = []
+        for idx, (name, challenge, solution, technologies) in enumerate(texts, start=1):
+            payload = self._create_case_payload(idx=idx)
+            payload.update(project_name=name, challenge=challenge, solution=solution,
+                           technologies=technologies, tags=None, outcomes='Delivered')
+            ids.append(self.client.post('/api/case-studies', json=payload).get_json()['id'])
+
+        # Without the safety margin, everything written so far is in the matrix
+        margin = mock.patch('app.similarity._BUILD_MARGIN', timedelta(0))
+        margin.start()
+        self.addCleanup(margin.stop)
+        # Requests don't build the index themselves, they start a build
+        url = f'/api/case-studies/{ids[0]}/similar?fields=project_name'
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Retry-After', resp.headers)
+        for thread in threading.enumerate():
+            if thread.name == 'similarity-rebuild':
+                thread.join(60)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        similar = resp.get_json()
+        self.assertEqual(similar[0]['id'], ids[1])
+        self.assertEqual(set(similar[0]), {'id', 'project_name', 'score'})
+        self.assertGreater(similar[0]['score'], similar[-1]['score'])
+        index = self.app.extensions['similarity'].current()
+        self.assertIsInstance(index.col_weights, np.memmap)
+        with self.app.app_context():
+            self.assertEqual(self.app.extensions['similarity'].changed(index), {})
+
+        # Writes since the build are picked up without rebuilding
+        payload = dict(self._create_case_payload(idx=4), challenge='Ageing servers on a monolith',
+                       solution='Kubernetes with Docker', technologies='Kubernetes,Docker', tags=None)
+        new_id = self.client.post('/api/case-studies', json=payload).get_json()['id']
+        self.client.delete(f'/api/case-studies/{ids[1]}')
+        self.client.put(f'/api/case-studies/{ids[2]}', json={'challenge': 'Kubernetes servers'})
+        similar = [item['id'] for item in self.client.get(f'/api/case-studies/{ids[0]}/similar').get_json()]
+        self.assertEqual(similar[0], new_id)
+        self.assertNotIn(ids[1], similar)
+        self.assertIn(ids[2], similar)
+        self.assertEqual(self.app.extensions['similarity'].current().version, index.version)
+
+        # A rebuild gives the same neighbours
+        result = self.app.test_cli_runner().invoke(args=['build-similarity-index'])
+        self.assertIn('Indexed 3 case studies', result.output)
+        rebuilt = [item['id'] for item in self.client.get(f'/api/case-studies/{ids[0]}/similar').get_json()]
+        self.assertEqual(rebuilt, similar)
+
+        self.assertEqual(self.client.get('/api/case-studies/9999/similar').status_code, 404)
+
+    def test_export_command_round_trips_through_import(self):
+        for idx in range(1, 4):
+            self.client.post('/api/case-studies', json=self._create_case_payload(idx=idx))
+        path = os.path.join(self.tempdir, 'library.csv')
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['export-case-studies', path, '--format', 'csv', '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        result = runner.invoke(args=['import-case-studies', path])
+        self.assertIn('Imported 3 case studies, 0 failed', result.output)
+        by_name = {}
+        for item in self.client.get('/api/case-studies').get_json():
+            by_name.setdefault(item['project_name'], []).append(item)
+        self.assertEqual(len(by_name), 3)
+        for original, copy in by_name.values():
+            self.assertNotEqual(original['id'], copy['id'])
+            for field in ('client_name', 'technologies', 'confidential', 'created_at', 'team_size'):
+                self.assertEqual(original[field], copy[field])
+
+    def test_attachments_are_stored_once_and_downloadable(self):
+        from app.models import StoredFile
+        first = self.client.post('/api/case-studies', json=self._create_case_payload(idx=1)).get_json()['id']
+        second = self.client.post('/api/case-studies', json=self._create_case_payload(idx=2)).get_json()['id']
+        content = b'%PDF-1.4 ' + bytes(range(256)) * 400
+        etag = self.client.get(f'/api/case-studies/{first}').headers['ETag']
+
+        resp = self.client.post(f'/api/case-studies/{first}/attachments', data={
+            'file': (io.BytesIO(content), 'Report.pdf')
+        }, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 201)
+        attachment = resp.get_json()
+        self.assertEqual((attachment['filename'], attachment['file_type']), ('Report.pdf', 'pdf'))
+        # Raw body upload of the same content
+        resp = self.client.post(f'/api/case-studies/{second}/attachments?filename=copy.pdf', data=content,
+                                content_type='application/octet-stream')
+        self.assertEqual(resp.status_code, 201)
+        copy = resp.get_json()
+
+        with self.app.app_context():
+            stored = StoredFile.query.all()
+            self.assertEqual([(f.size, f.ref_count) for f in stored], [(len(content), 2)])
+            path = os.path.join(TestConfig.ATTACHMENTS_FOLDER, stored[0].sha256[:2], stored[0].sha256)
+        self.assertTrue(os.path.exists(path))
+        detail = self.client.get(f'/api/case-studies/{first}')
+        self.assertNotEqual(detail.headers['ETag'], etag)
+        self.assertEqual(detail.get_json()['attachments'], [attachment])
+
+        resp = self.client.get(f"/api/attachments/{attachment['id']}")
+        self.assertEqual(resp.data, content)
+        self.assertEqual(resp.mimetype, 'application/pdf')
+        self.assertIn('Report.pdf', resp.headers['Content-Disposition'])
+        resp.close()
+        resp = self.client.get(f"/api/attachments/{attachment['id']}", headers={'Range': 'bytes=10-19'})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.data, content[10:20])
+        resp.close()
+        resp = self.client.get(f"/api/attachments/{attachment['id']}", headers={'If-None-Match': f'"{stored[0].sha256}"'})
+        self.assertEqual(resp.status_code, 304)
+
+        self.app.config['ATTACHMENT_ACCEL_REDIRECT_PREFIX'] = '/protected-attachments/'
+        resp = self.client.get(f"/api/attachments/{copy['id']}")
+        self.assertEqual(resp.headers['X-Accel-Redirect'],
+                         f'/protected-attachments/{stored[0].sha256[:2]}/{stored[0].sha256}')
+        self.assertEqual(resp.data, b'')
+        self.app.config['ATTACHMENT_ACCEL_REDIRECT_PREFIX'] = None
+
+        # The file stays until its last attachment is gone
+        self.assertEqual(self.client.delete(f"/api/attachments/{attachment['id']}").status_code, 204)
+        self.assertTrue(os.path.exists(path))
+        self.client.delete(f'/api/case-studies/{second}')
+        self.assertFalse(os.path.exists(path))
+        with self.app.app_context():
+            self.assertEqual(StoredFile.query.count(), 0)
+
+    def test_failed_attachment_commit_leaves_no_file(self):
+        from app.models import StoredFile
+        cs_id = self.client.post('/api/case-studies', json=self._create_case_payload()).get_json()['id']
+
+        def upload(content):
+            return self.client.post(f'/api/case-studies/{cs_id}/attachments?filename=brief.pdf', data=content,
+                                    content_type='application/octet-stream')
+
+        def stored_files():
+            return sorted(name for _, _, names in os.walk(TestConfig.ATTACHMENTS_FOLDER) for name in names)
+
+        self.assertEqual(upload(b'kept').status_code, 201)
+        kept = stored_files()
+        for content in (b'new content', b'kept'):
+            with mock.patch.object(db.session, 'commit', side_effect=RuntimeError('commit failed')):
+                with self.assertRaises(RuntimeError):
+                    upload(content)
+            # Content that was stored already stays, new content is removed
+            self.assertEqual(stored_files(), kept)
+        with self.app.app_context():
+            self.assertEqual([f.ref_count for f in StoredFile.query.all()], [1])
+
+    def test_attachment_upload_validation(self):
+        cs_id = self.client.post('/api/case-studies', json=self._create_case_payload()).get_json()['id']
+        url = f'/api/case-studies/{cs_id}/attachments'
+        self.assertEqual(self.client.post(url, data=b'x', content_type='application/octet-stream').status_code, 400)
+        self.assertEqual(self.client.post(f'{url}?filename=run.exe', data=b'x').status_code, 400)
+        self.assertEqual(self.client.post(f'{url}?filename=empty.pdf', data=b'').status_code, 400)
+        self.app.config['ATTACHMENT_MAX_BYTES'] = 10
+        self.assertEqual(self.client.post(f'{url}?filename=big.pdf', data=b'x' * 11).status_code, 413)
+        self.assertEqual(os.listdir(os.path.join(TestConfig.ATTACHMENTS_FOLDER, 'tmp')), [])
+        self.assertEqual(self.client.post('/api/case-studies/999/attachments?filename=a.pdf', data=b'x').status_code, 404)
+
+    def test_template_upload_is_inspected(self):
+        ppt_path = os.path.join(self.tempdir, 'inventory.pptx')
+        prs = Presentation()
+        prs.slides.add_slide(prs.slide_layouts[5]).shapes.title.text = '{{PROJECT_NAME}} for {{CUSTOMER}}'
+        prs.slides.add_slide(prs.slide_layouts[6])
+        prs.save(ppt_path)
+
+        with open(ppt_path, 'rb') as f:
+            resp = self.client.post('/api/templates', data={'name': 'Inventory', 'file': (f, 'inventory.pptx')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 201)
+        template = resp.get_json()
+        self.assertEqual(template['inventory']['slide_count'], 2)
+        self.assertEqual(template['inventory']['placeholders'], {'{{PROJECT_NAME}}': 1})
+        self.assertEqual(template['inventory']['warnings'], ['Unknown placeholders, left as they are: {{CUSTOMER}}'])
+        inventory = self.client.get(f"/api/templates/{template['id']}/inventory").get_json()
+        self.assertEqual(inventory['slides'][1], {'number': 2, 'part': 'ppt/slides/slide2.xml', 'shapes': []})
+
+        # Rejected uploads leave nothing behind
+        files_before = sorted(os.listdir(TestConfig.TEMPLATE_FOLDER))
+        resp = self.client.post('/api/templates', data={'file': (io.BytesIO(b'not a zip'), 'fake.pptx')},
+                                content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()['problems'], ['Not a valid PowerPoint (.pptx) file'])
+        self.app.config['TEMPLATE_MAX_SLIDES'] = 1
+        with open(ppt_path, 'rb') as f:
+            resp = self.client.post('/api/templates', data={'file': (f, 'inventory.pptx')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(sorted(os.listdir(TestConfig.TEMPLATE_FOLDER)), files_before)
+        # Nor do uploads whose inspection fails unexpectedly
+        with mock.patch('app.routes._inspect_template', side_effect=RuntimeError('pool broke')):
+            with self.assertRaises(RuntimeError):
+                with open(ppt_path, 'rb') as f:
+                    self.client.post('/api/templates', data={'file': (f, 'inventory.pptx')},
+                                     content_type='multipart/form-data')
+        self.assertEqual(sorted(os.listdir(TestConfig.TEMPLATE_FOLDER)), files_before)
+        self.assertEqual(len(self.client.get('/api/templates').get_json()), 1)
+
+        self.client.delete(f"/api/templates/{template['id']}")
+        with self.app.app_context():
+            self.assertEqual(TemplateInventory.query.count(), 0)
+
+    def test_startup_leaves_schema_and_heavy_imports_alone(self):
+        # Importing and creating the app loads neither numpy nor the exporter
+        script = '\n'.join([
+            'import sys',
+            'from app import create_app',
+            'class Config:',
+            '    SQLALCHEMY_DATABASE_URI = "sqlite://"',
+            '    init_app = staticmethod(lambda app: None)',
+            'create_app(Config)',
+            'print(sorted({"numpy", "lxml", "pptx", "app.ppt_export", "app.similarity"} & set(sys.modules)))',
+        ])
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True,
+                                text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+        # A file database is only created and upgraded by flask init-db
+        class FileConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(self.tempdir, 'app.db')}"
+
+        app = create_app(FileConfig)
+        with app.app_context():
+            self.assertEqual(db.inspect(db.engine).get_table_names(), [])
+        # ...unless configured to, or when running in debug mode
+        from app import schema
+        app.debug = True
+        self.assertTrue(schema.migrates_on_boot(app))
+        app.config['DATABASE_AUTO_MIGRATE'] = False
+        self.assertFalse(schema.migrates_on_boot(app))
+        app.debug = False
+
+        # Under the default config, in-memory databases are still migrated
+        from config import Config, _env_flag
+
+        class MemoryConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+            SQLALCHEMY_ENGINE_OPTIONS = {}
+            init_app = staticmethod(lambda app: None)
+
+        with mock.patch.dict(os.environ, {'DATABASE_AUTO_MIGRATE': 'no'}):
+            self.assertIs(_env_flag('DATABASE_AUTO_MIGRATE'), False)
+            del os.environ['DATABASE_AUTO_MIGRATE']
+            self.assertIsNone(_env_flag('DATABASE_AUTO_MIGRATE'))
+        memory_app = create_app(MemoryConfig)
+        with memory_app.app_context():
+            self.assertIn('case_studies', db.inspect(db.engine).get_table_names())
+
+        result = app.test_cli_runner().invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Database up to date', result.output)
+        self.assertEqual(app.test_cli_runner().invoke(args=['init-db']).exit_code, 0)
+
+        # A new process finds the full-text index init-db created
+        app = create_app(FileConfig)
+        client = app.test_client()
+        self.assertEqual(client.post('/api/case-studies', json=self._create_case_payload()).status_code, 201)
+        with app.app_context():
+            self.assertNotIn('fts5', app.extensions)
+            self.assertEqual(len(client.get('/api/case-studies?q=legac').get_json()), 1)
+            self.assertTrue(app.extensions['fts5'])
+            db.engine.dispose()
+        app.extensions['database_reader'].dispose()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from app import create_app, db
+from app.models import CaseStudy
+
+
+class FileDatabaseConfig:
+    TESTING = True
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = 'test-secret'
+    SEARCH_CACHE_ENABLED = False
+
+    @staticmethod
+    def init_app(app):
+        pass
+
+
+class ConcurrentWritesTestCase(unittest.TestCase):
+    """Several threads reading and writing one SQLite file at once"""
+
+    THREADS = 8
+    ROUNDS = 15
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        FileDatabaseConfig.UPLOAD_FOLDER = self.tempdir
+        FileDatabaseConfig.TEMPLATE_FOLDER = os.path.join(self.tempdir, 'templates')
+        FileDatabaseConfig.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(self.tempdir, 'test.db')}"
+        FileDatabaseConfig.SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': self.THREADS, 'max_overflow': 0}
+        self.app = create_app(FileDatabaseConfig)
+        # File databases are migrated by the deploy, not by create_app
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.app.extensions['database_reader'].dispose()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def _payload(self, worker, round_):
+        return {
+            'project_name': f'Project {worker}-{round_}',
+            'client_name': f'Client {worker}',
+            'industry': ('Healthcare', 'Retail', 'Finance')[round_ % 3],
+            'project_year': 2020 + round_ % 5,
+            'challenge': 'Legacy systems',
+            'solution': 'Cloud migration',
+            'outcomes': 'Reduced costs',
+            'technologies': f'Python, Go{worker}',
+            'tags': 'cloud',
+        }
+
+    def test_journal_mode_is_wal(self):
+        with self.app.app_context():
+            mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        self.assertEqual(mode.lower(), 'wal')
+
+    def test_sessions_read_from_reader_until_they_write(self):
+        reader = self.app.extensions['database_reader']
+        with self.app.app_context():
+            self.assertIs(db.session.get_bind(clause=db.select(CaseStudy)), reader)
+            db.session.add(CaseStudy(project_name='P', client_name='C', industry='Retail',
+                                     challenge='C', solution='S', outcomes='O'))
+            db.session.flush()
+            # The session now reads its own uncommitted writes
+            self.assertIsNot(db.session.get_bind(clause=db.select(CaseStudy)), reader)
+            self.assertEqual(db.session.query(CaseStudy).count(), 1)
+            db.session.commit()
+            self.assertIs(db.session.get_bind(clause=db.select(CaseStudy)), reader)
+
+    def test_mixed_traffic_without_lock_errors(self):
+        failures = []
+
+        def work(worker):
+            client = self.app.test_client()
+            for round_ in range(self.ROUNDS):
+                resp = client.post('/api/case-studies', json=self._payload(worker, round_))
+                if resp.status_code != 201:
+                    failures.append(('create', resp.status_code, resp.get_data(as_text=True)))
+                    continue
+                cs_id = resp.get_json()['id']
+                responses = [
+                    ('update', client.put(f'/api/case-studies/{cs_id}', json={'tags': f'cloud, r{round_}'})),
+                    ('list', client.get('/api/case-studies?industry=Retail&technologies=Python')),
+                    ('facets', client.get('/api/facets')),
+                    ('stats', client.get('/api/stats')),
+                ]
+                if round_ % 5 == 4:
+                    responses.append(('delete', client.delete(f'/api/case-studies/{cs_id}')))
+                for name, resp in responses:
+                    if not 200 <= resp.status_code < 300:
+                        failures.append((name, resp.status_code, resp.get_data(as_text=True)))
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        expected = self.THREADS * (self.ROUNDS - self.ROUNDS // 5)
+        stats = self.app.test_client().get('/api/stats').get_json()
+        self.assertEqual(stats['total'], expected)
+        with self.app.app_context():
+            self.assertEqual(db.session.query(CaseStudy).count(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
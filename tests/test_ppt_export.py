@@ -0,0 +1,182 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from pptx import Presentation
+from pptx.util import Inches
+
+from app.ppt_export import CompiledTemplate, PPTExporter, inspect_template
+
+
+def make_case_study(**overrides):
+    values = {field: None for field in PPTExporter.PLACEHOLDERS.values()}
+    values.update(project_name='Data Platform', client_name='Contoso', team_size=5)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class PPTExporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.template_path = os.path.join(self.tempdir, 'template.pptx')
+        PPTExporter.template_cache.discard(os.path.abspath(self.template_path))
+
+        prs = Presentation()
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = 'Project: {{PROJECT_NAME}}'
+        table = slide.shapes.add_table(2, 2, Inches(1), Inches(2), Inches(4), Inches(1)).table
+        table.cell(0, 0).text = 'Client'
+        table.cell(0, 1).text = '{{CLIENT}}'
+        table.cell(1, 1).text = '{{TEAM_SIZE}} / {{INDUSTRY}}'
+        # A slide without placeholders is copied untouched
+        prs.slides.add_slide(prs.slide_layouts[6])
+        prs.save(self.template_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def _export(self, exporter, case_study):
+        output_path = os.path.join(self.tempdir, 'out.pptx')
+        exporter.export_case_study(case_study, output_path)
+        return Presentation(output_path)
+
+    def test_export_replaces_placeholders(self):
+        prs = self._export(PPTExporter(self.template_path), make_case_study())
+
+        slide = prs.slides[0]
+        self.assertEqual(slide.shapes.title.text, 'Project: Data Platform')
+        table = [s for s in slide.shapes if s.has_table][0].table
+        self.assertEqual(table.cell(0, 1).text, 'Contoso')
+        self.assertEqual(table.cell(1, 1).text, '5 people / N/A')
+        self.assertEqual(len(prs.slides), 2)
+
+    def test_export_escapes_control_characters(self):
+        # Text pasted from Word often holds vertical tabs, which XML can't
+        prs = self._export(PPTExporter(self.template_path), make_case_study(project_name='Data\x0bPlatform\x01'))
+        self.assertEqual(prs.slides[0].shapes.title.text, 'Project: Data_x000B_Platform_x0001_')
+
+    def test_concurrent_exports_of_one_template(self):
+        exporter = PPTExporter(self.template_path)
+        exporter.compile()
+        errors = []
+
+        def export(worker):
+            for n in range(40):
+                # Names of different lengths give every deck its own sizes and CRCs
+                name = 'Project ' + 'x' * (worker * 20 + n)
+                output = io.BytesIO()
+                try:
+                    exporter.export_case_study(make_case_study(project_name=name), output)
+                    title = Presentation(io.BytesIO(output.getvalue())).slides[0].shapes.title.text
+                    self.assertEqual(title, f'Project: {name}')
+                except Exception as e:
+                    errors.append(e)
+
+        # Switch threads often so that renders interleave
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=export, args=(worker,)) for worker in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+    def test_compiled_template_is_cached_and_persisted(self):
+        exporter = PPTExporter(self.template_path, persist_compiled=True)
+        compiled = exporter.compile()
+        self.assertIs(exporter.compile(), compiled)
+        self.assertEqual(sorted(compiled.locations), ['ppt/slides/slide1.xml'])
+
+        sidecar = PPTExporter.compiled_path(self.template_path)
+        self.assertTrue(os.path.exists(sidecar))
+
+        # A fresh process would rebuild from the persisted locations
+        PPTExporter.template_cache.discard(os.path.abspath(self.template_path))
+        recompiled = exporter.compile()
+        self.assertIsNot(recompiled, compiled)
+        self.assertEqual(recompiled.locations, compiled.locations)
+
+        # Replacing the template file invalidates both cache levels
+        prs = Presentation(self.template_path)
+        prs.slides[0].shapes.title.text = '{{CLIENT}} case study'
+        prs.save(self.template_path)
+        os.utime(self.template_path, ns=(0, 1))
+        prs = self._export(exporter, make_case_study())
+        self.assertEqual(prs.slides[0].shapes.title.text, 'Contoso case study')
+
+        PPTExporter.discard_compiled(self.template_path)
+        self.assertFalse(os.path.exists(sidecar))
+
+    def test_placeholder_split_across_runs(self):
+        prs = Presentation(self.template_path)
+        paragraph = prs.slides[1].shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame.paragraphs[0]
+        for text in ('Built for {{CLI', 'ENT}} in {', '{YEAR}}', ' by {{CREATED_BY}}'):
+            paragraph.add_run().text = text
+        paragraph.runs[0].font.bold = True
+        prs.save(self.template_path)
+
+        prs = self._export(PPTExporter(self.template_path), make_case_study(project_year=2024))
+
+        paragraph = prs.slides[1].shapes[0].text_frame.paragraphs[0]
+        self.assertEqual(paragraph.text, 'Built for Contoso in 2024 by N/A')
+        self.assertEqual(paragraph.runs[0].text, 'Built for Contoso')
+        self.assertTrue(paragraph.runs[0].font.bold)
+
+    def test_inspect_template(self):
+        prs = Presentation(self.template_path)
+        paragraph = prs.slides[1].shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame.paragraphs[0]
+        for text in ('{{CLI', 'ENT}} {{CUSTOMER}} {{YEAR}'):
+            paragraph.add_run().text = text
+        prs.save(self.template_path)
+
+        inventory = inspect_template(self.template_path)
+        self.assertEqual(inventory['errors'], [])
+        self.assertEqual(inventory['slide_count'], 2)
+        self.assertEqual(inventory['size'], os.path.getsize(self.template_path))
+        self.assertEqual(inventory['placeholders'],
+                         {'{{CLIENT}}': 2, '{{INDUSTRY}}': 1, '{{PROJECT_NAME}}': 1, '{{TEAM_SIZE}}': 1})
+        shapes = inventory['slides'][0]['shapes']
+        self.assertEqual([shape['placeholders'] for shape in shapes],
+                         [['{{PROJECT_NAME}}'], ['{{CLIENT}}', '{{INDUSTRY}}', '{{TEAM_SIZE}}']])
+        self.assertEqual(inventory['slides'][1]['shapes'][0]['placeholders'], ['{{CLIENT}}'])
+        warnings = ' | '.join(inventory['warnings'])
+        self.assertIn('{{CUSTOMER}}', warnings)
+        self.assertIn('unbalanced braces', warnings)
+        self.assertIn('1 placeholder(s) span several', warnings)
+
+        self.assertIn('2 slides', inspect_template(self.template_path, max_slides=1)['errors'][0])
+        self.assertTrue(inspect_template(self.template_path, max_bytes=100)['errors'])
+        broken = os.path.join(self.tempdir, 'broken.pptx')
+        with open(broken, 'wb') as f:
+            f.write(b'not a zip')
+        self.assertEqual(inspect_template(broken)['errors'], ['Not a valid PowerPoint (.pptx) file'])
+
+    def test_known_locations_skip_the_slide_scan(self):
+        known = inspect_template(self.template_path)['compiled']
+        exporter = PPTExporter(self.template_path, known_locations=known)
+        with mock.patch.object(CompiledTemplate, '_scan_slide', side_effect=AssertionError('scanned')):
+            compiled = exporter.compile()
+        self.assertEqual(sorted(compiled.locations), ['ppt/slides/slide1.xml'])
+        prs = self._export(exporter, make_case_study())
+        self.assertEqual(prs.slides[0].shapes.title.text, 'Project: Data Platform')
+
+        # Locations recorded for other content are ignored
+        PPTExporter.template_cache.discard(os.path.abspath(self.template_path))
+        stale = dict(known, sha256='0' * 64)
+        with mock.patch.object(CompiledTemplate, '_scan_slide', wraps=CompiledTemplate._scan_slide) as scan:
+            PPTExporter(self.template_path, known_locations=stale).compile()
+        self.assertTrue(scan.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
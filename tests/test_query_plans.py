@@ -0,0 +1,138 @@
+import re
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import CaseStudy
+from app.search import SearchService, _after
+
+
+class PlanTestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = 'test-secret'
+
+    @staticmethod
+    def init_app(app):
+        pass
+
+
+# A table read without an index, e.g. "SCAN case_studies"
+_FULL_SCAN = re.compile(r'\bSCAN (\w+)$')
+# Sorting the result set instead of reading it in index order
+_SORT = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """
+    Every query shape SearchService and the stats endpoint produce must be
+    answered from an index: no table scans, and no sorting of results except
+    by relevance (bm25 ranks are computed per query) and after technology or
+    tag filters (only the linked rows are fetched, by primary key).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.mkdtemp()
+        PlanTestConfig.UPLOAD_FOLDER = cls.tempdir
+        cls.app = create_app(PlanTestConfig)
+        industries = ['Healthcare', 'Retail', 'Finance', 'Energy']
+        technologies = ['Python', 'Azure', 'Java', 'JavaScript', 'Go']
+        start = datetime(2024, 1, 1)
+        with cls.app.app_context():
+            db.session.add_all(CaseStudy(
+                project_name=f'Project {i}',
+                client_name=f'Client {i % 37}',
+                industry=industries[i % len(industries)],
+                project_year=2015 + i % 10,
+                challenge='Legacy reporting across regions',
+                solution='Data platform migration',
+                outcomes='Faster reporting',
+                technologies=', '.join(technologies[i % 5:i % 5 + 2]),
+                tags='cloud, data' if i % 2 else 'migration',
+                confidential=i % 7 == 0,
+                created_at=start + timedelta(hours=i),
+                updated_at=start + timedelta(hours=i * 3 % 500)
+            ) for i in range(500))
+            db.session.commit()
+            db.session.execute(db.text('ANALYZE'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir, ignore_errors=True)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def _plan(self, query):
+        compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params)
+        return [row[-1] for row in rows]
+
+    def assertIndexed(self, query, allow_sort=False):
+        plan = self._plan(query)
+        details = '\n'.join(plan)
+        for line in plan:
+            self.assertIsNone(_FULL_SCAN.search(line), f'Full table scan:\n{details}')
+            if not allow_sort:
+                self.assertIsNone(_SORT.search(line), f'Result sort without an index:\n{details}')
+
+    def test_sort_orders(self):
+        for sort_by in SearchService.SORT_FIELDS:
+            for sort_order in ('asc', 'desc'):
+                with self.subTest(sort_by=sort_by, sort_order=sort_order):
+                    query, _ = SearchService.build_query(sort_by=sort_by, sort_order=sort_order)
+                    self.assertIndexed(query.limit(51))
+
+    def test_filters(self):
+        shapes = {
+            'industry': dict(industry='retail'),
+            'year': dict(year='2020'),
+            'confidential': dict(confidential=True),
+            'technology': dict(technologies='Python'),
+            'all technologies': dict(technologies='Python, Azure'),
+            'any technology': dict(technologies='Python, Go', technologies_match='any'),
+            'tags': dict(tags='cloud'),
+            'industry and year': dict(industry='Retail', year='2020'),
+            'year sorted by year': dict(year='2020', sort_by='project_year'),
+        }
+        for name, criteria in shapes.items():
+            with self.subTest(name):
+                query, _ = SearchService.build_query(**criteria)
+                linked = 'technologies' in criteria or 'tags' in criteria
+                self.assertIndexed(query.limit(51), allow_sort=linked)
+
+    def test_keyset_page(self):
+        for sort_by in ('updated_at', 'project_name'):
+            with self.subTest(sort_by=sort_by):
+                query, (_, sort_column, descending) = SearchService.build_query(sort_by=sort_by)
+                first = query.with_entities(sort_column, CaseStudy.id).first()
+                query = query.filter(_after(sort_column, descending, first[0], first[1]))
+                self.assertIndexed(query.limit(51))
+
+    def test_counts(self):
+        for criteria in ({}, dict(industry='Retail'), dict(technologies='Java')):
+            with self.subTest(**criteria):
+                query, _ = SearchService.build_query(**criteria)
+                self.assertIndexed(query.order_by(None).with_entities(db.func.count()))
+
+    def test_full_text_search(self):
+        query, (sort_by, _, _) = SearchService.build_query(query='reporting', sort_by='relevance')
+        self.assertEqual(sort_by, 'relevance')
+        self.assertIndexed(query.limit(51), allow_sort=True)
+
+    def test_recent_case_studies(self):
+        self.assertIndexed(CaseStudy.query.order_by(CaseStudy.created_at.desc()).limit(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import shutil
+import tempfile
+import time
+import unittest
+
+from app.response_cache import MemoryBackend, SQLiteBackend
+
+
+class BackendTests:
+    def make_backend(self, maxsize, ttl, max_bytes=None):
+        raise NotImplementedError
+
+    def test_get_put(self):
+        backend = self.make_backend(10, 60)
+        self.assertIsNone(backend.get('a'))
+        backend.put('a', b'{"x": 1}')
+        self.assertEqual(backend.get('a'), b'{"x": 1}')
+
+    def test_least_recently_used_is_evicted(self):
+        backend = self.make_backend(2, 60)
+        backend.put('a', b'1')
+        backend.put('b', b'2')
+        backend.get('a')
+        backend.put('c', b'3')
+        self.assertEqual(backend.get('a'), b'1')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), b'3')
+
+    def test_bounded_by_bytes(self):
+        backend = self.make_backend(10, 60, max_bytes=10)
+        backend.put('a', b'1234')
+        backend.put('b', b'1234')
+        backend.get('a')
+        backend.put('c', b'1234')
+        self.assertEqual(backend.get('a'), b'1234')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), b'1234')
+        # Too large to cache at all, and evicts nothing
+        backend.put('d', b'x' * 11)
+        self.assertIsNone(backend.get('d'))
+        self.assertEqual(backend.get('a'), b'1234')
+
+    def test_entries_expire(self):
+        backend = self.make_backend(10, 0.05)
+        backend.put('a', b'1')
+        time.sleep(0.1)
+        self.assertIsNone(backend.get('a'))
+
+
+class MemoryBackendTestCase(BackendTests, unittest.TestCase):
+    def make_backend(self, maxsize, ttl, max_bytes=None):
+        return MemoryBackend(maxsize, ttl, max_bytes)
+
+
+class SQLiteBackendTestCase(BackendTests, unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def make_backend(self, maxsize, ttl, max_bytes=None):
+        return SQLiteBackend(os.path.join(self.tempdir, 'cache.sqlite'), maxsize, ttl, max_bytes=max_bytes)
+
+    def test_shared_between_instances(self):
+        # Separate instances stand in for separate worker processes
+        writer = self.make_backend(10, 60)
+        reader = self.make_backend(10, 60)
+        writer.put('a', b'1')
+        self.assertEqual(reader.get('a'), b'1')
+
+    def test_locked_cache_is_a_miss(self):
+        backend = SQLiteBackend(os.path.join(self.tempdir, 'cache.sqlite'), 10, 60, timeout=0.05)
+        backend.put('a', b'1')
+        locker = sqlite3.connect(os.path.join(self.tempdir, 'cache.sqlite'), isolation_level=None)
+        locker.execute('BEGIN EXCLUSIVE')
+        try:
+            with self.assertLogs('app.response_cache', 'WARNING'):
+                backend.put('b', b'2')
+            with self.assertLogs('app.response_cache', 'WARNING'):
+                self.assertIsNone(backend.get('a'))
+        finally:
+            locker.rollback()
+            locker.close()
+        self.assertEqual(backend.get('a'), b'1')
+        self.assertIsNone(backend.get('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()